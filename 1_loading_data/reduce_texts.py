@@ -0,0 +1,157 @@
+# -----------------------------------------------------------------------------
+## Summary: Deterministic clean-up pass between filtered_texts.csv and the
+## extraction prompts. OCR'd complaints carry a lot of text that every model is
+## billed for but that holds nothing to extract: ECF page stamps ("Case 1:20-cv-
+## 00004 Document 1 Filed 07/01/20 Page 1 of 11"), bare page and pleading-paper
+## line numbers, the ")" column of the caption and "///" filler lines, and
+## lines repeated on at least half of the pages (running headers, "COMPLAINT"
+## footers). These are removed with vectorized pandas string operations over
+## each chunk of the corpus, keeping the first occurrence of a repeated line.
+## Lines repeated less often than that (cause-of-action headings, "By plaintiff
+## ..." attributions) are left alone. The output keeps file_id and text_content,
+## so text_loader reads it like the original, plus each document's size before
+## and after and its reduction ratio. It is only rebuilt when the input file or
+## the rules change, and its document count is kept with the build state.
+# -----------------------------------------------------------------------------
+
+# Importing Libraries
+import os
+import json
+import hashlib
+import pandas as pd
+from typing import Optional
+from text_loader import iter_chunks
+
+INPUT_CSV = "data/overview_data/filtered_texts.csv"
+OUTPUT_CSV = "data/overview_data/reduced_texts.csv"
+
+# Bump when the rules below change, so cached outputs are rebuilt
+RULES_VERSION = 1
+
+# A line is page furniture when it repeats on at least this share of a
+# document's pages (counted from its ECF stamps), and at least REPEAT_MIN times
+REPEAT_PAGE_SHARE = 0.5
+REPEAT_MIN = 3
+
+# ECF header/footer stamped on every page
+PAGE_STAMP = r"^Case\s+\d+:\d{2}-[a-z]{2}-\d+.*\bDocument\s+\d+.*\bPage\s+\d+\s+of\s+\d+"
+
+# Bare page numbers and pleading-paper line numbers, and the caption's ")" column
+NUMBER_ONLY = r"^\d{1,3}$"
+CAPTION_BRACKET = r"^\)+$"
+
+# Pleading filler such as "///", often OCR'd as "/I/"
+FILLER = r"^[/\\|Il ]*/[/\\|Il ]*$"
+
+# ------------------------------- REDUCING -------------------------------------
+
+# Reducing a Series of texts, keeping its index
+def reduce_series(texts: pd.Series) -> pd.Series:
+    index = texts.index
+    texts = texts.fillna("").astype(str).reset_index(drop=True)
+
+    lines = texts.str.replace("\r\n", "\n", regex=False).str.split("\n").explode()
+    doc = lines.index.to_numpy()
+    lines = lines.reset_index(drop=True)
+    stripped = lines.str.strip()
+
+    # Occurrence number and count of each line within its document
+    key = pd.DataFrame({"doc": doc, "line": stripped})
+    nonblank = stripped.str.len() > 0
+    occurrence = key.groupby(["doc", "line"]).cumcount()
+    count = key.groupby(["doc", "line"])["line"].transform("size")
+
+    # Pages per document, from its ECF stamps; without stamps nothing counts as repeated
+    stamp = stripped.str.contains(PAGE_STAMP, regex=True)
+    pages = stamp.groupby(doc).transform("sum").to_numpy()
+    repeated = (
+        nonblank
+        & (pages > 0)
+        & (count >= REPEAT_MIN)
+        & (count >= REPEAT_PAGE_SHARE * pages)
+        & (occurrence > 0)
+    )
+
+    drop = (
+        stamp
+        | stripped.str.fullmatch(NUMBER_ONLY)
+        | stripped.str.fullmatch(CAPTION_BRACKET)
+        | stripped.str.fullmatch(FILLER)
+        | repeated
+    )
+
+    kept = lines[~drop.to_numpy()]
+    reduced = kept.groupby(doc[~drop.to_numpy()]).agg("\n".join)
+    reduced = reduced.reindex(range(len(texts)), fill_value="")
+    reduced.index = index
+
+    # Collapsing the blank runs left behind
+    return reduced.str.replace(r"\n[ \t]*(?:\n[ \t]*)+", "\n\n", regex=True).str.strip()
+
+def reduce_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    original = chunk["text_content"].fillna("").astype(str).reset_index(drop=True)
+    reduced = reduce_series(original)
+    out = pd.DataFrame({
+        "file_id": chunk["file_id"].to_numpy(),
+        "text_content": reduced,
+        "text_hash": [hashlib.md5(t.encode("utf-8")).hexdigest() for t in original],
+        "original_chars": original.str.len(),
+        "reduced_chars": reduced.str.len(),
+    })
+    out["reduction_ratio"] = 1 - out["reduced_chars"] / out["original_chars"].where(out["original_chars"] > 0)
+    return out
+
+# --------------------------------- CACHE --------------------------------------
+
+# What the current output was built from
+def input_state(path: str) -> dict:
+    stat = os.stat(path)
+    return {"input": path, "size": stat.st_size, "mtime": stat.st_mtime, "rules_version": RULES_VERSION}
+
+def read_state(output_csv: str = OUTPUT_CSV) -> dict:
+    state_file = output_csv + ".state.json"
+    if not (os.path.exists(output_csv) and os.path.exists(state_file)):
+        return {}
+    with open(state_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def is_fresh(input_csv: str = INPUT_CSV, output_csv: str = OUTPUT_CSV) -> bool:
+    state = input_state(input_csv)
+    return {k: read_state(output_csv).get(k) for k in state} == state
+
+# Documents in the reduced corpus, recorded when it was built
+def document_count(output_csv: str = OUTPUT_CSV) -> Optional[int]:
+    return read_state(output_csv).get("documents")
+
+# Writing the reduced corpus chunk by chunk, then swapping it in
+def build(input_csv: str = INPUT_CSV, output_csv: str = OUTPUT_CSV) -> dict:
+    tmp_path = output_csv + ".tmp"
+    totals = {"documents": 0, "original_chars": 0, "reduced_chars": 0}
+
+    for i, chunk in enumerate(iter_chunks(input_csv)):
+        out = reduce_chunk(chunk)
+        out.to_csv(tmp_path, mode="w" if i == 0 else "a", header=(i == 0), index=False)
+        totals["documents"] += len(out)
+        totals["original_chars"] += int(out["original_chars"].sum())
+        totals["reduced_chars"] += int(out["reduced_chars"].sum())
+
+    os.replace(tmp_path, output_csv)
+    with open(output_csv + ".state.json", "w", encoding="utf-8") as f:
+        json.dump({**input_state(input_csv), "documents": totals["documents"]}, f)
+    return totals
+
+# Path of an up-to-date reduced corpus, rebuilding it first if needed
+def reduced_csv(input_csv: str = INPUT_CSV, output_csv: str = OUTPUT_CSV) -> str:
+    if not is_fresh(input_csv, output_csv):
+        print(f"Reducing {input_csv} -> {output_csv}")
+        totals = build(input_csv, output_csv)
+        if totals["original_chars"]:
+            saved = 1 - totals["reduced_chars"] / totals["original_chars"]
+            print(f"Reduced {totals['documents']:,} documents by {saved:.1%} "
+                  f"({totals['original_chars']:,} -> {totals['reduced_chars']:,} characters)")
+    return output_csv
+
+# ------------------------------- RUNNING --------------------------------------
+
+if __name__ == "__main__":
+    reduced_csv()
@@ -0,0 +1,35 @@
+# -----------------------------------------------------------------------------
+## Summary: Shared streaming reader for data/overview_data/filtered_texts.csv.
+## The tokenization and extraction stages only need file_id and text_content,
+## so rather than holding the whole CSV (every full complaint body) in memory
+## for the length of a run, rows are read in fixed-size chunks with only the
+## requested columns parsed into the DataFrame. Peak memory depends on the
+## chunk size, not on the size of the corpus.
+# -----------------------------------------------------------------------------
+
+# Importing Libraries
+import pandas as pd
+
+INPUT_CSV = "data/overview_data/filtered_texts.csv"
+CHUNK_SIZE = 500
+
+# Yielding DataFrame chunks restricted to the given columns (and file_ids)
+def iter_chunks(path: str = INPUT_CSV, columns=("file_id", "text_content"),
+                chunksize: int = CHUNK_SIZE, file_ids=None):
+    reader = pd.read_csv(
+        path,
+        usecols=list(columns),
+        dtype={"file_id": str},
+        chunksize=chunksize
+    )
+    for chunk in reader:
+        if file_ids is not None:
+            chunk = chunk[chunk["file_id"].isin(file_ids)]
+        if len(chunk):
+            yield chunk[list(columns)]
+
+# Yielding (file_id, text_content) pairs one at a time
+def iter_texts(path: str = INPUT_CSV, chunksize: int = CHUNK_SIZE, file_ids=None):
+    for chunk in iter_chunks(path, chunksize=chunksize, file_ids=file_ids):
+        yield from zip(chunk["file_id"], chunk["text_content"])
+
@@ -0,0 +1,306 @@
+# -----------------------------------------------------------------------------
+## Summary: Columnar storage for tokenized complaints. Instead of one indented
+## JSON file per complaint, every token field is written as a single flat array
+## covering the whole corpus, with an index mapping each file_id to its row
+## range. Categorical fields (pos, tag, dep, shape, ent_type) are dictionary
+## encoded, and string fields are stored as UTF-8 bytes plus offsets, so every
+## column can be memory-mapped with NumPy and read on its own. Re-runs append
+## new and changed documents to the existing columns in place, and the store
+## is only rewritten once stale rows make up a quarter of it.
+# -----------------------------------------------------------------------------
+
+# Importing Libraries
+import os
+import json
+import shutil
+import numpy as np
+
+# How each token field is laid out on disk
+COLUMN_KINDS = {
+    "token_id": "int32",
+    "token": "str",
+    "lower": "str",
+    "lemma": "str",
+    "pos": "dict",
+    "tag": "dict",
+    "dep": "dict",
+    "is_alpha": "bool",
+    "shape": "dict",
+    "ent_type": "dict",
+}
+
+# On-disk dtype of each non-string column kind
+COLUMN_DTYPES = {"int32": np.int32, "dict": np.int32, "bool": np.bool_}
+
+INDEX_FILE = "index.json"
+
+# Share of dead rows (left behind by re-tokenized documents) that triggers a
+# full rewrite of the store when it is closed
+COMPACT_FRACTION = 0.25
+
+# ------------------------------- WRITING --------------------------------------
+
+class TokenStoreWriter:
+
+    # Appending to the store in place when its fields match; otherwise (or when
+    # compacting) streaming a fresh copy into a temporary directory next to it
+    def __init__(self, path: str, fields: list, compact: bool = False):
+        self.path = path
+        self.tmp_path = path.rstrip("/") + ".tmp"
+        self.fields = list(fields)
+        self.compact = compact
+        self.added = set()
+        self.files = {}
+
+        old = TokenStore(path) if os.path.exists(os.path.join(path, INDEX_FILE)) else None
+        self.appending = not compact and (old is None or old.fields == self.fields)
+        if self.appending:
+            self._open_append(old)
+        else:
+            self._open_rewrite()
+
+    def _open_rewrite(self):
+        self.docs = {}
+        self.meta = {}
+        self.vocab = {f: {} for f in self.fields if COLUMN_KINDS[f] == "dict"}
+        self.n_rows = 0
+        self.n_dead = 0
+        self.n_bytes = {f: 0 for f in self.fields if COLUMN_KINDS[f] == "str"}
+
+        if os.path.exists(self.tmp_path):
+            shutil.rmtree(self.tmp_path)
+        os.makedirs(self.tmp_path)
+
+        for field in self.fields:
+            self.files[field] = open(os.path.join(self.tmp_path, f"{field}.data"), "wb")
+            if COLUMN_KINDS[field] == "str":
+                offsets = open(os.path.join(self.tmp_path, f"{field}.offsets"), "wb")
+                np.zeros(1, dtype=np.int64).tofile(offsets)
+                self.files[f"{field}.offsets"] = offsets
+
+    # Continuing the existing columns, first cutting off anything written after
+    # the last saved index (left behind by an interrupted run)
+    def _open_append(self, old: "TokenStore"):
+        os.makedirs(self.path, exist_ok=True)
+        index = old.index if old is not None else {}
+        self.docs = dict(index.get("docs", {}))
+        self.meta = dict(index.get("meta", {}))
+        self.vocab = {
+            f: {v: i for i, v in enumerate(index.get("vocab", {}).get(f, []))}
+            for f in self.fields if COLUMN_KINDS[f] == "dict"
+        }
+        self.n_rows = index.get("n_rows", 0)
+        self.n_dead = index.get("n_dead", 0)
+        self.n_bytes = {}
+
+        for field in self.fields:
+            kind = COLUMN_KINDS[field]
+            data_path = os.path.join(self.path, f"{field}.data")
+            if kind == "str":
+                offsets_path = os.path.join(self.path, f"{field}.offsets")
+                if old is None:
+                    np.zeros(1, dtype=np.int64).tofile(offsets_path)
+                self.n_bytes[field] = int(old.column(field)[1][-1]) if old is not None else 0
+                _truncate(offsets_path, (self.n_rows + 1) * 8)
+                _truncate(data_path, self.n_bytes[field])
+                self.files[f"{field}.offsets"] = open(offsets_path, "ab")
+            else:
+                _truncate(data_path, self.n_rows * np.dtype(COLUMN_DTYPES[kind]).itemsize)
+            self.files[field] = open(data_path, "ab")
+
+    # Dictionary code for a categorical value, None is stored as -1
+    def _code(self, field: str, value) -> int:
+        if value is None:
+            return -1
+        vocab = self.vocab[field]
+        if value not in vocab:
+            vocab[value] = len(vocab)
+        return vocab[value]
+
+    def _write_strings(self, field: str, values: list):
+        encoded = [v.encode("utf-8") for v in values]
+        lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+        offsets = self.n_bytes[field] + np.cumsum(lengths)
+        self.files[field].write(b"".join(encoded))
+        offsets.tofile(self.files[f"{field}.offsets"])
+        if len(offsets):
+            self.n_bytes[field] = int(offsets[-1])
+
+    # Appending one document's token records, with optional per-doc metadata.
+    # A document already in the store is re-pointed at the new rows and its old
+    # rows are left as dead space until the store is compacted.
+    def add(self, file_id: str, tokens: list, meta: dict = None):
+        if file_id in self.added:
+            print(f"file_id {file_id} already written to this store, skipping")
+            return
+
+        for field in self.fields:
+            kind = COLUMN_KINDS[field]
+            values = [t[field] for t in tokens]
+            if kind == "str":
+                self._write_strings(field, values)
+            elif kind == "dict":
+                codes = [self._code(field, v) for v in values]
+                np.asarray(codes, dtype=np.int32).tofile(self.files[field])
+            else:
+                np.asarray(values, dtype=COLUMN_DTYPES[kind]).tofile(self.files[field])
+
+        if file_id in self.docs:
+            start, stop = self.docs[file_id]
+            self.n_dead += stop - start
+        self.docs[file_id] = [self.n_rows, self.n_rows + len(tokens)]
+        self.n_rows += len(tokens)
+        self.added.add(file_id)
+        if meta is not None:
+            self.meta[file_id] = meta
+
+    # Copying documents from the previous store that were not rewritten
+    def _carry_over(self, old: "TokenStore"):
+        keep = [fid for fid in old.file_ids if fid not in self.docs]
+        if not keep:
+            return
+
+        columns = {f: old.column(f) for f in self.fields}
+        remap = {}
+        for field in self.vocab:
+            mapping = [self._code(field, v) for v in old.vocab(field)]
+            remap[field] = np.asarray(mapping + [-1], dtype=np.int32)
+
+        for file_id in keep:
+            start, stop = old.rows(file_id)
+            for field in self.fields:
+                kind = COLUMN_KINDS[field]
+                if kind == "str":
+                    data, offsets = columns[field]
+                    chunk = offsets[start:stop + 1]
+                    self.files[field].write(data[chunk[0]:chunk[-1]].tobytes())
+                    (self.n_bytes[field] - chunk[0] + chunk[1:]).tofile(self.files[f"{field}.offsets"])
+                    self.n_bytes[field] += int(chunk[-1] - chunk[0])
+                elif kind == "dict":
+                    remap[field][columns[field][start:stop]].tofile(self.files[field])
+                else:
+                    np.asarray(columns[field][start:stop]).tofile(self.files[field])
+            self.docs[file_id] = [self.n_rows, self.n_rows + stop - start]
+            self.n_rows += stop - start
+            if file_id in old.index.get("meta", {}):
+                self.meta[file_id] = old.index["meta"][file_id]
+
+    def _write_index(self, directory: str):
+        index = {
+            "fields": self.fields,
+            "kinds": {f: COLUMN_KINDS[f] for f in self.fields},
+            "vocab": {f: list(v) for f, v in self.vocab.items()},
+            "n_rows": self.n_rows,
+            "n_dead": self.n_dead,
+            "docs": self.docs,
+            "meta": self.meta,
+        }
+        tmp_index = os.path.join(directory, INDEX_FILE + ".tmp")
+        with open(tmp_index, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp_index, os.path.join(directory, INDEX_FILE))
+
+    # Making everything added so far durable (append mode only; a rewritten
+    # store only becomes visible when it is closed)
+    def checkpoint(self):
+        if not self.appending:
+            return
+        for f in self.files.values():
+            f.flush()
+            os.fsync(f.fileno())
+        self._write_index(self.path)
+
+    # Finishing the store, compacting it once too much of it is dead rows
+    def close(self):
+        if self.appending:
+            self.checkpoint()
+            for f in self.files.values():
+                f.close()
+            if self.n_dead > COMPACT_FRACTION * self.n_rows:
+                print(f"Compacting {self.path} ({self.n_dead:,} of {self.n_rows:,} rows are stale)")
+                TokenStoreWriter(self.path, self.fields, compact=True).close()
+            return
+
+        exists = os.path.exists(os.path.join(self.path, INDEX_FILE))
+
+        # Nothing new was written, so the existing store stays as it is
+        if not self.docs and exists and not self.compact:
+            for f in self.files.values():
+                f.close()
+            shutil.rmtree(self.tmp_path)
+            return
+
+        if exists:
+            old = TokenStore(self.path)
+            if old.fields == self.fields:
+                self._carry_over(old)
+            else:
+                print(f"Existing store at {self.path} has fields {old.fields}; replacing it")
+
+        for f in self.files.values():
+            f.close()
+        self.n_dead = 0
+        self._write_index(self.tmp_path)
+
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.replace(self.tmp_path, self.path)
+
+# Cutting a file back to `size` bytes, creating it if missing
+def _truncate(path: str, size: int):
+    with open(path, "ab") as f:
+        f.truncate(size)
+
+# ------------------------------- READING --------------------------------------
+
+class TokenStore:
+
+    # Opening a store; columns are memory-mapped lazily on request
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE), "r", encoding="utf-8") as f:
+            self.index = json.load(f)
+        self.fields = self.index["fields"]
+        self.file_ids = list(self.index["docs"])
+
+    def rows(self, file_id: str) -> tuple:
+        start, stop = self.index["docs"][file_id]
+        return start, stop
+
+    def vocab(self, field: str) -> list:
+        return self.index["vocab"][field]
+
+    def _map(self, name: str, dtype, count: int):
+        if count == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(os.path.join(self.path, name), dtype=dtype, mode="r", shape=(count,))
+
+    # Raw column: codes for dict fields, (bytes, offsets) for string fields
+    def column(self, field: str):
+        kind = self.index["kinds"][field]
+        n = self.index["n_rows"]
+        if kind == "str":
+            offsets = self._map(f"{field}.offsets", np.int64, n + 1)
+            return self._map(f"{field}.data", np.uint8, int(offsets[-1])), offsets
+        return self._map(f"{field}.data", COLUMN_DTYPES[kind], n)
+
+    # Decoded values for rows [start, stop) of a column
+    def values(self, field: str, start: int = 0, stop: int = None) -> list:
+        kind = self.index["kinds"][field]
+        stop = self.index["n_rows"] if stop is None else stop
+        if kind == "str":
+            data, offsets = self.column(field)
+            raw = data[offsets[start]:offsets[stop]].tobytes()
+            bounds = offsets[start:stop + 1] - offsets[start]
+            return [raw[a:b].decode("utf-8") for a, b in zip(bounds[:-1], bounds[1:])]
+        codes = self.column(field)[start:stop]
+        if kind == "dict":
+            vocab = self.vocab(field)
+            return [vocab[c] if c >= 0 else None for c in codes]
+        return codes.tolist()
+
+    # Rebuilding the same token records the JSON output holds
+    def doc(self, file_id: str) -> list:
+        start, stop = self.rows(file_id)
+        columns = {f: self.values(f, start, stop) for f in self.fields}
+        return [dict(zip(self.fields, row)) for row in zip(*columns.values())]
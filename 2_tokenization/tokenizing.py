@@ -1,67 +1,269 @@
 # ---------------------------- IMPORTING LIBRARIES -----------------------------
-import pandas as pd
 import spacy
 import re
 import os
+import sys
 import json
+import time
+import hashlib
 from tqdm import tqdm
-import glob
-import json
-from collections import Counter
+from token_store import TokenStore, TokenStoreWriter
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "1_loading_data"))
+from text_loader import iter_texts
 
 # --------------------------- SETTING UP NLP PARSER ----------------------------
-nlp = spacy.load("en_core_web_sm") 
 INPUT_FILE = "data/overview_data/filtered_texts.csv"
 OUTPUT_DIR = "data/tokenized_json"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+COLUMNAR_DIR = "data/tokenized_columnar"
+SPACY_MODEL = "en_core_web_sm"
 
-# ------------------------------- LOADING DATA ---------------------------------
-df = pd.read_csv(INPUT_FILE)
-df = df.dropna(subset=["text_content"])
+# Output backend: "json" writes one file per file_id, "columnar" writes every
+# field as one corpus-wide array (see token_store.py)
+OUTPUT_FORMAT = "json"
+PROFILE = "full"
 
-# ---------------------------- TOKENIZING EACH FILE ----------------------------
+# Manifest of what each output was built from, so re-runs only tokenize new or
+# changed documents. It is rebuilt from the outputs themselves when missing.
+MANIFEST_FILE = f"data/tokenized_{OUTPUT_FORMAT}_manifest.json"
+
+# Documents between manifest saves, so an interrupted run keeps its progress
+CHECKPOINT_EVERY = 500
+
+# Tokenization profiles: pipeline components to leave out and fields to save.
+# "lite" keeps the tagger and lemmatizer (and the attribute ruler that maps
+# tags to POS) but drops the parser and NER, so it cannot fill dep/ent_type.
+PROFILES = {
+    "full": {
+        "exclude": [],
+        "fields": [
+            "token_id", "token", "lower", "lemma", "pos", "tag",
+            "dep", "is_alpha", "shape", "ent_type"
+        ]
+    },
+    "lite": {
+        "exclude": ["parser", "ner"],
+        "fields": [
+            "token_id", "token", "lower", "lemma", "pos", "tag",
+            "is_alpha", "shape"
+        ]
+    }
+}
+
+# How each saved field is read off a spaCy token
+TOKEN_FIELDS = {
+    "token": lambda token: token.text,
+    "lower": lambda token: token.text.lower(),
+    "lemma": lambda token: token.lemma_,
+    "pos": lambda token: token.pos_,
+    "tag": lambda token: token.tag_,
+    "dep": lambda token: token.dep_,
+    "is_alpha": lambda token: token.is_alpha,
+    "shape": lambda token: token.shape_,
+    "ent_type": lambda token: token.ent_type_ if token.ent_type_ else None,
+}
+
+# Number of documents handed to nlp.pipe at once, and worker processes to use
+BATCH_SIZE = 32
+N_PROCESS = max(1, (os.cpu_count() or 1) - 1)
+
+# ------------------------------ HELPER FUNCTIONS ------------------------------
+
+# A pipeline component failed on a batch. spaCy drops the whole batch, so
+# tokenize() re-runs its documents one at a time afterwards.
+def skip_on_error(proc_name, proc, docs, e):
+    print(f"{proc_name} failed on a batch of {len(docs)} docs ({e}), retrying them one by one")
+
+# Yielding normalized (text, file_id) pairs for nlp.pipe
+def iter_normalized(rows, max_length):
+    for file_id, text in rows:
+
+        # Skip if text is empty or not a string
+        if not isinstance(text, str) or not text.strip():
+            continue
+
+        text = re.sub(r"\s+", " ", text.strip())
+
+        # Skip texts spaCy refuses to tokenize (nlp.max_length)
+        if len(text) > max_length:
+            print(f"Skipping file_id {file_id}: {len(text):,} characters exceeds nlp.max_length")
+            continue
+
+        yield text, str(file_id)
+
+# Hash of the normalized text a document is tokenized from
+def hash_text(text):
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+# Yielding only documents whose text, model or profile changed since last run
+def iter_pending(rows, manifest, signature, max_length):
+    for text, file_id in iter_normalized(rows, max_length):
+        text_hash = hash_text(text)
+        if manifest.get(file_id) == {**signature, "text_hash": text_hash}:
+            continue
+        yield text, (file_id, text_hash)
+
+# Reading the header fields of a JSON output without parsing its tokens
+def read_json_header(path):
+    lines = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith('  "tokens"'):
+                break
+            lines.append(line)
+    header = "".join(lines[1:]).rstrip().rstrip(",")
+    return json.loads("{" + header + "}")
+
+# Rebuilding the manifest from the hashes saved alongside each output
+def rebuild_manifest():
+    manifest = {}
+    keys = ["model", "model_version", "profile", "text_hash"]
 
-for _, row in tqdm(df.iterrows(), total=len(df), desc="Tokenizing"):
-    file_id = str(row["file_id"])
-    text = row["text_content"]
+    if OUTPUT_FORMAT == "columnar":
+        if os.path.exists(COLUMNAR_DIR):
+            for file_id, meta in TokenStore(COLUMNAR_DIR).index.get("meta", {}).items():
+                manifest[file_id] = {k: meta.get(k) for k in keys}
+        return manifest
 
-    # Skip if text is empty or not a string
-    if not isinstance(text, str) or not text.strip():
-        continue
+    for fname in tqdm(os.listdir(OUTPUT_DIR), desc="Rebuilding manifest"):
+        if not fname.endswith(".json"):
+            continue
+        try:
+            header = read_json_header(os.path.join(OUTPUT_DIR, fname))
+        except Exception as e:
+            print(f"Could not read header of {fname}: {e}")
+            continue
+        if "text_hash" in header:
+            manifest[header["file_id"]] = {k: header.get(k) for k in keys}
+    return manifest
 
-    text = re.sub(r"\s+", " ", text.strip())
+def load_manifest():
+    if os.path.exists(MANIFEST_FILE):
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return rebuild_manifest()
 
-    try:
-        doc = nlp(text)
-    except Exception as e:
-        continue
+def save_manifest(manifest):
+    tmp_path = MANIFEST_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, MANIFEST_FILE)
 
+# Converting a parsed doc into the token records we save
+def doc_to_tokens(doc, fields):
+    getters = [(field, TOKEN_FIELDS[field]) for field in fields if field != "token_id"]
     tokens = []
     for i, token in enumerate(doc):
         if token.is_stop or token.is_punct:
             continue
-        tokens.append({
-            "token_id": i,
-            "token": token.text,
-            "lower": token.text.lower(),
-            "lemma": token.lemma_,
-            "pos": token.pos_,
-            "tag": token.tag_,
-            "dep": token.dep_,
-            "is_alpha": token.is_alpha,
-            "shape": token.shape_,
-            "ent_type": token.ent_type_ if token.ent_type_ else None,
-        })
-
-    output = {
-        "file_id": file_id,
-        "n_tokens": len(tokens),
-        "tokens": tokens
+        record = {"token_id": i} if "token_id" in fields else {}
+        for field, getter in getters:
+            record[field] = getter(token)
+        tokens.append(record)
+    return tokens
+
+# ---------------------------- TOKENIZING EACH FILE ----------------------------
+def tokenize(rows, nlp, fields, manifest, signature):
+    n_docs = 0
+    n_tokens = 0
+    start_time = time.perf_counter()
+
+    store = TokenStoreWriter(COLUMNAR_DIR, fields) if OUTPUT_FORMAT == "columnar" else None
+
+    # Documents sent to nlp.pipe that have not come back yet. Whatever is left
+    # at the end was in a batch dropped by skip_on_error.
+    in_flight = {}
+
+    def track(items):
+        for text, context in items:
+            in_flight[context] = text
+            yield text, context
+
+    def save(doc, file_id, text_hash):
+        nonlocal n_docs, n_tokens
+        tokens = doc_to_tokens(doc, fields)
+        meta = {**signature, "text_hash": text_hash}
+
+        if store is not None:
+            store.add(file_id, tokens, meta)
+        else:
+            output = {
+                "file_id": file_id,
+                **meta,
+                "n_tokens": len(tokens),
+                "tokens": tokens
+            }
+
+            try:
+                with open(f"{OUTPUT_DIR}/{file_id}.json", "w", encoding="utf-8") as f:
+                    json.dump(output, f, ensure_ascii=False, indent=2)
+            except Exception as e:
+                print(f"file_id {file_id} due to write error: {e}")
+                return
+
+        manifest[file_id] = meta
+        n_docs += 1
+        n_tokens += len(doc)
+        if n_docs % CHECKPOINT_EVERY == 0:
+            checkpoint()
+
+    # Saving the manifest only once the outputs it lists are on disk. A store
+    # being rewritten from scratch is not visible until it is closed.
+    def checkpoint():
+        if store is None:
+            save_manifest(manifest)
+        elif store.appending:
+            store.checkpoint()
+            save_manifest(manifest)
+
+    docs = nlp.pipe(
+        track(iter_pending(rows, manifest, signature, nlp.max_length)),
+        as_tuples=True,
+        batch_size=BATCH_SIZE,
+        n_process=N_PROCESS
+    )
+
+    for doc, context in tqdm(docs, desc="Tokenizing"):
+        in_flight.pop(context, None)
+        save(doc, *context)
+
+    # Re-running documents from failed batches alone, so only the ones that
+    # fail by themselves are skipped
+    for context, text in tqdm(list(in_flight.items()), desc="Retrying failed batches"):
+        docs = list(nlp.pipe([(text, context)], as_tuples=True, batch_size=1))
+        if not docs:
+            print(f"Skipping file_id {context[0]} after pipeline error")
+            continue
+        save(docs[0][0], *context)
+
+    if store is not None:
+        store.close()
+    save_manifest(manifest)
+
+    elapsed = time.perf_counter() - start_time
+
+    print("\n" + "="*60)
+    print(f"Documents tokenized: {n_docs:,} in {elapsed:.2f}s")
+    print(f"Profile: {PROFILE} | Output: {OUTPUT_FORMAT} | Batch size: {BATCH_SIZE} | Processes: {N_PROCESS}")
+    if elapsed > 0:
+        print(f"Throughput: {n_docs / elapsed:.2f} docs/sec | {n_tokens / elapsed:,.0f} tokens/sec")
+    print("="*60)
+
+# ---------------------------------- RUNNING -----------------------------------
+if __name__ == "__main__":
+    if OUTPUT_FORMAT == "json":
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    profile = PROFILES[PROFILE]
+    nlp = spacy.load(SPACY_MODEL, exclude=profile["exclude"])
+    nlp.set_error_handler(skip_on_error)
+
+    signature = {
+        "model": SPACY_MODEL,
+        "model_version": nlp.meta["version"],
+        "profile": PROFILE
     }
+    manifest = load_manifest()
+    print(f"Manifest covers {len(manifest):,} documents")
 
-    try:
-        with open(f"{OUTPUT_DIR}/{file_id}.json", "w", encoding="utf-8") as f:
-            json.dump(output, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"file_id {file_id} due to write error: {e}")
-        continue
+    tokenize(iter_texts(INPUT_FILE), nlp, profile["fields"], manifest, signature)
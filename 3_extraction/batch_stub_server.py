@@ -0,0 +1,272 @@
+# -----------------------------------------------------------------------------
+## Summary: Local stand-in for the OpenAI and Anthropic batch endpoints, used
+## to exercise `multi_model.py --batch` without spending tokens. It accepts
+## file uploads and batch submissions, reports every batch as finished on the
+## first poll, and answers each request with a fixed extraction JSON. The
+## interactive chat completion and messages endpoints answer the same way.
+##
+## Usage:
+##   python 3_extraction/batch_stub_server.py --port 8089
+##   OPENAI_BASE_URL=http://127.0.0.1:8089/v1 \
+##   ANTHROPIC_BASE_URL=http://127.0.0.1:8089 \
+##   python 3_extraction/multi_model.py --batch
+# -----------------------------------------------------------------------------
+
+# Importing Libraries
+import re
+import json
+import time
+import email
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Response returned for every request in a batch
+STUB_OUTPUT = json.dumps({
+    "is_complaint": "TRUE",
+    "agencies": [],
+    "officers": [],
+    "plaintiffs": [],
+    "causes_of_action": [],
+    "types_of_misconduct": "",
+    "incident_location": ""
+})
+
+files = {}
+batches = {}
+requests_seen = []
+lock = threading.Lock()
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+# ------------------------------ OPENAI SHAPES ---------------------------------
+
+def openai_batch(batch_id: str) -> dict:
+    batch = batches[batch_id]
+    return {
+        "id": batch_id,
+        "object": "batch",
+        "endpoint": batch["endpoint"],
+        "input_file_id": batch["input_file_id"],
+        "completion_window": "24h",
+        "status": batch["status"],
+        "output_file_id": batch.get("output_file_id"),
+        "error_file_id": None,
+        "created_at": batch["created_at"],
+        "request_counts": {
+            "total": len(batch["requests"]),
+            "completed": len(batch["requests"]) if batch["status"] == "completed" else 0,
+            "failed": 0
+        }
+    }
+
+def openai_completion(request_id: str, body: dict) -> dict:
+    return {
+        "id": f"chatcmpl-{request_id}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body["model"],
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": STUB_OUTPUT},
+            "finish_reason": "stop"
+        }],
+        "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120}
+    }
+
+def openai_result(request: dict) -> dict:
+    return {
+        "id": f"batch_req_{request['custom_id']}",
+        "custom_id": request["custom_id"],
+        "response": {
+            "status_code": 200,
+            "request_id": f"req_{request['custom_id']}",
+            "body": openai_completion(request["custom_id"], request["body"])
+        },
+        "error": None
+    }
+
+# ----------------------------- ANTHROPIC SHAPES -------------------------------
+
+def anthropic_batch(batch_id: str, base_url: str) -> dict:
+    batch = batches[batch_id]
+    ended = batch["status"] == "completed"
+    n = len(batch["requests"])
+    return {
+        "id": batch_id,
+        "type": "message_batch",
+        "processing_status": "ended" if ended else "in_progress",
+        "request_counts": {
+            "processing": 0 if ended else n,
+            "succeeded": n if ended else 0,
+            "errored": 0,
+            "canceled": 0,
+            "expired": 0
+        },
+        "created_at": batch["created_iso"],
+        "expires_at": batch["created_iso"],
+        "ended_at": now_iso() if ended else None,
+        "cancel_initiated_at": None,
+        "archived_at": None,
+        "results_url": f"{base_url}/v1/messages/batches/{batch_id}/results" if ended else None
+    }
+
+def anthropic_message(request_id: str, params: dict) -> dict:
+    return {
+        "id": f"msg_{request_id}",
+        "type": "message",
+        "role": "assistant",
+        "model": params["model"],
+        "content": [{"type": "text", "text": STUB_OUTPUT}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": 100, "output_tokens": 20}
+    }
+
+def anthropic_result(request: dict) -> dict:
+    return {
+        "custom_id": request["custom_id"],
+        "result": {
+            "type": "succeeded",
+            "message": anthropic_message(request["custom_id"], request["params"])
+        }
+    }
+
+# --------------------------------- SERVER -------------------------------------
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    # Keep-alive, so clients can reuse connections as they would with the real APIs
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, payload, status: int = 200, content_type: str = "application/json"):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _base_url(self) -> str:
+        return f"http://{self.headers.get('Host')}"
+
+    def log_message(self, format, *args):
+        pass
+
+    # Batches finish on the first poll after submission
+    def _advance(self, batch_id: str):
+        batch = batches[batch_id]
+        if batch["status"] != "completed":
+            if batch["endpoint"] == "anthropic":
+                batch["status"] = "completed"
+            else:
+                lines = [json.dumps(openai_result(r)) for r in batch["requests"]]
+                output_id = f"file-out-{batch_id}"
+                files[output_id] = ("\n".join(lines) + "\n").encode("utf-8")
+                batch["output_file_id"] = output_id
+                batch["status"] = "completed"
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        body = self._body()
+        with lock:
+
+            # Interactive requests
+            if path == "/v1/chat/completions":
+                requests_seen.append(path)
+                return self._send(openai_completion(f"{len(requests_seen)}", json.loads(body)))
+
+            if path == "/v1/messages":
+                requests_seen.append(path)
+                return self._send(anthropic_message(f"{len(requests_seen)}", json.loads(body)))
+
+            # OpenAI: multipart file upload
+            if path == "/v1/files":
+                message = email.message_from_bytes(
+                    b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + body
+                )
+                content = b""
+                for part in message.walk():
+                    if part.get_param("name", header="content-disposition") == "file":
+                        content = part.get_payload(decode=True)
+                file_id = f"file-{len(files) + 1}"
+                files[file_id] = content
+                return self._send({
+                    "id": file_id, "object": "file", "bytes": len(content),
+                    "created_at": int(time.time()), "filename": "requests.jsonl",
+                    "purpose": "batch", "status": "processed"
+                })
+
+            # OpenAI: create a batch from an uploaded file
+            if path == "/v1/batches":
+                request = json.loads(body)
+                lines = files[request["input_file_id"]].decode("utf-8").splitlines()
+                batch_id = f"batch_{len(batches) + 1}"
+                batches[batch_id] = {
+                    "endpoint": request["endpoint"],
+                    "input_file_id": request["input_file_id"],
+                    "requests": [json.loads(l) for l in lines if l.strip()],
+                    "status": "validating",
+                    "created_at": int(time.time()),
+                }
+                return self._send(openai_batch(batch_id))
+
+            # Anthropic: create a message batch
+            if path == "/v1/messages/batches":
+                request = json.loads(body)
+                batch_id = f"msgbatch_{len(batches) + 1}"
+                batches[batch_id] = {
+                    "endpoint": "anthropic",
+                    "requests": request["requests"],
+                    "status": "in_progress",
+                    "created_iso": now_iso(),
+                }
+                return self._send(anthropic_batch(batch_id, self._base_url()))
+
+        self._send({"error": {"message": f"unknown endpoint {path}"}}, status=404)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        with lock:
+
+            match = re.fullmatch(r"/v1/batches/([^/]+)", path)
+            if match and match.group(1) in batches:
+                self._advance(match.group(1))
+                return self._send(openai_batch(match.group(1)))
+
+            match = re.fullmatch(r"/v1/files/([^/]+)/content", path)
+            if match and match.group(1) in files:
+                return self._send(files[match.group(1)], content_type="application/octet-stream")
+
+            match = re.fullmatch(r"/v1/messages/batches/([^/]+)/results", path)
+            if match and match.group(1) in batches:
+                lines = [json.dumps(anthropic_result(r)) for r in batches[match.group(1)]["requests"]]
+                return self._send(("\n".join(lines) + "\n").encode("utf-8"), content_type="application/binary")
+
+            match = re.fullmatch(r"/v1/messages/batches/([^/]+)", path)
+            if match and match.group(1) in batches:
+                self._advance(match.group(1))
+                return self._send(anthropic_batch(match.group(1), self._base_url()))
+
+        self._send({"error": {"message": f"unknown endpoint {path}"}}, status=404)
+
+def serve(port: int) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# ------------------------------- RUNNING --------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stand-in batch API server")
+    parser.add_argument("--port", type=int, default=8089)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), StubHandler)
+    print(f"Batch stub listening on http://127.0.0.1:{args.port}")
+    server.serve_forever()
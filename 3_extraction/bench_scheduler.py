@@ -0,0 +1,51 @@
+# -----------------------------------------------------------------------------
+## Summary: Compares the old fixed-batch loop (asyncio.gather over BATCH_SIZE
+## rows, then a short sleep) with scheduler.run_worker_pool on simulated
+## request latencies where a small share of requests are much slower, as long
+## complaints are in practice. No API calls are made.
+##
+## Usage: python 3_extraction/bench_scheduler.py
+# -----------------------------------------------------------------------------
+
+# Importing Libraries
+import time
+import random
+import asyncio
+from scheduler import run_worker_pool
+
+N_REQUESTS = 200
+BATCH_SIZE = 10
+BATCH_DELAY = 0.1
+
+# Latency mix: most requests take BASE_LATENCY, SLOW_SHARE take SLOW_FACTOR times longer
+BASE_LATENCY = 0.01
+SLOW_SHARE = 0.1
+SLOW_FACTOR = 20
+
+async def fake_request(latency: float) -> float:
+    await asyncio.sleep(latency)
+    return latency
+
+# Previous scheduling: wait for the whole slice before starting the next one
+async def fixed_batches(latencies: list) -> float:
+    start = time.perf_counter()
+    for i in range(0, len(latencies), BATCH_SIZE):
+        await asyncio.gather(*[fake_request(l) for l in latencies[i:i + BATCH_SIZE]])
+        await asyncio.sleep(BATCH_DELAY)
+    return time.perf_counter() - start
+
+async def worker_pool(latencies: list) -> float:
+    start = time.perf_counter()
+    await run_worker_pool(latencies, fake_request, n_workers=BATCH_SIZE, on_result=lambda r: None)
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    random.seed(0)
+    latencies = [
+        BASE_LATENCY * (SLOW_FACTOR if random.random() < SLOW_SHARE else 1)
+        for _ in range(N_REQUESTS)
+    ]
+
+    print(f"{N_REQUESTS} requests, {BATCH_SIZE} at a time, {SLOW_SHARE:.0%} of them {SLOW_FACTOR}x slower")
+    print(f"Fixed batches: {asyncio.run(fixed_batches(latencies)):.2f}s")
+    print(f"Worker pool:   {asyncio.run(worker_pool(latencies)):.2f}s")
@@ -0,0 +1,159 @@
+# -----------------------------------------------------------------------------
+## Summary: Map-reduce extraction for long complaints. A complaint longer than
+## MAX_CHUNK_CHARS is split on its section headings (causes of action, counts,
+## claims for relief) and the sections are packed into chunks under the limit.
+## Every chunk after the first starts with the opening of the complaint so the
+## model still sees the caption and parties. Each chunk is extracted on its own
+## and the JSON outputs are merged back into the single-document schema, with
+## agencies, officers, plaintiffs and causes of action de-duplicated. A merge
+## missing any chunk is flagged, so it is saved as "partial" and extracted again.
+# -----------------------------------------------------------------------------
+
+# Importing Libraries
+import re
+import json
+from typing import Any, Dict, List
+from json_repair import repair_json
+
+# Longest complaint (in characters, ~15k tokens) sent as a single request
+MAX_CHUNK_CHARS = 60000
+
+# Opening characters of the complaint repeated at the top of later chunks
+HEAD_CHARS = 3000
+
+# Section headings a complaint is split on, e.g. "FIRST CAUSE OF ACTION",
+# "SECOND CLAIM FOR RELIEF", "COUNT IV". Headings are written in capitals.
+SECTION_PATTERN = re.compile(
+    r"\b(?:[A-Z]+\s+)?(?:CAUSE\s+OF\s+ACTION|CLAIM\s+FOR\s+RELIEF)\b"
+    r"|\bCOUNT\s+(?:[IVXLC]+|\d+|ONE|TWO|THREE|FOUR|FIVE|SIX|SEVEN|EIGHT|NINE|TEN)\b"
+)
+
+# Where an oversized section may be cut, best first
+BREAK_PATTERNS = [re.compile(r"\n\s*\n"), re.compile(r"\n"), re.compile(r"(?<=[.;:])\s")]
+
+# Keys of the list fields and the field that identifies an entry in each
+ENTITY_KEYS = {
+    "agencies": ("agency_name",),
+    "officers": ("officer_name",),
+    "plaintiffs": ("plaintiff_name",),
+    "causes_of_action": ("cause_number", "cause_cited"),
+}
+
+class PartialExtraction(ValueError):
+
+    # A merge missing chunks that didn't return valid JSON; dead-lettered for re-extraction
+    error_class = "partial"
+
+# Fields holding semicolon-separated values
+LIST_FIELDS = {"plaintiff_race", "plaintiff_gender", "defendants_named", "types_of_misconduct", "incident_location"}
+
+# -------------------------------- SPLITTING -----------------------------------
+
+# Cutting a section that is longer than `limit` at the latest good break
+def _split_long(section: str, limit: int) -> List[str]:
+    pieces = []
+    while len(section) > limit:
+        cut = None
+        for pattern in BREAK_PATTERNS:
+            breaks = [m.end() for m in pattern.finditer(section, 0, limit)]
+            if breaks and breaks[-1] > limit // 2:
+                cut = breaks[-1]
+                break
+        cut = cut or limit
+        pieces.append(section[:cut])
+        section = section[cut:]
+    pieces.append(section)
+    return pieces
+
+def split_complaint(text: str, max_chars: int = MAX_CHUNK_CHARS) -> List[str]:
+    if len(text) <= max_chars:
+        return [text]
+
+    head = text[:HEAD_CHARS]
+    prefix = f"{head}\n\n[... complaint continues ...]\n\n"
+    limit = max_chars - len(prefix)
+
+    # Sections start at each heading; text before the first heading is one section
+    starts = [0] + [m.start() for m in SECTION_PATTERN.finditer(text) if m.start() > 0]
+    sections = [text[a:b] for a, b in zip(starts, starts[1:] + [len(text)])]
+
+    # Packing whole sections into chunks, splitting only ones too long to fit
+    chunks = []
+    current = ""
+    for section in sections:
+        for piece in _split_long(section, limit):
+            if current and len(current) + len(piece) > limit:
+                chunks.append(current)
+                current = ""
+            current += piece
+    if current:
+        chunks.append(current)
+
+    return [chunks[0]] + [prefix + chunk for chunk in chunks[1:]]
+
+# --------------------------------- MERGING ------------------------------------
+
+def _norm(value: Any) -> str:
+    return re.sub(r"\s+", " ", str(value or "")).strip().casefold()
+
+# Union of semicolon-separated values, in order of first appearance
+def _join_unique(*values: str) -> str:
+    seen = {}
+    for value in values:
+        for item in str(value or "").split(";"):
+            item = item.strip()
+            if item and _norm(item) not in seen:
+                seen[_norm(item)] = item
+    return "; ".join(seen.values())
+
+# Combining two records for the same entity, filling blanks from the later one
+def _merge_entity(a: dict, b: dict) -> dict:
+    merged = dict(a)
+    for field, value in b.items():
+        if field in LIST_FIELDS:
+            merged[field] = _join_unique(merged.get(field, ""), value)
+        elif not merged.get(field):
+            merged[field] = value
+    return merged
+
+def merge_extractions(outputs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    merged = {
+        "is_complaint": "TRUE" if any(_norm(o.get("is_complaint")) == "true" for o in outputs) else "FALSE"
+    }
+
+    for field, keys in ENTITY_KEYS.items():
+        entities = {}
+        for output in outputs:
+            for entity in output.get(field) or []:
+                if not isinstance(entity, dict):
+                    continue
+                key = tuple(_norm(entity.get(k)) for k in keys)
+                if not any(key):
+                    continue
+                entities[key] = _merge_entity(entities[key], entity) if key in entities else dict(entity)
+        merged[field] = list(entities.values())
+
+    for field in ("types_of_misconduct", "incident_location"):
+        merged[field] = _join_unique(*[o.get(field, "") for o in outputs])
+
+    return merged
+
+# Folding the per-chunk responses of one complaint into a single response
+def combine_chunk_results(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    outputs = []
+    for part in parts:
+        repaired = repair_json(part.get("content"))
+        if repaired is not None:
+            outputs.append(json.loads(repaired))
+    if not outputs:
+        raise ValueError(f"none of the {len(parts)} chunks returned valid JSON")
+
+    return {
+        "content": json.dumps(merge_extractions(outputs), ensure_ascii=False, indent=2),
+        "tokens": sum(p.get("tokens") or 0 for p in parts),
+        "cached_tokens": sum(p.get("cached_tokens") or 0 for p in parts),
+        "queue_wait": sum(p.get("queue_wait") or 0 for p in parts),
+        "truncated": any(p.get("truncated") for p in parts) or len(outputs) < len(parts),
+        "missing_chunks": len(parts) - len(outputs),
+        "chunks": len(parts)
+    }
@@ -0,0 +1,180 @@
+# -----------------------------------------------------------------------------
+## Summary: Persistent index of finished extractions, replacing the scans of
+## each output folder that decided which file_ids to skip. Every output that
+## is written is recorded in SQLite with its model, a hash of the prompt it
+## was made with, its status ("complete" when it parses as JSON, "repaired"
+## when it parses after json_repair, "partial" for a chunk merge missing some
+## chunks, otherwise "invalid_json") and its path, so skip checks are single
+## lookups and an output that can't be repaired, or is missing chunks, is
+## extracted again on the next run. The first time a model's folder is seen,
+## the .txt files already in it are read into the index once. Run directly to
+## see counts per model, or the file_ids in the input that still lack a
+## finished extraction:
+##
+##   python 3_extraction/completion_index.py data/extract15/completions.sqlite
+##   python 3_extraction/completion_index.py data/extract15/completions.sqlite --missing claude
+# -----------------------------------------------------------------------------
+
+# Importing Libraries
+import os
+import sys
+import time
+import asyncio
+import sqlite3
+import argparse
+import threading
+from typing import Iterable, List, Optional
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "1_loading_data"))
+from text_loader import INPUT_CSV, iter_chunks
+from json_repair import repair_output
+
+INDEX_PATH = "data/extract15/completions.sqlite"
+
+# Model names as they appear in output file names
+def model_key(model_name: str) -> str:
+    return model_name.replace("/", "-")
+
+# Statuses that count as finished
+DONE_STATUSES = ("complete", "repaired")
+
+# Status of an output from its text (see json_repair.repair_output)
+def output_status(text: Optional[str]) -> str:
+    return repair_output(text)[1]
+
+
+class CompletionIndex:
+
+    def __init__(self, path: str = INDEX_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS completions (
+                file_id TEXT NOT NULL,
+                llm_type TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_hash TEXT,
+                status TEXT NOT NULL,
+                output_path TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (llm_type, model, file_id)
+            )"""
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS scanned_dirs (
+                output_dir TEXT PRIMARY KEY,
+                scanned_at REAL NOT NULL
+            )"""
+        )
+        self.conn.commit()
+
+    # Loading a folder's existing outputs, named {file_id}_{model}_{timestamp}.txt.
+    # Done once per folder; later outputs are recorded as they are written.
+    def bootstrap(self, llm_type: str, output_dir: str, rescan: bool = False):
+        with self._lock:
+            seen = self.conn.execute(
+                "SELECT 1 FROM scanned_dirs WHERE output_dir = ?", (output_dir,)
+            ).fetchone()
+            if seen and not rescan:
+                return
+
+            # Keeping the newest output per file_id and model
+            latest = {}
+            if os.path.isdir(output_dir):
+                for fname in os.listdir(output_dir):
+                    if not fname.endswith(".txt"):
+                        continue
+                    parts = fname[:-4].split("_")
+                    if len(parts) < 3:
+                        continue
+                    file_id, model, stamp = parts[0], "_".join(parts[1:-1]), parts[-1]
+                    if (file_id, model) not in latest or stamp > latest[(file_id, model)][0]:
+                        latest[(file_id, model)] = (stamp, fname)
+
+            rows = []
+            for (file_id, model), (_, fname) in latest.items():
+                path = os.path.join(output_dir, fname)
+                with open(path, "r", encoding="utf-8", errors="replace") as f:
+                    status = output_status(f.read())
+                rows.append((file_id, llm_type, model, None, status, path, os.path.getmtime(path)))
+
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO scanned_dirs VALUES (?, ?)", (output_dir, time.time())
+            )
+            self.conn.commit()
+
+    def record(self, file_id: str, llm_type: str, model: str, prompt_hash: Optional[str],
+               status: str, output_path: Optional[str] = None):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (file_id, llm_type, model_key(model), prompt_hash, status, output_path, time.time())
+            )
+            self.conn.commit()
+
+    # Recording in a thread so SQLite never blocks the event loop
+    async def arecord(self, *args, **kwargs):
+        await asyncio.to_thread(self.record, *args, **kwargs)
+
+    def is_complete(self, file_id: str, llm_type: str, model: str) -> bool:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM completions WHERE llm_type = ? AND model = ? AND file_id = ? AND status IN (?, ?)",
+                (llm_type, model_key(model), file_id, *DONE_STATUSES)
+            ).fetchone()
+        return row is not None
+
+    # file_ids with a finished output, for one model or any model of llm_type
+    def completed(self, llm_type: str, model: Optional[str] = None) -> set:
+        query = "SELECT file_id FROM completions WHERE llm_type = ? AND status IN (?, ?)"
+        params = [llm_type, *DONE_STATUSES]
+        if model is not None:
+            query += " AND model = ?"
+            params.append(model_key(model))
+        with self._lock:
+            return {row[0] for row in self.conn.execute(query, params)}
+
+    # The given file_ids that still lack a finished output, in order
+    def missing(self, file_ids: Iterable[str], llm_type: str, model: Optional[str] = None) -> List[str]:
+        done = self.completed(llm_type, model)
+        return [file_id for file_id in file_ids if file_id not in done]
+
+    def counts(self) -> List[tuple]:
+        with self._lock:
+            return self.conn.execute(
+                "SELECT llm_type, model, status, COUNT(*) FROM completions "
+                "GROUP BY llm_type, model, status ORDER BY llm_type, model, status"
+            ).fetchall()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+# ------------------------------- RUNNING --------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the extraction completion index")
+    parser.add_argument("index", nargs="?", default=INDEX_PATH)
+    parser.add_argument("--missing", metavar="LLM_TYPE", help="print file_ids in the input without a complete output")
+    parser.add_argument("--model", help="restrict --missing to one model")
+    parser.add_argument("--input", default=INPUT_CSV)
+    args = parser.parse_args()
+
+    index = CompletionIndex(args.index)
+    if args.missing:
+        file_ids = (
+            file_id
+            for chunk in iter_chunks(args.input, columns=("file_id",), chunksize=100000)
+            for file_id in chunk["file_id"]
+        )
+        for file_id in index.missing(file_ids, args.missing, args.model):
+            print(file_id)
+    else:
+        for llm_type, model, status, n in index.counts():
+            print(f"{llm_type:<10} {model:<45} {status:<13} {n:,}")
+    index.close()
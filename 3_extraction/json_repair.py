@@ -0,0 +1,105 @@
+# -----------------------------------------------------------------------------
+## Summary: Cheap local repair of model outputs that are almost valid JSON, so
+## they don't have to be extracted again. In order, it strips markdown code
+## fences, keeps the outermost {...} object (dropping any prose around it),
+## removes trailing commas, and closes JSON cut off by the token limit: an open
+## string is ended, and the text is cut back to the last complete value with
+## the open arrays and objects closed. Outputs that still don't parse are left
+## for re-extraction.
+# -----------------------------------------------------------------------------
+
+# Importing Libraries
+import re
+import json
+from typing import List, Optional, Tuple
+
+FENCE = re.compile(r"^\s*```[a-zA-Z]*\s*\n?|\n?\s*```\s*$")
+TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+# Cut points tried, from the end, when closing truncated JSON
+MAX_CUTS = 50
+
+class InvalidJSONOutput(ValueError):
+
+    # An output that can't be repaired; dead-lettered for re-extraction
+    error_class = "invalid_json"
+
+def _loads(text: str) -> Optional[dict]:
+    try:
+        parsed = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+# Closings to try for JSON that stops part way: the whole text with its open
+# string and brackets closed, then the text cut back at each earlier comma
+def _closings(text: str) -> List[str]:
+    stack = []
+    in_string = False
+    escaped = False
+    cuts = []
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+        elif ch == ",":
+            cuts.append((i, "".join(reversed(stack))))
+
+    closers = "".join(reversed(stack))
+    tail = text[:-1] if escaped else text
+    if in_string:
+        tail += '"'
+    tail = tail.rstrip().rstrip(",")
+    candidates = [tail + closers]
+    if tail.endswith(":"):
+        candidates.append(tail + " null" + closers)
+    candidates += [text[:i] + closing for i, closing in reversed(cuts[-MAX_CUTS:])]
+    return candidates
+
+# A parseable version of the output, or None if it can't be recovered
+def repair_json(text: Optional[str]) -> Optional[str]:
+    if not text:
+        return None
+    if _loads(text) is not None:
+        return text
+
+    body = FENCE.sub("", text.strip())
+    start = body.find("{")
+    if start < 0:
+        return None
+    body = body[start:]
+
+    # Complete object with prose or trailing commas around it
+    end = body.rfind("}")
+    if end >= 0:
+        for candidate in (body[:end + 1], TRAILING_COMMA.sub(r"\1", body[:end + 1])):
+            parsed = _loads(candidate)
+            if parsed is not None:
+                return json.dumps(parsed, ensure_ascii=False, indent=2)
+
+    # Truncated object
+    for candidate in _closings(TRAILING_COMMA.sub(r"\1", body)):
+        parsed = _loads(candidate)
+        if parsed is not None:
+            return json.dumps(parsed, ensure_ascii=False, indent=2)
+    return None
+
+# The text to save for an output and its status: "complete" when it parsed as
+# returned, "repaired" when it parsed after repair, otherwise "invalid_json"
+def repair_output(text: Optional[str]) -> Tuple[str, str]:
+    repaired = repair_json(text)
+    if repaired is None:
+        return text or "", "invalid_json"
+    return repaired, "complete" if repaired == text else "repaired"
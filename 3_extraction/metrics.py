@@ -0,0 +1,160 @@
+# -----------------------------------------------------------------------------
+## Summary: Streaming run metrics for the extraction scripts. Each result is
+## appended to a per-run metrics JSONL as soon as it finishes (status,
+## latency, tokens, queue wait, retries) and folded into running totals, so
+## nothing grows with the corpus and a crashed run keeps its timing data up to
+## the last flush. Latencies go into a log-spaced histogram, which gives
+## p50/p95/p99 at any point. A progress line with throughput, percentiles and
+## an ETA is printed every PROGRESS_EVERY seconds.
+# -----------------------------------------------------------------------------
+
+# Importing Libraries
+import json
+import time
+import bisect
+import threading
+from typing import Any, Dict, Optional
+
+# Latency histogram edges in seconds: 0.05s up to about an hour, 15% apart
+LATENCY_EDGES = [0.05 * 1.15 ** i for i in range(80)]
+
+# Seconds between progress lines, and records buffered before a flush
+PROGRESS_EVERY = 30
+FLUSH_EVERY = 100
+
+# Result fields written to the metrics file
+RECORD_FIELDS = (
+    "file_id", "status", "reason", "time", "tokens", "cached_tokens",
+    "queue_wait", "attempts", "chunks", "cached", "output_status", "error_class"
+)
+
+
+class RunMetrics:
+
+    def __init__(self, path: str, name: str, total: Optional[int] = None):
+        self.path = path
+        self.name = name
+        self.total = total
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+        self._unflushed = 0
+
+        self.start = time.perf_counter()
+        self.last_progress = self.start
+        self.counts = {"success": 0, "error": 0, "skipped": 0}
+        self.tokens = 0
+        self.cached_tokens = 0
+        self.retries = 0
+        self.repaired = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self.latency_hist = [0] * (len(LATENCY_EDGES) + 1)
+        self.queue_wait_sum = 0.0
+        self.queue_wait_count = 0
+        self.queue_wait_max = 0.0
+
+    # Recording one finished result; safe to call from the producer's thread
+    def add(self, result: Dict[str, Any]):
+        status = result.get("status", "error")
+        record = {k: result[k] for k in RECORD_FIELDS if result.get(k) is not None}
+        record["status"] = status
+        record["at"] = round(time.perf_counter() - self.start, 3)
+
+        with self._lock:
+            self.counts[status] = self.counts.get(status, 0) + 1
+            self.retries += max(result.get("attempts", 1) - 1, 0) if "attempts" in result else 0
+            if result.get("cached"):
+                self.cache_hits += 1
+            elif result.get("cached") is False:
+                self.cache_misses += 1
+
+            if status == "success":
+                self.repaired += result.get("output_status") == "repaired"
+                self.tokens += result.get("tokens") or 0
+                self.cached_tokens += result.get("cached_tokens") or 0
+                if result.get("time") is not None:
+                    self.latency_sum += result["time"]
+                    self.latency_count += 1
+                    self.latency_hist[bisect.bisect_left(LATENCY_EDGES, result["time"])] += 1
+                if result.get("queue_wait"):
+                    self.queue_wait_sum += result["queue_wait"]
+                    self.queue_wait_count += 1
+                    self.queue_wait_max = max(self.queue_wait_max, result["queue_wait"])
+
+            self._file.write(json.dumps(record) + "\n")
+            self._unflushed += 1
+            if self._unflushed >= FLUSH_EVERY:
+                self._flush()
+
+            now = time.perf_counter()
+            if now - self.last_progress >= PROGRESS_EVERY:
+                self.last_progress = now
+                self._flush()
+                print(self.progress_line())
+
+    def _flush(self):
+        self._file.flush()
+        self._unflushed = 0
+
+    # Upper edge of the histogram bucket holding the q-th quantile
+    def percentile(self, q: float) -> float:
+        if not self.latency_count:
+            return 0.0
+        target = q * self.latency_count
+        seen = 0
+        for i, n in enumerate(self.latency_hist):
+            seen += n
+            if seen >= target:
+                return LATENCY_EDGES[min(i, len(LATENCY_EDGES) - 1)]
+        return LATENCY_EDGES[-1]
+
+    # Requests answered per second so far, and seconds left at that rate
+    def throughput(self) -> float:
+        elapsed = time.perf_counter() - self.start
+        done = self.counts["success"] + self.counts["error"]
+        return done / elapsed if elapsed > 0 else 0.0
+
+    def eta(self) -> Optional[float]:
+        if self.total is None:
+            return None
+        remaining = self.total - self.counts["success"] - self.counts["error"]
+        rate = self.throughput()
+        return max(remaining, 0) / rate if rate > 0 else None
+
+    def progress_line(self) -> str:
+        done = self.counts["success"] + self.counts["error"]
+        total = f"/{self.total:,}" if self.total is not None else ""
+        eta = self.eta()
+        eta_text = f" | ETA {eta / 60:.0f}m" if eta is not None else ""
+        return (
+            f"  [{self.name}] {done:,}{total} done ({self.counts['error']:,} errors) | "
+            f"{self.throughput():.2f} files/s | p50 {self.percentile(0.5):.1f}s "
+            f"p95 {self.percentile(0.95):.1f}s p99 {self.percentile(0.99):.1f}s{eta_text}"
+        )
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "files_read": sum(self.counts.values()),
+                "success_count": self.counts["success"],
+                "error_count": self.counts["error"],
+                "skipped_count": self.counts["skipped"],
+                "retry_count": self.retries,
+                "repaired_count": self.repaired,
+                "avg_time_per_request": self.latency_sum / self.latency_count if self.latency_count else 0,
+                "latency_p50": self.percentile(0.5),
+                "latency_p95": self.percentile(0.95),
+                "latency_p99": self.percentile(0.99),
+                "avg_queue_wait": self.queue_wait_sum / self.queue_wait_count if self.queue_wait_count else 0,
+                "max_queue_wait": self.queue_wait_max,
+                "total_tokens": self.tokens,
+                "total_cached_tokens": self.cached_tokens,
+                "cache": {"hits": self.cache_hits, "misses": self.cache_misses},
+                "metrics_path": self.path,
+            }
+
+    def close(self):
+        with self._lock:
+            self._file.close()
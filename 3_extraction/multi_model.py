@@ -11,14 +11,31 @@
 
 # Importing Libraries
 import os
+import sys
 import json
 import time
+import hashlib
 import asyncio
-import pandas as pd
+import argparse
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Optional
 import config
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "1_loading_data"))
+from text_loader import iter_texts
+from reduce_texts import reduced_csv, document_count
+from scheduler import run_fan_out
+from rate_limiter import AdaptiveLimiter, estimate_tokens
+from retry import with_retries, classify_error, DeadLetterQueue
+from response_cache import ResponseCache, cache_key, is_cacheable
+from chunking import split_complaint, combine_chunk_results, PartialExtraction
+from transport import shared_http_client, connection_stats, close_all
+from completion_index import CompletionIndex
+from json_repair import repair_output, InvalidJSONOutput
+from output_sink import OutputSink
+from metrics import RunMetrics
+
 # Importing LLMs
 from openai import AsyncOpenAI
 from anthropic import AsyncAnthropic
@@ -28,11 +45,38 @@ from google.generativeai.types import HarmCategory, HarmBlockThreshold
 # File Paths
 PROMPT_FILE = "3_extraction/prompt.txt"
 INPUT_CSV = "data/overview_data/filtered_texts.csv"
+REDUCED_CSV = "data/overview_data/reduced_texts.csv"
 BASE_OUTPUT_DIR = "data/extract15"
 
-# Processing Parameters
+# Response cache and completion index live with the outputs they describe
+CACHE_PATH = os.path.join(BASE_OUTPUT_DIR, "response_cache.sqlite")
+INDEX_PATH = os.path.join(BASE_OUTPUT_DIR, "completions.sqlite")
+
+# Sending complaints with OCR boilerplate (page stamps, line numbers, running
+# headers) stripped out; see 1_loading_data/reduce_texts.py
+USE_REDUCED_TEXT = True
+
+# Batch API mode: requests per JSONL file, file size cap and seconds between polls
+MAX_BATCH_REQUESTS = 10000
+MAX_BATCH_BYTES = 150 * 1024 * 1024
+BATCH_POLL_INTERVAL = 60
+
+# Instruction sent as the system message to every model
+SYSTEM_MESSAGE = "You are a legal data extraction system. Respond ONLY with valid JSON."
+
+# Provider endpoints. The OpenAI and Anthropic ones honour the SDKs' usual
+# environment overrides; Llama and Deepseek share the Hugging Face router.
+# Connection pools and timeouts for each host are set in transport.py, and the
+# SDKs' own retries are turned off (max_retries=0) so retry.py is the only
+# retry layer.
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL") or "https://api.openai.com/v1"
+ANTHROPIC_BASE_URL = os.environ.get("ANTHROPIC_BASE_URL") or "https://api.anthropic.com"
+ROUTER_BASE_URL = "https://router.huggingface.co/v1"
+
+# Processing Parameters: starting and maximum concurrent requests per model.
+# Each client's limiter adapts between the two from rate limits and latency.
 BATCH_SIZE = 10 
-BATCH_DELAY = 1
+MAX_CONCURRENCY = 50
 
 # ---------------------------- CONFIGURATION ----------------------------------
 
@@ -42,7 +86,11 @@ ANTHROPIC_API_KEY = config.ANTHROPIC_API_KEY
 GOOGLE_API_KEY = config.GOOGLE_API_KEY
 HUGGINGFACE_API_KEY = config.HUGGINGFACE_API_KEY
 
-# Model Configs, all with 8192 tokens at maximum
+# Model Configs, all with 8192 tokens at maximum. rpm/tpm are the account's
+# requests and tokens per minute quotas (None leaves that dimension unlimited).
+# json_mode asks for the provider's native JSON output: response_format for
+# OpenAI-compatible APIs, response_mime_type for Gemini. Anthropic has no
+# JSON mode, so Claude outputs rely on json_repair alone.
 MODELS = {
   
     # OpenAi
@@ -50,7 +98,10 @@ MODELS = {
         "model_name": "gpt-4o-mini",
         "enabled": True,
         "client_type": "openai",
-        "max_tokens": 16384
+        "max_tokens": 16384,
+        "rpm": 5000,
+        "tpm": 2000000,
+        "json_mode": True
     },
     
     # Claude
@@ -58,7 +109,10 @@ MODELS = {
         "model_name": "claude-3-5-sonnet-20241022",
         "enabled": True, 
         "client_type": "anthropic",
-        "max_tokens": 16384
+        "max_tokens": 16384,
+        "rpm": 1000,
+        "tpm": 400000,
+        "json_mode": False
     },
     
     # Gemini
@@ -66,7 +120,10 @@ MODELS = {
         "model_name": "gemini-2.5-flash-lite",
         "enabled": True,
         "client_type": "google",
-        "max_tokens": 8192
+        "max_tokens": 8192,
+        "rpm": 4000,
+        "tpm": 4000000,
+        "json_mode": True
     },
     
     # LLaMa
@@ -74,7 +131,10 @@ MODELS = {
         "model_name": "meta-llama/Llama-3.3-70B-Instruct",
         "enabled": True,
         "client_type": "llama",
-        "max_tokens": 8192
+        "max_tokens": 8192,
+        "rpm": None,
+        "tpm": None,
+        "json_mode": False
     },
     
     # Deepseek
@@ -82,7 +142,10 @@ MODELS = {
         "model_name": "deepseek-ai/DeepSeek-V3.2:novita",
         "enabled": True,
         "client_type": "deepseek",
-        "max_tokens": 8192
+        "max_tokens": 8192,
+        "rpm": None,
+        "tpm": None,
+        "json_mode": False
     }
 }
 
@@ -91,15 +154,65 @@ MODELS = {
 # Getting the time
 timestamp = datetime.now().strftime("%Y%m%d")
 
-# Loading the data
-df = pd.read_csv(INPUT_CSV)
+# Opening the shared response cache
+response_cache = ResponseCache(CACHE_PATH)
+
+# Opening the index of finished outputs used for skip checks
+completion_index = CompletionIndex(INDEX_PATH)
 
 # Loading the prompt template
 with open(PROMPT_FILE, "r", encoding="utf-8") as f:
     prompt_template = f.read()
 
+# The static instructions go in the system block and the complaint comes last,
+# so every request to a model starts with the same prefix the provider can cache
+prompt_prefix, prompt_suffix = prompt_template.split("{complaint_text}")
+SYSTEM_PROMPT = f"{SYSTEM_MESSAGE}\n\n{prompt_prefix.rstrip()}"
+
+# Identifies the prompt an output was made with, in the completion index
+PROMPT_HASH = hashlib.sha256(f"{SYSTEM_PROMPT}{prompt_suffix}".encode("utf-8")).hexdigest()[:16]
+
+def complaint_message(complaint: str) -> str:
+    return f"{complaint}{prompt_suffix}".strip()
+
+# Complaint texts to extract from, rebuilding the reduced corpus if it is stale
+def input_csv() -> str:
+    return reduced_csv(INPUT_CSV, REDUCED_CSV) if USE_REDUCED_TEXT else INPUT_CSV
+
+# Rows in the input when known without reading it (the reduced corpus records it)
+def input_rows() -> Optional[int]:
+    return document_count(input_csv()) if USE_REDUCED_TEXT else None
+
+# Prompt tokens served from an OpenAI-style prompt cache, when reported
+def cached_prompt_tokens(usage) -> int:
+    details = getattr(usage, "prompt_tokens_details", None)
+    return getattr(details, "cached_tokens", None) or 0
+
+# Anthropic counts cache reads and writes separately from input_tokens
+def claude_tokens(usage) -> int:
+    return (
+        usage.input_tokens + usage.output_tokens
+        + (getattr(usage, "cache_creation_input_tokens", None) or 0)
+        + (getattr(usage, "cache_read_input_tokens", None) or 0)
+    )
+
 # ------------------------- CLIENT TEMPLATES -----------------------------------
 
+# Chat completions request body for the OpenAI-compatible clients
+def chat_request(client, prompt: str) -> Dict[str, Any]:
+    request = {
+        "model": client.model_name,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0,
+        "max_tokens": client.max_tokens
+    }
+    if client.json_mode:
+        request["response_format"] = {"type": "json_object"}
+    return request
+
 class LLMClient:
     
     # Class for LLMs
@@ -109,64 +222,203 @@ class LLMClient:
         self.output_dir = os.path.join(BASE_OUTPUT_DIR, f"{llm_type}_extracted_text")
         os.makedirs(self.output_dir, exist_ok=True)
         
-    # Removing already processed files
+        # Per-provider flow control and output format
+        limits = MODELS.get(llm_type, {})
+        self.json_mode = limits.get("json_mode", False)
+        self.limiter = AdaptiveLimiter(
+            llm_type,
+            rpm=limits.get("rpm"),
+            tpm=limits.get("tpm"),
+            initial_concurrency=BATCH_SIZE,
+            max_concurrency=MAX_CONCURRENCY
+        )
+        
+        # Output files, plus one consolidated JSONL for this run
+        self.sink = OutputSink(self.output_dir, f"outputs_{timestamp}.jsonl")
+        
+        # Endpoint of an httpx-based SDK client, for connection reuse stats
+        self.base_url = None
+        
+        # Requests that failed after retries, for --retry-failed
+        self.dead_letters = DeadLetterQueue(os.path.join(self.output_dir, "failures.jsonl"))
+        
+    # file_ids this model already has a complete output for, from the
+    # completion index (which reads the output folder the first time only)
     def get_existing_files(self) -> set:
-        existing_file_ids = set()
-        for fname in os.listdir(self.output_dir):
-            if not fname.endswith(".txt"):
-                continue
-            parts = fname.split("_")
-            if len(parts) >= 1:
-                existing_file_ids.add(parts[0])
-        return existing_file_ids
+        completion_index.bootstrap(self.llm_type, self.output_dir)
+        return completion_index.completed(self.llm_type, self.model_name)
+    
+    # Sending one complaint message; the instructions are SYSTEM_PROMPT
+    async def process(self, prompt: str) -> Dict[str, Any]:
+        raise NotImplementedError
     
-    async def process(self, prompt: str) -> str:
+    # Generation settings that, with the prompt, determine the response
+    def generation_params(self) -> Dict[str, Any]:
+        params = {"temperature": 0, "max_tokens": self.max_tokens}
+        if self.json_mode:
+            params["json_mode"] = True
+        return params
+    
+    # Provider batch API support (see process_with_batch)
+    supports_batch = False
+    
+    def batch_line(self, custom_id: str, prompt: str) -> Dict[str, Any]:
         raise NotImplementedError
+    
+    async def run_batch(self, requests_path: str) -> Dict[str, Dict[str, Any]]:
+        raise NotImplementedError
+    
+    # Sending a prompt through the client's limiter
+    async def generate(self, prompt: str) -> Dict[str, Any]:
+        async with self.limiter.request(estimate_tokens(SYSTEM_PROMPT, prompt)) as usage:
+            result = await self.process(prompt)
+            usage["tokens"] = result["tokens"]
+            usage["queue_wait"] = result.get("queue_wait", 0)
+        return result
 
 # Defining OpenAI client
 class OpenAIClient(LLMClient):
 
+    supports_batch = True
+
     def __init__(self, model_name: str, max_tokens: int = 8192):
         super().__init__(model_name, "openai")
-        self.client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+        self.base_url = OPENAI_BASE_URL
+        self.client = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            base_url=self.base_url,
+            max_retries=0,
+            http_client=shared_http_client(self.base_url)
+        )
         self.max_tokens = max_tokens
     
+    # Request body shared by interactive calls and batch files
+    def build_request(self, prompt: str) -> Dict[str, Any]:
+        return chat_request(self, prompt)
+    
     async def process(self, prompt: str) -> Dict[str, Any]:
-        response = await self.client.chat.completions.create(
-            model=self.model_name,
-            messages=[
-                {"role": "system", "content": "You are a legal data extraction system. Respond ONLY with valid JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0,
-            max_tokens=self.max_tokens
-        )
+        response = await self.client.chat.completions.create(**self.build_request(prompt))
         
         return {
             "content": response.choices[0].message.content,
-            "tokens": response.usage.total_tokens if hasattr(response, 'usage') else None
+            "tokens": response.usage.total_tokens if hasattr(response, 'usage') else None,
+            "cached_tokens": cached_prompt_tokens(getattr(response, "usage", None)),
+            "truncated": response.choices[0].finish_reason == "length"
         }
+    
+    def batch_line(self, custom_id: str, prompt: str) -> Dict[str, Any]:
+        return {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": self.build_request(prompt)
+        }
+    
+    # Uploading a JSONL request file, polling the batch and reading its results
+    async def run_batch(self, requests_path: str) -> Dict[str, Dict[str, Any]]:
+        with open(requests_path, "rb") as f:
+            upload = await self.client.files.create(file=f, purpose="batch")
+        batch = await self.client.batches.create(
+            input_file_id=upload.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        print(f"  [{self.llm_type}] submitted batch {batch.id} ({os.path.basename(requests_path)})")
+        
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            await asyncio.sleep(BATCH_POLL_INTERVAL)
+            batch = await self.client.batches.retrieve(batch.id)
+        print(f"  [{self.llm_type}] batch {batch.id} {batch.status}")
+        
+        # Expired batches still return whatever finished in their output file
+        results = {}
+        for result_file in (batch.output_file_id, batch.error_file_id):
+            if not result_file:
+                continue
+            content = await self.client.files.content(result_file)
+            for line in content.text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get("response") or {}
+                body = response.get("body") or {}
+                if response.get("status_code") == 200:
+                    results[record["custom_id"]] = {
+                        "content": body["choices"][0]["message"]["content"],
+                        "tokens": (body.get("usage") or {}).get("total_tokens"),
+                        "cached_tokens": ((body.get("usage") or {}).get("prompt_tokens_details") or {}).get("cached_tokens") or 0,
+                        "truncated": body["choices"][0].get("finish_reason") == "length"
+                    }
+                else:
+                    error = record.get("error") or body.get("error") or batch.status
+                    results[record["custom_id"]] = {"error": json.dumps(error)}
+        return results
 
 # Defining Anthropic Client
 class ClaudeClient(LLMClient):
 
+    supports_batch = True
+
     def __init__(self, model_name: str, max_tokens: int = 8192):
         super().__init__(model_name, "claude")
-        self.client = AsyncAnthropic(api_key=ANTHROPIC_API_KEY)
+        self.base_url = ANTHROPIC_BASE_URL
+        self.client = AsyncAnthropic(
+            api_key=ANTHROPIC_API_KEY,
+            base_url=self.base_url,
+            max_retries=0,
+            http_client=shared_http_client(self.base_url)
+        )
         self.max_tokens = max_tokens
     
+    # Request parameters shared by interactive calls and batch files
+    def build_request(self, prompt: str) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "max_tokens": self.max_tokens,
+            "temperature": 0,
+            
+            # Marking the instructions as a cacheable prefix
+            "system": [{"type": "text", "text": SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}],
+            "messages": [{"role": "user", "content": prompt}]
+        }
+    
+    def batch_line(self, custom_id: str, prompt: str) -> Dict[str, Any]:
+        return {"custom_id": custom_id, "params": self.build_request(prompt)}
+    
+    # Submitting a JSONL request file as a message batch and reading its results
+    async def run_batch(self, requests_path: str) -> Dict[str, Dict[str, Any]]:
+        with open(requests_path, "r", encoding="utf-8") as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        batch = await self.client.messages.batches.create(requests=requests)
+        print(f"  [{self.llm_type}] submitted batch {batch.id} ({os.path.basename(requests_path)})")
+        
+        while batch.processing_status != "ended":
+            await asyncio.sleep(BATCH_POLL_INTERVAL)
+            batch = await self.client.messages.batches.retrieve(batch.id)
+        print(f"  [{self.llm_type}] batch {batch.id} ended")
+        
+        results = {}
+        async for entry in await self.client.messages.batches.results(batch.id):
+            if entry.result.type == "succeeded":
+                message = entry.result.message
+                results[entry.custom_id] = {
+                    "content": message.content[0].text,
+                    "tokens": claude_tokens(message.usage),
+                    "cached_tokens": getattr(message.usage, "cache_read_input_tokens", None) or 0,
+                    "truncated": message.stop_reason == "max_tokens"
+                }
+            else:
+                results[entry.custom_id] = {"error": entry.result.type}
+        return results
+    
     async def process(self, prompt: str) -> Dict[str, Any]:
-        response = await self.client.messages.create(
-            model=self.model_name,
-            max_tokens=self.max_tokens,
-            temperature=0,
-            system="You are a legal data extraction system. Respond ONLY with valid JSON.",
-            messages=[{"role": "user", "content": prompt}]
-        )
+        response = await self.client.messages.create(**self.build_request(prompt))
         
         return {
             "content": response.content[0].text,
-            "tokens": response.usage.input_tokens + response.usage.output_tokens
+            "tokens": claude_tokens(response.usage),
+            "cached_tokens": getattr(response.usage, "cache_read_input_tokens", None) or 0,
+            "truncated": response.stop_reason == "max_tokens"
         }
 
 # Defining Gemini Client
@@ -175,6 +427,11 @@ class GeminiClient(LLMClient):
     def __init__(self, model_name: str, max_tokens: int = 8192):
         super().__init__(model_name, "gemini")
         genai.configure(api_key=GOOGLE_API_KEY)
+        self.max_tokens = max_tokens
+        
+        # One thread per request the limiter can admit. The default executor
+        # is shared and far smaller, so requests would queue for a thread.
+        self.executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix="gemini")
         
         # Removing safety blocks
         self.safety_settings = {
@@ -187,6 +444,7 @@ class GeminiClient(LLMClient):
         self.model = genai.GenerativeModel(
             model_name=model_name,
             safety_settings=self.safety_settings,
+            system_instruction=SYSTEM_PROMPT,
             
             # Defining temperature and top p and k
             generation_config={
@@ -194,31 +452,40 @@ class GeminiClient(LLMClient):
                 "top_p": 1,
                 "top_k": 1,
                 "max_output_tokens": max_tokens,
+                **({"response_mime_type": "application/json"} if self.json_mode else {}),
             }
         )
     
+    # generate_content blocks, so it runs on the client's own thread pool
+    def _generate(self, prompt: str, submitted: float) -> tuple:
+        queue_wait = time.perf_counter() - submitted
+        return self.model.generate_content(prompt), queue_wait
+    
     async def process(self, prompt: str) -> Dict[str, Any]:
-        loop = asyncio.get_event_loop()
+        loop = asyncio.get_running_loop()
         
-        # Manually adding in a prompt
-        full_prompt = (
-            "You are a legal data extraction system. Respond ONLY with valid JSON.\n\n"
-            f"{prompt}"
-        )
-        
-        response = await loop.run_in_executor(
-            None,
-            lambda: self.model.generate_content(full_prompt)
+        response, queue_wait = await loop.run_in_executor(
+            self.executor,
+            self._generate,
+            prompt,
+            time.perf_counter()
         )
         
         tokens = None
+        cached_tokens = 0
         if hasattr(response, 'usage_metadata'):
             tokens = (response.usage_metadata.prompt_token_count + 
                      response.usage_metadata.candidates_token_count)
+            cached_tokens = getattr(response.usage_metadata, "cached_content_token_count", 0) or 0
+        
+        finish_reason = response.candidates[0].finish_reason if response.candidates else None
         
         return {
             "content": response.text,
-            "tokens": tokens
+            "tokens": tokens,
+            "cached_tokens": cached_tokens,
+            "truncated": getattr(finish_reason, "name", None) == "MAX_TOKENS",
+            "queue_wait": queue_wait
         }
 
 # Defining LLaMa client
@@ -226,26 +493,23 @@ class LlamaClient(LLMClient):
 
     def __init__(self, model_name: str, max_tokens: int = 8192):
         super().__init__(model_name, "llama")
+        self.base_url = ROUTER_BASE_URL
         self.client = AsyncOpenAI(
             api_key=HUGGINGFACE_API_KEY,
-            base_url="https://router.huggingface.co/v1"
+            base_url=self.base_url,
+            max_retries=0,
+            http_client=shared_http_client(self.base_url)
         )
         self.max_tokens = max_tokens
     
     async def process(self, prompt: str) -> Dict[str, Any]:
-        response = await self.client.chat.completions.create(
-            model=self.model_name,
-            messages=[
-                {"role": "system", "content": "You are a legal data extraction system. Respond ONLY with valid JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0,
-            max_tokens=self.max_tokens
-        )
+        response = await self.client.chat.completions.create(**chat_request(self, prompt))
         
         return {
             "content": response.choices[0].message.content,
-            "tokens": response.usage.total_tokens if hasattr(response, 'usage') else None
+            "tokens": response.usage.total_tokens if hasattr(response, 'usage') else None,
+            "cached_tokens": cached_prompt_tokens(getattr(response, "usage", None)),
+            "truncated": response.choices[0].finish_reason == "length"
         }
 
 # Defining DeepSeek client
@@ -253,245 +517,558 @@ class DeepseekClient(LLMClient):
 
     def __init__(self, model_name: str, max_tokens: int = 8192):
         super().__init__(model_name, "deepseek")
+        self.base_url = ROUTER_BASE_URL
         self.client = AsyncOpenAI(
             api_key=HUGGINGFACE_API_KEY,
-            base_url="https://router.huggingface.co/v1"
+            base_url=self.base_url,
+            max_retries=0,
+            http_client=shared_http_client(self.base_url)
         )
         self.max_tokens = max_tokens
     
     async def process(self, prompt: str) -> Dict[str, Any]:
-        response = await self.client.chat.completions.create(
-            model=self.model_name,
-            messages=[
-                {"role": "system", "content": "You are a legal data extraction system. Respond ONLY with valid JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0,
-            max_tokens=self.max_tokens
-        )
+        response = await self.client.chat.completions.create(**chat_request(self, prompt))
         
         return {
             "content": response.choices[0].message.content,
-            "tokens": response.usage.total_tokens if hasattr(response, 'usage') else None
+            "tokens": response.usage.total_tokens if hasattr(response, 'usage') else None,
+            "cached_tokens": cached_prompt_tokens(getattr(response, "usage", None)),
+            "truncated": response.choices[0].finish_reason == "length"
         }
 
 
 # ---------------------------- PROCESSING LOGIC --------------------------------
 
+# Client class for each client_type in MODELS
+CLIENT_CLASSES = {
+    "openai": OpenAIClient,
+    "anthropic": ClaudeClient,
+    "google": GeminiClient,
+    "llama": LlamaClient,
+    "deepseek": DeepseekClient,
+}
+
 # Creating LLM client
 def get_client(llm_type: str, model_name: str, max_tokens: int = 8192) -> Optional[LLMClient]:
 
     client_type = MODELS[llm_type]["client_type"]
+    client_class = CLIENT_CLASSES.get(client_type)
     
-    if client_type == "openai":
-        return OpenAIClient(model_name, max_tokens)
-    elif client_type == "anthropic":
-        return ClaudeClient(model_name, max_tokens)
-    elif client_type == "google":
-        return GeminiClient(model_name, max_tokens)
-    elif client_type == "llama":
-        return LlamaClient(model_name, max_tokens)
-    elif client_type == "deepseek":
-        return DeepseekClient(model_name, max_tokens)
-    else:
+    if client_class is None:
         print(f"Unknown client type: {client_type}")
         return None
+    return client_class(model_name, max_tokens)
 
-# Processing a single row at a time
-async def process_single_row(
-    row, 
-    index: int, 
-    client: LLMClient, 
-    existing_files: set,
-    semaphore: asyncio.Semaphore
-) -> Dict[str, Any]:
+# Validating, repairing and saving one model output, then recording it in the
+# completion index. Returns "complete", "repaired", "invalid_json", or "partial"
+# for a chunk merge missing some chunks, which isn't counted as finished.
+async def save_output(client: LLMClient, file_id: str, output_text: str, partial: bool = False) -> str:
+    
+    # Fixing fences, trailing commas and truncation locally where possible
+    output_text, status = repair_output(output_text)
+    if status == "invalid_json":
+        print(f"Warning: {file_id} ({client.llm_type}) returned invalid JSON")
+    elif partial:
+        print(f"Warning: {file_id} ({client.llm_type}) is missing chunks that returned invalid JSON")
+        status = "partial"
+    
+    # Saving the output with the model name and time, off the event loop
+    save_path = await client.sink.asave(
+        f"{file_id}_{client.model_name.replace('/', '-')}_{timestamp}.txt",
+        output_text,
+        {
+            "file_id": file_id,
+            "llm_type": client.llm_type,
+            "model": client.model_name,
+            "timestamp": timestamp,
+            "status": status
+        }
+    )
+    await completion_index.arecord(
+        file_id, client.llm_type, client.model_name, PROMPT_HASH, status, save_path
+    )
+    return status
+
+# Extracting each chunk of a long complaint concurrently, then merging them.
+# When one chunk fails for good the others are cancelled, as the document
+# will be re-extracted whole and their tokens would be wasted.
+async def extract_chunks(client: LLMClient, messages: list) -> tuple:
+    tasks = [
+        asyncio.ensure_future(with_retries(lambda message=message: client.generate(message)))
+        for message in messages
+    ]
+    try:
+        outcomes = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    result = combine_chunk_results([r for r, _ in outcomes])
+    return result, sum(attempts for _, attempts in outcomes)
+
+# Everything about a row that doesn't depend on the model, built once per row
+def prepare_document(file_id: str, complaint: str) -> Dict[str, Any]:
+    
+    # Long complaints are split on section headings and extracted in parts
+    chunks = split_complaint(complaint)
+    return {
+        "file_id": file_id,
+        "complaint": complaint,
+        "messages": [complaint_message(chunk) for chunk in chunks]
+    }
 
-    async with semaphore:
-        file_id = row.get("file_id", f"index{index}")
+# Processing a single prepared document with one model
+async def process_single_row(doc: Dict[str, Any], client: LLMClient) -> Dict[str, Any]:
+
+    file_id = doc["file_id"]
+    messages = doc["messages"]
+    
+    # Starting timer
+    start_time = time.perf_counter()
+    
+    # Getting the client response, from the cache or retrying transient errors
+    try:
+        key = cache_key(
+            client.model_name,
+            SYSTEM_MESSAGE,
+            prompt_template,
+            doc["complaint"],
+            client.generation_params()
+        )
+        cached = await response_cache.aget(key)
+        if cached is not None:
+            result = {"content": cached["content"], "tokens": 0}
+            attempts = 0
+        else:
+            if len(messages) == 1:
+                result, attempts = await with_retries(lambda: client.generate(messages[0]))
+            else:
+                result, attempts = await extract_chunks(client, messages)
+            if is_cacheable(result["content"], result.get("truncated", False)):
+                await response_cache.aput(key, result["content"], result["tokens"])
+        output_status = await save_output(
+            client, file_id, result["content"], partial=bool(result.get("missing_chunks"))
+        )
         
-        # Skipping if exists already
-        if file_id in existing_files:
-            return {
-                "status": "skipped",
-                "file_id": file_id,
-                "llm_type": client.llm_type,
-                "reason": "already_saved"
-            }
+        # Outputs that can't be repaired, and merges missing chunks, are queued
+        # for re-extraction
+        if output_status in ("invalid_json", "partial"):
+            if output_status == "invalid_json":
+                error = InvalidJSONOutput("output is not valid JSON and could not be repaired")
+            else:
+                error = PartialExtraction(f"{result['missing_chunks']} of {len(messages)} chunks returned invalid JSON")
+            error.attempts = attempts
+            raise error
         
-        # Getting complaint text from the row
-        complaint = row["text_content"]
+        # Time taken
+        elapsed = time.perf_counter() - start_time
+        await client.dead_letters.arecord_success(file_id)
         
-        # If doesn't exist or is empty then skipping
-        if not isinstance(complaint, str) or len(complaint) == 0:
-            return {
-                "status": "skipped",
-                "file_id": file_id,
-                "llm_type": client.llm_type,
-                "reason": "empty_text"
-            }
+        # Returning result
+        return {
+            "status": "success",
+            "file_id": file_id,
+            "llm_type": client.llm_type,
+            "model": client.model_name,
+            "time": elapsed,
+            "tokens": result["tokens"],
+            "cached_tokens": result.get("cached_tokens", 0),
+            "queue_wait": result.get("queue_wait", 0),
+            "chunks": len(messages),
+            "attempts": attempts,
+            "cached": cached is not None,
+            "output_status": output_status
+        }
         
-        # Adding the complaint text and prompt
-        extraction_prompt = prompt_template.replace("{complaint_text}", complaint)
+    except Exception as e:
+        elapsed = time.perf_counter() - start_time
+        error_class = getattr(e, "error_class", None) or classify_error(e)
+        attempts = getattr(e, "attempts", 1)
         
-        # Starting timer
-        start_time = time.perf_counter()
+        # Logging the failure so it can be re-driven with --retry-failed
+        await client.dead_letters.arecord_failure(
+            file_id,
+            llm_type=client.llm_type,
+            model=client.model_name,
+            error_class=error_class,
+            error=str(e),
+            attempts=attempts
+        )
         
-        # Getting the client response
+        return {
+            "status": "error",
+            "file_id": file_id,
+            "llm_type": client.llm_type,
+            "model": client.model_name,
+            "error": str(e),
+            "error_class": error_class,
+            "attempts": attempts,
+            "time": elapsed
+        }
+
+# Streaming per-request metrics for one model's run
+def open_metrics(client: LLMClient, retry_failed: bool = False, total: Optional[int] = None) -> RunMetrics:
+    suffix = "_retry" if retry_failed else ""
+    path = os.path.join(
+        client.output_dir,
+        f"metrics_{client.model_name.replace('/', '-')}_{timestamp}{suffix}.jsonl"
+    )
+    return RunMetrics(path, client.llm_type, total=total)
+
+# Printing and saving the per-model summary of a run
+def summarize_results(
+    llm_type: str,
+    config: Dict[str, Any],
+    client: LLMClient,
+    metrics: RunMetrics,
+    runtime: float,
+    mode: str = "interactive",
+    retry_failed: bool = False
+) -> Dict[str, Any]:
+
+    metrics.close()
+    stats = metrics.summary()
+
+    print(f"\n{llm_type.upper()} Results:")
+    print(f"  Runtime: {runtime:.2f}s")
+    print(f"  Files read: {stats['files_read']}")
+    print(f"  Success: {stats['success_count']} | Errors: {stats['error_count']} | "
+          f"Skipped: {stats['skipped_count']} | Retries: {stats['retry_count']} | Repaired: {stats['repaired_count']}")
+    print(f"  Avg time per file: {stats['avg_time_per_request']:.2f}s | p50 {stats['latency_p50']:.1f}s | "
+          f"p95 {stats['latency_p95']:.1f}s | p99 {stats['latency_p99']:.1f}s")
+    if stats["max_queue_wait"]:
+        print(f"  Thread pool wait: {stats['avg_queue_wait']:.2f}s avg | {stats['max_queue_wait']:.2f}s max")
+    print(f"  Total tokens: {stats['total_tokens']:,} ({stats['total_cached_tokens']:,} prompt tokens from provider cache)")
+    print(f"  Cache hits: {stats['cache']['hits']} | Cache misses: {stats['cache']['misses']}")
+    print(f"  Final concurrency: {client.limiter.limit:.1f} | Rate limited: {client.limiter.rate_limit_hits}x")
+    if client.base_url:
+        transport = connection_stats(client.base_url)
+        print(f"  Connections: {transport['connections_opened']} opened for {transport['requests']} requests "
+              f"({transport['reuse_rate']:.0%} reused, shared by every model on {transport['host']})")
+    if runtime > 0:
+        print(f"  Throughput: {stats['success_count'] / runtime:.2f} files/sec")
+    print(f"  Per-request metrics: {stats['metrics_path']}")
+
+    summary = {
+        "llm_type": llm_type,
+        "model_name": config["model_name"],
+        "timestamp": timestamp,
+        "mode": mode,
+        "retry_failed": retry_failed,
+        "total_runtime": runtime,
+        **stats,
+        "limiter": client.limiter.stats(),
+        "transport": connection_stats(client.base_url) if client.base_url else None,
+    }
+
+    # Retry passes get their own file so they don't replace the main run's summary
+    suffix = "_retry" if retry_failed else ""
+    summary_path = os.path.join(client.output_dir, f"summary_{timestamp}{suffix}.json")
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+
+    return summary
+
+# Processing rows with several LLMs, reading and preparing each row only once
+async def process_models(models: Dict[str, Dict[str, Any]], retry_failed: bool = False) -> Dict[str, Dict[str, Any]]:
+
+    clients = {}
+    configs = {}
+    for llm_type, config in models.items():
+        if not config["enabled"]:
+            print(f"Skipping {llm_type.upper()} (disabled)")
+            continue
+        print(f"\nStarting {llm_type.upper()} extraction")
+        print(f"Model: {config['model_name']}")
         try:
-            result = await client.process(extraction_prompt)
-            output_text = result["content"]
+            client = get_client(llm_type, config["model_name"], config.get('max_tokens', 8192))
+        except Exception as e:
+            print(f"ERROR: {llm_type.upper()} processing failed - {str(e)}")
+            continue
+        if client is not None:
+            clients[llm_type] = client
+            configs[llm_type] = config
+    
+    existing_files = {llm_type: client.get_existing_files() for llm_type, client in clients.items()}
+    
+    # Only re-driving each model's dead-lettered file_ids in retry mode
+    pending = None
+    file_ids = None
+    if retry_failed:
+        pending = {}
+        for llm_type, client in clients.items():
+            pending[llm_type] = client.dead_letters.pending()
+            print(f"Retrying {len(pending[llm_type])} failed files for {llm_type.upper()}")
+        clients = {llm_type: client for llm_type, client in clients.items() if pending[llm_type]}
+        file_ids = set().union(*pending.values())
+    
+    if not clients:
+        return {}
+    
+    # Documents each model still has to send, for the ETA in its progress lines
+    rows = input_rows()
+    totals = {
+        llm_type: len(pending[llm_type]) if pending is not None
+        else (max(rows - len(existing_files[llm_type]), 0) if rows is not None else None)
+        for llm_type in clients
+    }
+    metrics = {
+        llm_type: open_metrics(client, retry_failed, total=totals[llm_type])
+        for llm_type, client in clients.items()
+    }
+    total_start = time.perf_counter()
+    runtimes = {}
+    
+    # One pass over the input; each row goes to the models that still need it.
+    # Runs in the producer's thread, so the skip records are added there.
+    def documents():
+        for index, (file_id, complaint) in enumerate(iter_texts(input_csv(), file_ids=file_ids)):
+            if not isinstance(file_id, str):
+                file_id = f"index{index}"
             
-            # Validate JSON output
-            try:
-                json.loads(output_text)
-            except json.JSONDecodeError:
-                print(f"Warning: {file_id} ({client.llm_type}) returned invalid JSON")
+            targets = []
+            for llm_type in clients:
+                if pending is not None and file_id not in pending[llm_type]:
+                    continue
+                if file_id in existing_files[llm_type]:
+                    metrics[llm_type].add({"status": "skipped", "file_id": file_id, "reason": "already_saved"})
+                elif not isinstance(complaint, str) or len(complaint) == 0:
+                    metrics[llm_type].add({"status": "skipped", "file_id": file_id, "reason": "empty_text"})
+                else:
+                    targets.append(llm_type)
             
-            # Saving the output with the model name and time
-            save_path = os.path.join(
-                client.output_dir,
-                f"{file_id}_{client.model_name.replace('/', '-')}_{timestamp}.txt"
+            if targets:
+                yield targets, prepare_document(file_id, complaint)
+    
+    # Recording and printing each result as soon as it finishes
+    def on_result(llm_type, result):
+        if isinstance(result, Exception):
+            metrics[llm_type].add({"status": "error", "error": str(result)})
+            return
+        
+        metrics[llm_type].add(result)
+        
+        if result["status"] == "success":
+            print(f"  [{llm_type}] {result['file_id']} completed in {result['time']:.2f}s ({result.get('tokens', 'N/A')} tokens)")
+        elif result["status"] == "error":
+            print(f"  [{llm_type}] {result['file_id']} error: {result.get('error', 'Unknown')}")
+    
+    def on_done(llm_type):
+        runtimes[llm_type] = time.perf_counter() - total_start
+    
+    # Long-lived workers per model; each client's limiter decides how many are sending
+    await run_fan_out(
+        documents(),
+        {llm_type: (lambda doc, client=client: process_single_row(doc, client)) for llm_type, client in clients.items()},
+        n_workers=MAX_CONCURRENCY,
+        on_result=on_result,
+        on_done=on_done
+    )
+    
+    summaries = {}
+    for llm_type, client in clients.items():
+        try:
+            summaries[llm_type] = summarize_results(
+                llm_type, configs[llm_type], client, metrics[llm_type], runtimes[llm_type],
+                retry_failed=retry_failed
             )
-            
-            # Saving as a text file
-            with open(save_path, "w", encoding="utf-8") as f:
-                f.write(output_text)
-            
-            # Time taken
-            elapsed = time.perf_counter() - start_time
-            
-            # Returning result
-            return {
-                "status": "success",
-                "file_id": file_id,
-                "llm_type": client.llm_type,
-                "model": client.model_name,
-                "time": elapsed,
-                "tokens": result["tokens"]
-            }
-            
         except Exception as e:
-            elapsed = time.perf_counter() - start_time
-            return {
-                "status": "error",
-                "file_id": file_id,
-                "llm_type": client.llm_type,
-                "model": client.model_name,
-                "error": str(e),
-                "time": elapsed
-            }
+            print(f"ERROR: {llm_type.upper()} processing failed - {str(e)}")
+    return summaries
 
 # Processing rows with a single LLM
-async def process_with_llm(llm_type: str, config: Dict[str, Any]) -> Dict[str, Any]:
+async def process_with_llm(llm_type: str, config: Dict[str, Any], retry_failed: bool = False) -> Dict[str, Any]:
+    summaries = await process_models({llm_type: config}, retry_failed)
+    return summaries.get(llm_type)
+
+# Processing rows with a single LLM through the provider's batch API
+async def process_with_batch(llm_type: str, config: Dict[str, Any], retry_failed: bool = False) -> Dict[str, Any]:
 
     if not config["enabled"]:
         print(f"Skipping {llm_type.upper()} (disabled)")
         return None
     
-    print(f"\nStarting {llm_type.upper()} extraction")
+    max_tokens = config.get('max_tokens', 8192)
+    client = get_client(llm_type, config["model_name"], max_tokens)
+    if client is None:
+        return None
+    
+    # Providers without a batch endpoint run interactively instead
+    if not client.supports_batch:
+        print(f"{llm_type.upper()} has no batch API, running interactively")
+        return await process_with_llm(llm_type, config, retry_failed)
+    
+    print(f"\nStarting {llm_type.upper()} batch extraction")
     print(f"Model: {config['model_name']}")
     
     total_start = time.perf_counter()
     
     try:
-        max_tokens = config.get('max_tokens', 8192)
-        client = get_client(llm_type, config["model_name"], max_tokens)
-        if client is None:
-            return None
-        
         existing_files = client.get_existing_files()
-        semaphore = asyncio.Semaphore(BATCH_SIZE)
+        file_ids = client.dead_letters.pending() if retry_failed else None
         
-        tasks = [
-            process_single_row(row, i, client, existing_files, semaphore)
-            for i, row in df.iterrows()
-        ]
+        batch_dir = os.path.join(client.output_dir, "batches")
+        os.makedirs(batch_dir, exist_ok=True)
         
-        results = []
-        for i in range(0, len(tasks), BATCH_SIZE):
-            batch = tasks[i:i + BATCH_SIZE]
-            batch_results = await asyncio.gather(*batch, return_exceptions=True)
+        metrics = open_metrics(client, retry_failed)
+        cache_keys = {}
+        chunk_ids = {}
+        request_files = {}
+        out = None
+        n_bytes = 0
+        
+        # Writing JSONL request files, split by request count and size
+        for i, (file_id, complaint) in enumerate(iter_texts(input_csv(), file_ids=file_ids)):
+            if not isinstance(file_id, str):
+                file_id = f"index{i}"
+            if file_id in existing_files:
+                metrics.add({"status": "skipped", "file_id": file_id, "reason": "already_saved"})
+                continue
+            if not isinstance(complaint, str) or len(complaint) == 0:
+                metrics.add({"status": "skipped", "file_id": file_id, "reason": "empty_text"})
+                continue
             
-            for result in batch_results:
-                if isinstance(result, Exception):
-                    results.append({
-                        "status": "error",
-                        "error": str(result),
-                        "llm_type": llm_type
-                    })
-                else:
-                    results.append(result)
-                    
-                    if result["status"] == "success":
-                        print(f"  [{llm_type}] {result['file_id']} completed in {result['time']:.2f}s ({result.get('tokens', 'N/A')} tokens)")
-                    elif result["status"] == "skipped":
-                        pass
-                    else:
-                        print(f"  [{llm_type}] {result['file_id']} error: {result.get('error', 'Unknown')}")
+            key = cache_key(client.model_name, SYSTEM_MESSAGE, prompt_template, complaint, client.generation_params())
+            cached = await response_cache.aget(key)
+            if cached is not None:
+                await save_output(client, file_id, cached["content"])
+                metrics.add({
+                    "status": "success", "file_id": file_id, "llm_type": llm_type,
+                    "model": client.model_name, "time": None, "tokens": 0, "cached": True
+                })
+                continue
+            
+            # Long complaints become one request per chunk, merged on the way back
+            messages = prepare_document(file_id, complaint)["messages"]
+            custom_ids = [file_id] if len(messages) == 1 else [f"{file_id}-chunk{n}" for n in range(len(messages))]
+            chunk_ids[file_id] = custom_ids
+            cache_keys[file_id] = key
             
-            if i + BATCH_SIZE < len(tasks) and BATCH_DELAY > 0:
-                await asyncio.sleep(BATCH_DELAY)
+            for custom_id, message in zip(custom_ids, messages):
+                line = json.dumps(client.batch_line(custom_id, message), ensure_ascii=False) + "\n"
+                line_bytes = len(line.encode("utf-8"))
+                
+                if out is None or len(request_files[out.name]) >= MAX_BATCH_REQUESTS or n_bytes + line_bytes > MAX_BATCH_BYTES:
+                    if out is not None:
+                        out.close()
+                    path = os.path.join(batch_dir, f"requests_{timestamp}_{len(request_files):03d}.jsonl")
+                    out = open(path, "w", encoding="utf-8")
+                    request_files[path] = []
+                    n_bytes = 0
+                
+                out.write(line)
+                n_bytes += line_bytes
+                request_files[out.name].append(custom_id)
         
-        total_end = time.perf_counter()
+        if out is not None:
+            out.close()
         
-        success_count = sum(1 for r in results if r.get("status") == "success")
-        error_count = sum(1 for r in results if r.get("status") == "error")
-        skipped_count = sum(1 for r in results if r.get("status") == "skipped")
-        success_times = [r["time"] for r in results if r.get("status") == "success"]
-        avg_time = sum(success_times) / len(success_times) if success_times else 0
-        total_tokens = sum(r.get("tokens", 0) or 0 for r in results if r.get("status") == "success")
-        
-        print(f"\n{llm_type.upper()} Results:")
-        print(f"  Runtime: {total_end - total_start:.2f}s")
-        print(f"  Success: {success_count} | Errors: {error_count} | Skipped: {skipped_count}")
-        print(f"  Avg time per file: {avg_time:.2f}s")
-        print(f"  Total tokens: {total_tokens:,}")
-        if total_end - total_start > 0:
-            print(f"  Throughput: {success_count / (total_end - total_start):.2f} files/sec")
-        
-        summary = {
-            "llm_type": llm_type,
-            "model_name": config["model_name"],
-            "timestamp": timestamp,
-            "total_runtime": total_end - total_start,
-            "success_count": success_count,
-            "error_count": error_count,
-            "skipped_count": skipped_count,
-            "avg_time_per_request": avg_time,
-            "total_tokens": total_tokens,
-            "results": results
-        }
+        n_requests = sum(len(ids) for ids in request_files.values())
+        print(f"  [{llm_type}] {n_requests} requests for {len(cache_keys)} files in {len(request_files)} batch files")
         
-        summary_path = os.path.join(client.output_dir, f"summary_{timestamp}.json")
-        with open(summary_path, "w", encoding="utf-8") as f:
-            json.dump(summary, f, indent=2)
+        # Submitting every request file and waiting for all of them
+        outcomes = await asyncio.gather(
+            *[client.run_batch(path) for path in request_files],
+            return_exceptions=True
+        )
+        
+        batch_results = {}
+        for (path, batch_ids), outcome in zip(request_files.items(), outcomes):
+            for custom_id in batch_ids:
+                if isinstance(outcome, Exception):
+                    batch_results[custom_id] = {"error": f"batch failed: {outcome}"}
+                else:
+                    batch_results[custom_id] = outcome.get(custom_id, {"error": "missing from batch output"})
         
-        return summary
+        # Unpacking results into the usual per-file outputs
+        for file_id, custom_ids in chunk_ids.items():
+            parts = [batch_results[custom_id] for custom_id in custom_ids]
+            errors = [part["error"] for part in parts if "error" in part]
+            if errors:
+                result = {"error": errors[0]}
+            elif len(parts) == 1:
+                result = parts[0]
+            else:
+                try:
+                    result = combine_chunk_results(parts)
+                except ValueError as e:
+                    result = {"error": str(e)}
+            
+            output_status = None
+            if "content" in result:
+                output_status = await save_output(
+                    client, file_id, result["content"], partial=bool(result.get("missing_chunks"))
+                )
+                if output_status == "invalid_json":
+                    result = {"error": "output is not valid JSON and could not be repaired", "error_class": "invalid_json"}
+                elif output_status == "partial":
+                    result = {
+                        "error": f"{result['missing_chunks']} of {len(parts)} chunks returned invalid JSON",
+                        "error_class": "partial"
+                    }
+            
+            if "content" in result:
+                if is_cacheable(result["content"], result.get("truncated", False)):
+                    await response_cache.aput(cache_keys[file_id], result["content"], result["tokens"])
+                await client.dead_letters.arecord_success(file_id)
+                metrics.add({
+                    "status": "success", "file_id": file_id, "llm_type": llm_type,
+                    "model": client.model_name, "time": None, "tokens": result["tokens"],
+                    "cached_tokens": result.get("cached_tokens", 0),
+                    "cached": False, "output_status": output_status
+                })
+            else:
+                error_class = result.get("error_class", "batch")
+                await client.dead_letters.arecord_failure(
+                    file_id,
+                    llm_type=llm_type,
+                    model=client.model_name,
+                    error_class=error_class,
+                    error=result["error"],
+                    attempts=1
+                )
+                metrics.add({
+                    "status": "error", "file_id": file_id, "llm_type": llm_type,
+                    "model": client.model_name, "error": result["error"], "error_class": error_class
+                })
+        
+        total_end = time.perf_counter()
+        return summarize_results(
+            llm_type, config, client, metrics, total_end - total_start,
+            mode="batch", retry_failed=retry_failed
+        )
         
     except Exception as e:
-        print(f"ERROR: {llm_type.upper()} processing failed - {str(e)}")
+        print(f"ERROR: {llm_type.upper()} batch processing failed - {str(e)}")
         return None
 
 # Main execution function
-async def main():
+async def main(retry_failed: bool = False, batch: bool = False):
 
     print(f"\n{'='*70}")
     print(f"Multi-LLM Extraction Pipeline")
     print(f"{'='*70}")
-    print(f"Total files: {len(df)}")
-    print(f"Concurrency: {BATCH_SIZE} requests per model")
+    print(f"Input: {input_csv()}")
+    print(f"Concurrency: {BATCH_SIZE}-{MAX_CONCURRENCY} requests per model (adaptive)")
     print(f"Active models: {sum(1 for c in MODELS.values() if c['enabled'])}")
     print(f"Timestamp: {timestamp}")
     print(f"{'='*70}\n")
     
     overall_start = time.perf_counter()
     
-    # Create tasks for all enabled LLMs to run in parallel
-    tasks = [
-        process_with_llm(llm_type, config) 
-        for llm_type, config in MODELS.items() 
-        if config["enabled"]
-    ]
+    # Models with a batch endpoint run on their own in batch mode; every other
+    # enabled model shares one pass over the input
+    enabled = {llm_type: config for llm_type, config in MODELS.items() if config["enabled"]}
+    batch_models = {
+        llm_type: config for llm_type, config in enabled.items()
+        if batch and getattr(CLIENT_CLASSES.get(config["client_type"]), "supports_batch", False)
+    }
+    interactive_models = {llm_type: config for llm_type, config in enabled.items() if llm_type not in batch_models}
+    
+    tasks = [process_with_batch(llm_type, config, retry_failed) for llm_type, config in batch_models.items()]
+    if interactive_models:
+        tasks.append(process_models(interactive_models, retry_failed))
     
     # Run all LLMs simultaneously
     all_summaries_list = await asyncio.gather(*tasks, return_exceptions=True)
@@ -503,14 +1080,17 @@ async def main():
     for summary in all_summaries_list:
         if isinstance(summary, Exception):
             print(f"Error in LLM processing: {str(summary)}")
-        elif summary is not None:
+        elif summary and "llm_type" in summary:
             all_summaries[summary["llm_type"]] = summary
+        elif summary:
+            all_summaries.update(summary)
     
     print(f"\n{'='*70}")
     print(f"Overall Summary")
     print(f"{'='*70}")
     print(f"Total execution time: {overall_end - overall_start:.2f}s")
     print(f"Models completed: {len(all_summaries)}")
+    print(f"Response cache: {response_cache.hits} hits | {response_cache.misses} misses | {response_cache.size / 1e6:.1f} MB")
     print(f"{'='*70}\n")
     
     for llm_type, summary in all_summaries.items():
@@ -521,13 +1101,31 @@ async def main():
         print(f"  Tokens used: {summary['total_tokens']:,}")
         print()
     
-    combined_summary_path = os.path.join(BASE_OUTPUT_DIR, f"combined_summary_{timestamp}.json")
+    suffix = "_retry" if retry_failed else ""
+    combined_summary_path = os.path.join(BASE_OUTPUT_DIR, f"combined_summary_{timestamp}{suffix}.json")
     with open(combined_summary_path, "w", encoding="utf-8") as f:
         json.dump(all_summaries, f, indent=2)
     
     print(f"Summary saved: {combined_summary_path}\n")
+    
+    response_cache.close()
+    completion_index.close()
+    await close_all()
 
 # ------------------------------- RUNNING --------------------------------------
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Multi-LLM extraction pipeline")
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="only re-run file_ids logged in each model's failures.jsonl"
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="submit requests through the provider batch APIs where available"
+    )
+    args = parser.parse_args()
+    
+    asyncio.run(main(retry_failed=args.retry_failed, batch=args.batch))
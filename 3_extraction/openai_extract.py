@@ -2,20 +2,43 @@
 import os
 import json
 import time
+import hashlib
+import sys
 import asyncio
-import pandas as pd
+import argparse
 from datetime import datetime
 from openai import AsyncOpenAI
 from tqdm.asyncio import tqdm as async_tqdm
-import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "1_loading_data"))
+from text_loader import iter_texts
+from scheduler import run_worker_pool
+from rate_limiter import AdaptiveLimiter, estimate_tokens
+from retry import with_retries, classify_error, DeadLetterQueue
+from response_cache import ResponseCache, cache_key, is_cacheable
+from completion_index import CompletionIndex
+from json_repair import repair_output, InvalidJSONOutput
+from output_sink import OutputSink
+from metrics import RunMetrics
 
 # Defining Parameters for the OpenAI Model
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "KEY")
 MODEL_NAME = "gpt-4o-mini"
 PROMPT_FILE = "3_extraction/prompt.txt"
+INPUT_CSV = "data/overview_data/filtered_texts.csv"
 OUTPUT_DIR = "data/extract/openai_extracted_text"
+CACHE_PATH = os.path.join(os.path.dirname(OUTPUT_DIR), "response_cache.sqlite")
+INDEX_PATH = os.path.join(os.path.dirname(OUTPUT_DIR), "completions.sqlite")
+SYSTEM_MESSAGE = "You are a legal data extraction system. Respond ONLY with valid JSON."
 BATCH_SIZE = 10
-BATCH_DELAY = 0.1
+MAX_CONCURRENCY = 50
+
+# Seconds before a single request is abandoned; retries are left to retry.py
+REQUEST_TIMEOUT = 300
+
+# Account quotas for MODEL_NAME, requests and tokens per minute
+RPM_LIMIT = 5000
+TPM_LIMIT = 2000000
 
 # ------------------- Setting up directories ----------------------------------
 os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -23,158 +46,242 @@ os.makedirs(OUTPUT_DIR, exist_ok=True)
 # Defining timestamp
 timestamp = datetime.now().strftime("%Y%m%d")
 
-# Loading data
-df = pd.read_csv("data/overview_data/filtered_texts.csv")
-
 # Load prompt template
 with open(PROMPT_FILE, "r", encoding="utf-8") as f:
     prompt_template = f.read()
 
-# Initialize async client
-client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+# Static instructions as the system message and the complaint last, so every
+# request shares a prefix OpenAI can serve from its prompt cache
+prompt_prefix, prompt_suffix = prompt_template.split("{complaint_text}")
+SYSTEM_PROMPT = f"{SYSTEM_MESSAGE}\n\n{prompt_prefix.rstrip()}"
+PROMPT_HASH = hashlib.sha256(f"{SYSTEM_PROMPT}{prompt_suffix}".encode("utf-8")).hexdigest()[:16]
+
+# Initialize async client and its adaptive limiter
+client = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0, timeout=REQUEST_TIMEOUT)
+limiter = AdaptiveLimiter(
+    MODEL_NAME,
+    rpm=RPM_LIMIT,
+    tpm=TPM_LIMIT,
+    initial_concurrency=BATCH_SIZE,
+    max_concurrency=MAX_CONCURRENCY
+)
+
+# Output files, plus one consolidated JSONL for this run
+sink = OutputSink(OUTPUT_DIR, f"outputs_{timestamp}.jsonl")
+
+# Shared cache of responses keyed on model, prompt and complaint text
+response_cache = ResponseCache(CACHE_PATH)
+
+# Requests that failed after retries, for --retry-failed
+dead_letters = DeadLetterQueue(os.path.join(OUTPUT_DIR, "failures.jsonl"))
 
 # ------------------- Detecting already saved files ----------------------------
 
-# Creating list of already used files.
-existing_file_ids = set()
-for fname in os.listdir(OUTPUT_DIR):
-    if not fname.endswith(".txt"):
-        continue
-    parts = fname.split("_")
-    if len(parts) >= 1:
-        existing_file_ids.add(parts[0])
-        
-        %>%
-        
+# Index of finished outputs; the folder itself is only read the first time
+completion_index = CompletionIndex(INDEX_PATH)
+completion_index.bootstrap("openai", OUTPUT_DIR)
+existing_file_ids = completion_index.completed("openai", MODEL_NAME)
+
 # ------------------- Defining Async Process to loop through -------------------
-async def process_single_row(row, index, semaphore):
-    async with semaphore: 
-        file_id = row.get("file_id", f"index{index}")
-        if file_id in existing_file_ids:
-            return {"status": "skipped", "file_id": file_id, "reason": "already_saved"}
-        complaint = row["text_content"]
-        
-        # Validating that not empty
-        if not isinstance(complaint, str) or len(complaint) == 0:
-            return {"status": "skipped", "file_id": file_id, "reason": "empty_text"}
 
-        # Preparing prompt
-        extraction_prompt = prompt_template.replace("{complaint_text}", complaint)
-        
-        # Timing requests
-        start_time = time.perf_counter()
-        
-        try:
-            response = await client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": "You are a legal data extraction system. Respond ONLY with valid JSON."
-                    },
-                    {
-                        "role": "user", 
-                        "content": extraction_prompt
-                    }
-                ],
-                temperature=0
-            )
+# Sending one extraction request through the limiter
+async def request_extraction(extraction_prompt):
+    async with limiter.request(estimate_tokens(SYSTEM_PROMPT, extraction_prompt)) as usage:
+        response = await client.chat.completions.create(
+            model=MODEL_NAME,
+            messages=[
+                {
+                    "role": "system", 
+                    "content": SYSTEM_PROMPT
+                },
+                {
+                    "role": "user", 
+                    "content": extraction_prompt
+                }
+            ],
+            temperature=0,
             
+            # Native JSON mode; json_repair handles what still slips through
+            response_format={"type": "json_object"}
+        )
+        usage["tokens"] = response.usage.total_tokens if hasattr(response, 'usage') else None
+        return response
+
+async def process_single_row(file_id, complaint, index):
+    if not isinstance(file_id, str):
+        file_id = f"index{index}"
+    if file_id in existing_file_ids:
+        return {"status": "skipped", "file_id": file_id, "reason": "already_saved"}
+    
+    # Validating that not empty
+    if not isinstance(complaint, str) or len(complaint) == 0:
+        return {"status": "skipped", "file_id": file_id, "reason": "empty_text"}
+
+    # Preparing the complaint message
+    extraction_prompt = f"{complaint}{prompt_suffix}".strip()
+    
+    # Timing requests
+    start_time = time.perf_counter()
+    
+    try:
+        # Using a cached response if this exact request was made before
+        key = cache_key(MODEL_NAME, SYSTEM_MESSAGE, prompt_template, complaint, {"temperature": 0, "json_mode": True})
+        cached = await response_cache.aget(key)
+        if cached is not None:
+            output_text = cached["content"]
+            tokens = 0
+            cached_tokens = 0
+            attempts = 0
+        else:
+            # Sending the request, retrying transient errors
+            response, attempts = await with_retries(lambda: request_extraction(extraction_prompt))
             output_text = response.choices[0].message.content
+            tokens = response.usage.total_tokens if hasattr(response, 'usage') else None
+            details = getattr(getattr(response, "usage", None), "prompt_tokens_details", None)
+            cached_tokens = getattr(details, "cached_tokens", None) or 0
             
-            # Saving the output as txt
-            save_path = os.path.join(
-                OUTPUT_DIR,
-                f"{file_id}_{MODEL_NAME}_{timestamp}.txt"
-            )
-            
-            with open(save_path, "w", encoding="utf-8") as f:
-                f.write(output_text)
-            
-            elapsed = time.perf_counter() - start_time
-            
-            return {
-                "status": "success",
-                "file_id": file_id,
-                "time": elapsed,
-                "tokens": response.usage.total_tokens if hasattr(response, 'usage') else None
-            }
-            
-        except Exception as e:
-            elapsed = time.perf_counter() - start_time
-            return {
-                "status": "error",
-                "file_id": file_id,
-                "error": str(e),
-                "time": elapsed
-            }
+            # Truncated or malformed output is not cached, so a re-run can fix it
+            truncated = response.choices[0].finish_reason == "length"
+            if is_cacheable(output_text, truncated):
+                await response_cache.aput(key, output_text, tokens)
+        
+        # Saving the output as txt, repaired where possible, atomically and off the event loop
+        output_text, status = repair_output(output_text)
+        save_path = await sink.asave(
+            f"{file_id}_{MODEL_NAME}_{timestamp}.txt",
+            output_text,
+            {"file_id": file_id, "llm_type": "openai", "model": MODEL_NAME, "timestamp": timestamp, "status": status}
+        )
+        await completion_index.arecord(file_id, "openai", MODEL_NAME, PROMPT_HASH, status, save_path)
+        
+        # Only outputs that can't be repaired are queued for re-extraction
+        if status == "invalid_json":
+            error = InvalidJSONOutput("output is not valid JSON and could not be repaired")
+            error.attempts = attempts
+            raise error
+        
+        elapsed = time.perf_counter() - start_time
+        await dead_letters.arecord_success(file_id)
+        
+        return {
+            "status": "success",
+            "file_id": file_id,
+            "time": elapsed,
+            "tokens": tokens,
+            "cached_tokens": cached_tokens,
+            "attempts": attempts,
+            "cached": cached is not None,
+            "output_status": status
+        }
+        
+    except Exception as e:
+        elapsed = time.perf_counter() - start_time
+        error_class = getattr(e, "error_class", None) or classify_error(e)
+        attempts = getattr(e, "attempts", 1)
+        
+        # Logging the failure so it can be re-driven with --retry-failed
+        await dead_letters.arecord_failure(
+            file_id,
+            model=MODEL_NAME,
+            error_class=error_class,
+            error=str(e),
+            attempts=attempts
+        )
+        
+        return {
+            "status": "error",
+            "file_id": file_id,
+            "error": str(e),
+            "error_class": error_class,
+            "attempts": attempts,
+            "time": elapsed
+        }
 
 # ------------------- Defining the async main ---------------------------------
-async def openai_main():
+async def openai_main(retry_failed=False):
     total_start = time.perf_counter()
-    semaphore = asyncio.Semaphore(BATCH_SIZE)
-    
-    tasks = [
-        process_single_row(row, i, semaphore) 
-        for i, row in df.iterrows()
-    ]
+
+    # Only re-driving the dead-lettered file_ids in retry mode
+    file_ids = dead_letters.pending() if retry_failed else None
     
-    results = []
-    for i in range(0, len(tasks), BATCH_SIZE):
-        batch = tasks[i:i + BATCH_SIZE]
-        batch_results = await asyncio.gather(*batch)
-        results.extend(batch_results)
-
-        for result in batch_results:
-            if result["status"] == "success":
-                print(f"✓ {result['file_id']} - {result['time']:.2f}s - {result.get('tokens', 'N/A')} tokens")
-            elif result["status"] == "skipped":
-                print(f"⊘ {result['file_id']} - {result['reason']}")
-            else:
-                print(f"✗ {result['file_id']} - {result['error']}")
-
-        if i + BATCH_SIZE < len(tasks):
-            await asyncio.sleep(BATCH_DELAY)
+    # Per-request records are streamed to disk; only running totals stay in memory
+    suffix = "_retry" if retry_failed else ""
+    metrics = RunMetrics(
+        os.path.join(OUTPUT_DIR, f"metrics_{timestamp}{suffix}.jsonl"),
+        "openai",
+        total=len(file_ids) if file_ids is not None else None
+    )
+
+    # Printing each result as soon as its request finishes
+    def on_result(result):
+        if isinstance(result, Exception):
+            result = {"status": "error", "file_id": None, "error": str(result)}
+        metrics.add(result)
+        if result["status"] == "success":
+            print(f"✓ {result['file_id']} - {result['time']:.2f}s - {result.get('tokens', 'N/A')} tokens")
+        elif result["status"] == "skipped":
+            print(f"⊘ {result['file_id']} - {result['reason']}")
+        else:
+            print(f"✗ {result['file_id']} - {result['error']}")
+
+    # Long-lived workers; the limiter decides how many are sending at once
+    await run_worker_pool(
+        enumerate(iter_texts(INPUT_CSV, file_ids=file_ids)),
+        lambda item: process_single_row(*item[1], item[0]),
+        n_workers=MAX_CONCURRENCY,
+        on_result=on_result
+    )
     
     total_end = time.perf_counter()
-    
-    # Getting summary stat's
-    success_count = sum(1 for r in results if r["status"] == "success")
-    error_count = sum(1 for r in results if r["status"] == "error")
-    skipped_count = sum(1 for r in results if r["status"] == "skipped")
-    success_times = [r["time"] for r in results if r["status"] == "success"]
-    avg_time = sum(success_times) / len(success_times) if success_times else 0
-    total_tokens = sum(r.get("tokens", 0) or 0 for r in results if r["status"] == "success")
+    metrics.close()
+    stats = metrics.summary()
     
     print("\n" + "="*60)
     print(f"TOTAL RUNTIME: {total_end - total_start:.2f} seconds")
-    print(f"Successful: {success_count} | Errors: {error_count} | Skipped: {skipped_count}")
-    print(f"Average time per request: {avg_time:.2f}s")
-    print(f"Total tokens used: {total_tokens:,}")
-    print(f"Throughput: {success_count / (total_end - total_start):.2f} files/second")
+    print(f"Files read: {stats['files_read']}")
+    print(f"Successful: {stats['success_count']} | Errors: {stats['error_count']} | "
+          f"Skipped: {stats['skipped_count']} | Retries: {stats['retry_count']}")
+    print(f"Average time per request: {stats['avg_time_per_request']:.2f}s | "
+          f"p50 {stats['latency_p50']:.1f}s | p95 {stats['latency_p95']:.1f}s | p99 {stats['latency_p99']:.1f}s")
+    print(f"Total tokens used: {stats['total_tokens']:,} ({stats['total_cached_tokens']:,} prompt tokens from OpenAI's cache)")
+    print(f"Cache hits: {response_cache.hits} | Cache misses: {response_cache.misses}")
+    print(f"Final concurrency: {limiter.limit:.1f} | Rate limited: {limiter.rate_limit_hits}x")
+    print(f"Throughput: {stats['success_count'] / (total_end - total_start):.2f} files/second")
     print("="*60)
     
     # Saving the summary stats
     summary = {
         "timestamp": timestamp,
+        "retry_failed": retry_failed,
         "total_runtime": total_end - total_start,
-        "success_count": success_count,
-        "error_count": error_count,
-        "skipped_count": skipped_count,
-        "avg_time_per_request": avg_time,
-        "total_tokens": total_tokens,
-        "results": results
+        **stats,
+        "limiter": limiter.stats(),
+        "cache": response_cache.stats(),
     }
     
     # Outputting the summary stats
-    summary_path = os.path.join(OUTPUT_DIR, f"summary_{timestamp}.json")
+    summary_path = os.path.join(OUTPUT_DIR, f"summary_{timestamp}{suffix}.json")
     with open(summary_path, "w", encoding="utf-8") as f:
         json.dump(summary, f, indent=2)
+    
+    response_cache.close()
+    completion_index.close()
   
 # -------------------------- Running the Function ------------------------------
 if __name__ == "__main__":
-    print(f"Starting extraction for {len(df)} files...")
-    print(f"Batch size: {BATCH_SIZE} concurrent requests")
+    parser = argparse.ArgumentParser(description="OpenAI extraction")
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="only re-run file_ids logged in failures.jsonl"
+    )
+    args = parser.parse_args()
+    
+    if args.retry_failed:
+        print(f"Retrying {len(dead_letters.pending())} failed files...")
+    else:
+        print(f"Starting extraction of {INPUT_CSV}...")
+    print(f"Concurrency: {BATCH_SIZE}-{MAX_CONCURRENCY} requests (adaptive)")
     print(f"Model: {MODEL_NAME}\n")
     
-    asyncio.run(openai_main())
+    asyncio.run(openai_main(retry_failed=args.retry_failed))
@@ -0,0 +1,64 @@
+# -----------------------------------------------------------------------------
+## Summary: Where extraction outputs are written. Each output is written to a
+## temporary file and renamed into place, so a run that is killed part way
+## never leaves a half-written .txt behind, and the write runs in a thread so
+## it doesn't block the event loop. Every output is also appended as one line
+## to a consolidated JSONL file per model and run, which downstream steps can
+## read in one pass instead of opening thousands of small files.
+# -----------------------------------------------------------------------------
+
+# Importing Libraries
+import os
+import json
+import asyncio
+import threading
+from typing import Any, Dict, Iterator, Optional
+
+
+class OutputSink:
+
+    def __init__(self, output_dir: str, jsonl_name: str):
+        self.output_dir = output_dir
+        self.jsonl_path = os.path.join(output_dir, jsonl_name)
+        os.makedirs(output_dir, exist_ok=True)
+
+        # Temp files left by a run that was killed mid-write
+        for fname in os.listdir(output_dir):
+            if fname.endswith(".tmp"):
+                os.remove(os.path.join(output_dir, fname))
+
+    # Writing one output file atomically and logging it to the run's JSONL
+    def save(self, file_name: str, text: str, record: Optional[Dict[str, Any]] = None) -> str:
+        path = os.path.join(self.output_dir, file_name)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+        if record is not None:
+            self.append({**record, "output_path": path, "content": text})
+        return path
+
+    # One write() on an O_APPEND descriptor per line, so lines from concurrent
+    # writers never interleave
+    def append(self, record: Dict[str, Any]):
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        fd = os.open(self.jsonl_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            written = 0
+            while written < len(line):
+                written += os.write(fd, line[written:])
+        finally:
+            os.close(fd)
+
+    async def asave(self, file_name: str, text: str, record: Optional[Dict[str, Any]] = None) -> str:
+        return await asyncio.to_thread(self.save, file_name, text, record)
+
+# Reading a consolidated JSONL, skipping a line cut short by a crash
+def read_outputs(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
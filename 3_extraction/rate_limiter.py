@@ -0,0 +1,205 @@
+# -----------------------------------------------------------------------------
+## Summary: Adaptive flow control for the LLM extraction clients. Each provider
+## client gets its own limiter, which keeps requests/min and tokens/min under
+## the account quota with two token buckets (prompt tokens are estimated before
+## sending and reconciled with the reported usage afterwards), and adapts how
+## many requests are in flight with AIMD: the limit grows by one slot per
+## window of successful requests, halves once per congestion window on
+## rate-limit responses, and stops growing while latency is well above its
+## baseline.
+# -----------------------------------------------------------------------------
+
+# Importing Libraries
+import time
+import math
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+
+# Rough characters-per-token ratio used to estimate prompt size before sending
+CHARS_PER_TOKEN = 4
+
+# Output tokens assumed per request until the real usage is known
+EXPECTED_OUTPUT_TOKENS = 1000
+
+# Seconds to pause all requests after a rate-limit response without Retry-After
+DEFAULT_COOLDOWN = 5.0
+
+# Latency above this multiple of the baseline stops the concurrency from growing
+LATENCY_FACTOR = 2.0
+
+# ------------------------------- HELPERS --------------------------------------
+
+# Input tokens of all the texts sent in one request, plus its expected output
+def estimate_tokens(*texts: str) -> int:
+    return sum(len(text) for text in texts) // CHARS_PER_TOKEN + EXPECTED_OUTPUT_TOKENS
+
+# HTTP status of a provider SDK exception, if it carries one
+def error_status(e: Exception) -> Optional[int]:
+    status = getattr(e, "status_code", None)
+    if status is None:
+        status = getattr(getattr(e, "response", None), "status_code", None)
+    if status is None:
+        status = getattr(e, "code", None)
+    return status if isinstance(status, int) else None
+
+# Recognizing 429s (and Anthropic's 529 overloaded) across the provider SDKs
+def is_rate_limit_error(e: Exception) -> bool:
+    if error_status(e) in (429, 529):
+        return True
+    return type(e).__name__ in ("RateLimitError", "ResourceExhausted", "OverloadedError")
+
+# Seconds the provider asked us to wait, from the Retry-After header
+def retry_after_seconds(e: Exception) -> Optional[float]:
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+# ------------------------------- LIMITER --------------------------------------
+
+class TokenBucket:
+
+    # Capacity of one minute's quota, refilled continuously
+    def __init__(self, per_minute: Optional[float]):
+        self.capacity = per_minute
+        self.rate = per_minute / 60 if per_minute else None
+        self.available = per_minute or 0
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Seconds until `amount` can be taken (oversized requests wait for a full bucket)
+    def wait_time(self, amount: float) -> float:
+        if not self.rate:
+            return 0.0
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.available) / self.rate)
+
+    def take(self, amount: float):
+        if self.rate:
+            self.available -= amount
+
+
+class AdaptiveLimiter:
+
+    def __init__(
+        self,
+        name: str,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        initial_concurrency: int = 10,
+        max_concurrency: int = 50,
+        min_concurrency: int = 1
+    ):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.limit = float(initial_concurrency)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.in_flight = 0
+        self.issued = 0
+        self.recovery_seq = 0
+        self.paused_until = 0.0
+        self.latency_ewma = None
+        self.latency_baseline = None
+        self.rate_limit_hits = 0
+        self.total_wait = 0.0
+        self._cond = None
+
+    def _wait_time(self, est_tokens: int) -> float:
+        if self.in_flight >= math.floor(self.limit):
+            return math.inf
+        return max(
+            self.paused_until - time.monotonic(),
+            self.requests.wait_time(1),
+            self.tokens.wait_time(est_tokens)
+        )
+
+    async def _acquire(self, est_tokens: int):
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        start = time.monotonic()
+        async with self._cond:
+            while True:
+                self.requests.refill()
+                self.tokens.refill()
+                wait = self._wait_time(est_tokens)
+                if wait <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(
+                        self._cond.wait(),
+                        timeout=None if wait == math.inf else wait
+                    )
+                except asyncio.TimeoutError:
+                    pass
+            self.requests.take(1)
+            self.tokens.take(est_tokens)
+            self.in_flight += 1
+            seq = self.issued
+            self.issued += 1
+        self.total_wait += time.monotonic() - start
+        return seq
+
+    async def _release(self, est_tokens: int, actual_tokens: Optional[int]):
+        async with self._cond:
+            self.in_flight -= 1
+            if actual_tokens is not None:
+                self.tokens.take(actual_tokens - est_tokens)
+            self._cond.notify_all()
+
+    # Additive increase, held back while latency is well above its baseline
+    def _on_success(self, latency: float):
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma = 0.8 * self.latency_ewma + 0.2 * latency
+        if self.latency_baseline is None or self.latency_ewma < self.latency_baseline:
+            self.latency_baseline = self.latency_ewma
+
+        if self.latency_ewma <= LATENCY_FACTOR * self.latency_baseline:
+            self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+    # Multiplicative decrease and a pause on a rate-limit response. Requests that
+    # were already in flight at the last decrease belong to the same congestion
+    # window, so their 429s extend the pause but do not halve the limit again.
+    def _on_rate_limit(self, retry_after: Optional[float], seq: int):
+        self.rate_limit_hits += 1
+        if seq >= self.recovery_seq:
+            self.limit = max(self.min_concurrency, self.limit / 2)
+            self.recovery_seq = self.issued
+        pause = retry_after if retry_after is not None else DEFAULT_COOLDOWN
+        self.paused_until = max(self.paused_until, time.monotonic() + pause)
+
+    # Wrapping one request; set usage["tokens"] to the real total when known,
+    # and usage["queue_wait"] to any time spent waiting on a local thread pool
+    # so it isn't mistaken for provider latency
+    @asynccontextmanager
+    async def request(self, est_tokens: int):
+        seq = await self._acquire(est_tokens)
+        usage = {"tokens": None, "queue_wait": 0}
+        start = time.monotonic()
+        try:
+            yield usage
+        except Exception as e:
+            if is_rate_limit_error(e):
+                self._on_rate_limit(retry_after_seconds(e), seq)
+            raise
+        else:
+            self._on_success(time.monotonic() - start - usage["queue_wait"])
+        finally:
+            await self._release(est_tokens, usage["tokens"])
+
+    def stats(self) -> dict:
+        return {
+            "concurrency_limit": round(self.limit, 2),
+            "rate_limit_hits": self.rate_limit_hits,
+            "throttle_wait": round(self.total_wait, 2),
+        }
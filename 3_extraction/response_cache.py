@@ -0,0 +1,146 @@
+# -----------------------------------------------------------------------------
+## Summary: Content-addressed on-disk cache of LLM extraction responses. Each
+## response is stored in SQLite under a hash of everything that determines it:
+## model name, system message, prompt template, complaint text and generation
+## parameters. Re-running an extraction after a crash, or adding a model that
+## shares inputs with an earlier run, returns cached responses instantly. The
+## cache is capped by size, evicting the least recently used entries first.
+## Only complete, parseable responses are stored, so re-running a document
+## that came back truncated or malformed asks the model again. The async
+## aget/aput wrappers keep SQLite work off the event loop.
+# -----------------------------------------------------------------------------
+
+# Importing Libraries
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+from json_repair import repair_json
+
+CACHE_PATH = "data/extract/response_cache.sqlite"
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+
+# Cache hits whose last_used update is held in memory before being written
+TOUCH_FLUSH_EVERY = 200
+
+def cache_key(model_name: str, system_message: str, prompt_template: str,
+              complaint: str, params: Dict[str, Any]) -> str:
+    payload = json.dumps(
+        [model_name, system_message, prompt_template, complaint, params],
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# Whether a response is worth replaying: it finished normally and parses,
+# possibly after json_repair's fixes (which are applied again on replay)
+def is_cacheable(content: Optional[str], truncated: bool = False) -> bool:
+    if truncated or not content:
+        return False
+    return repair_json(content) is not None
+
+
+class ResponseCache:
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = MAX_CACHE_BYTES):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._touched = {}
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+
+        # In WAL mode this only syncs at checkpoints; a crash can lose the last
+        # few entries, which just means asking the model again
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                tokens INTEGER,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self.conn.commit()
+        self.size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    # Hits only record their last_used time in memory; it is written in bulk
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT content, tokens FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[key] = time.time()
+            if len(self._touched) >= TOUCH_FLUSH_EVERY:
+                self._flush_touched()
+                self.conn.commit()
+            return {"content": row[0], "tokens": row[1]}
+
+    def put(self, key: str, content: str, tokens: Optional[int] = None):
+        size = len(content.encode("utf-8"))
+        with self._lock:
+            old = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, content, tokens, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, content, tokens, size, time.time())
+            )
+            self.conn.commit()
+            self.size += size - (old[0] if old else 0)
+            if self.size > self.max_bytes:
+                self.evict()
+
+    # Running lookups and writes in a thread so SQLite never blocks the event loop
+    async def aget(self, key: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, content: str, tokens: Optional[int] = None):
+        await asyncio.to_thread(self.put, key, content, tokens)
+
+    def _flush_touched(self):
+        self.conn.executemany(
+            "UPDATE responses SET last_used = ? WHERE key = ?",
+            [(t, k) for k, t in self._touched.items()]
+        )
+        self._touched.clear()
+
+    # Writing pending last_used updates; call once the run is over
+    def close(self):
+        with self._lock:
+            self._flush_touched()
+            self.conn.commit()
+            self.conn.close()
+
+    # Dropping least recently used entries until the cache is back under 90% of its cap
+    def evict(self):
+        self._flush_touched()
+        target = int(self.max_bytes * 0.9)
+        rows = self.conn.execute("SELECT key, size FROM responses ORDER BY last_used")
+        doomed = []
+        for key, size in rows:
+            if self.size <= target:
+                break
+            doomed.append((key,))
+            self.size -= size
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        self.conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0,
+            "size_bytes": self.size,
+        }
@@ -0,0 +1,129 @@
+# -----------------------------------------------------------------------------
+## Summary: Retry policies and a durable dead-letter queue for LLM extraction.
+## Failed calls are classified (rate limit, timeout, server error, connection,
+## client error) and retried with jittered exponential backoff according to
+## that class's policy. Requests that still fail are appended to a JSONL
+## failure log, so a later --retry-failed run can re-drive only those file_ids.
+## Async callers write to the log from a thread, off the event loop.
+# -----------------------------------------------------------------------------
+
+# Importing Libraries
+import os
+import json
+import random
+import asyncio
+import threading
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Optional, Tuple
+from rate_limiter import error_status, is_rate_limit_error, retry_after_seconds
+
+# Attempts (including the first) and backoff bounds in seconds, per error class
+RETRY_POLICIES = {
+    "rate_limit": {"max_attempts": 6, "base_delay": 2.0, "max_delay": 60.0},
+    "timeout":    {"max_attempts": 4, "base_delay": 1.0, "max_delay": 30.0},
+    "server":     {"max_attempts": 4, "base_delay": 1.0, "max_delay": 30.0},
+    "connection": {"max_attempts": 4, "base_delay": 1.0, "max_delay": 30.0},
+    "client":     {"max_attempts": 1, "base_delay": 0.0, "max_delay": 0.0},
+    "unknown":    {"max_attempts": 2, "base_delay": 1.0, "max_delay": 10.0},
+}
+
+# ------------------------------- RETRYING -------------------------------------
+
+class ExtractionFailed(Exception):
+
+    # Final failure after retries, keeping the class and attempt count
+    def __init__(self, error: Exception, error_class: str, attempts: int):
+        super().__init__(str(error))
+        self.error = error
+        self.error_class = error_class
+        self.attempts = attempts
+
+def classify_error(e: Exception) -> str:
+    if is_rate_limit_error(e):
+        return "rate_limit"
+    name = type(e).__name__
+    if isinstance(e, asyncio.TimeoutError) or "Timeout" in name or "DeadlineExceeded" in name:
+        return "timeout"
+    status = error_status(e)
+    if status is not None and status >= 500:
+        return "server"
+    if status is not None and 400 <= status < 500:
+        return "client"
+    if isinstance(e, ConnectionError) or "Connection" in name or "ServiceUnavailable" in name:
+        return "connection"
+    return "unknown"
+
+# Full-jitter exponential backoff, never shorter than the provider's Retry-After
+def backoff_delay(policy: dict, attempt: int, retry_after: Optional[float] = None) -> float:
+    cap = min(policy["max_delay"], policy["base_delay"] * 2 ** (attempt - 1))
+    delay = random.uniform(0, cap)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+# Calling fn until it succeeds or its error class runs out of attempts
+async def with_retries(fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, int]:
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return await fn(), attempt
+        except Exception as e:
+            error_class = classify_error(e)
+            policy = RETRY_POLICIES[error_class]
+            if attempt >= policy["max_attempts"]:
+                raise ExtractionFailed(e, error_class, attempt) from e
+            await asyncio.sleep(backoff_delay(policy, attempt, retry_after_seconds(e)))
+
+# ----------------------------- DEAD LETTERS -----------------------------------
+
+class DeadLetterQueue:
+
+    # Append-only log; the last record for a file_id decides whether it is pending
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if record.get("status") == "failed":
+                        self._pending[record["file_id"]] = record
+                    else:
+                        self._pending.pop(record["file_id"], None)
+
+    def _append(self, record: dict):
+        record["logged_at"] = datetime.now().isoformat(timespec="seconds")
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def record_failure(self, file_id: str, **info):
+        record = {"file_id": file_id, "status": "failed", **info}
+        self._append(record)
+        self._pending[file_id] = record
+
+    # Marking a previously failed file_id as recovered
+    def record_success(self, file_id: str):
+        if file_id in self._pending:
+            self._append({"file_id": file_id, "status": "resolved"})
+            del self._pending[file_id]
+
+    # The same from a coroutine: pending is updated on the loop, and the
+    # write and fsync run in a thread
+    async def arecord_failure(self, file_id: str, **info):
+        record = {"file_id": file_id, "status": "failed", **info}
+        self._pending[file_id] = record
+        await asyncio.to_thread(self._append, record)
+
+    async def arecord_success(self, file_id: str):
+        if self._pending.pop(file_id, None) is not None:
+            await asyncio.to_thread(self._append, {"file_id": file_id, "status": "resolved"})
+
+    def pending(self) -> set:
+        return set(self._pending)
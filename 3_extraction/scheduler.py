@@ -0,0 +1,80 @@
+# -----------------------------------------------------------------------------
+## Summary: Queue-based worker pools for the extraction scripts. A fixed number
+## of long-lived workers pull rows off a bounded queue and start the next
+## request as soon as their previous one finishes, so a single slow completion
+## only occupies one slot instead of stalling a whole batch. run_fan_out feeds
+## several such pools (one per model) from a single pass over the input, so
+## each row is read and prepared once however many models it goes to.
+# -----------------------------------------------------------------------------
+
+# Importing Libraries
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable
+
+# Marker telling a worker there is nothing left to pull
+_DONE = object()
+
+async def run_fan_out(
+    items: Iterable,
+    handlers: Dict[str, Callable[[Any], Awaitable[Any]]],
+    n_workers: int,
+    on_result: Callable[[str, Any], None],
+    on_done: Callable[[str], None] = None,
+    queue_size: int = None
+):
+
+    queues = {name: asyncio.Queue(maxsize=queue_size or 2 * n_workers) for name in handlers}
+
+    # Items are (target names, item) pairs. They are pulled in a thread, since
+    # the next one may mean parsing a CSV chunk and that would otherwise stall
+    # every worker on the event loop. A full queue holds the reader back, so
+    # the slowest target sets the pace and only a few rows are held at a time.
+    async def producer():
+        iterator = iter(items)
+        while True:
+            entry = await asyncio.to_thread(next, iterator, _DONE)
+            if entry is _DONE:
+                break
+            targets, item = entry
+            for name in targets:
+                await queues[name].put(item)
+        for queue in queues.values():
+            for _ in range(n_workers):
+                await queue.put(_DONE)
+
+    # Handling items until the producer runs dry; exceptions are passed on
+    async def worker(name):
+        queue = queues[name]
+        handler = handlers[name]
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                return
+            try:
+                result = await handler(item)
+            except Exception as e:
+                result = e
+            on_result(name, result)
+
+    async def pool(name):
+        await asyncio.gather(*[worker(name) for _ in range(n_workers)])
+        if on_done is not None:
+            on_done(name)
+
+    await asyncio.gather(producer(), *[pool(name) for name in handlers])
+
+# A single pool over every item
+async def run_worker_pool(
+    items: Iterable,
+    handler: Callable[[Any], Awaitable[Any]],
+    n_workers: int,
+    on_result: Callable[[Any], None],
+    queue_size: int = None
+):
+    await run_fan_out(
+        ((("pool",), item) for item in items),
+        {"pool": handler},
+        n_workers,
+        lambda name, result: on_result(result),
+        queue_size=queue_size
+    )
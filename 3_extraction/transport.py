@@ -0,0 +1,100 @@
+# -----------------------------------------------------------------------------
+## Summary: Shared HTTP transport for the provider SDK clients in
+## multi_model.py. Every client that talks to the same host (Llama and
+## Deepseek both go through the Hugging Face router) gets the same pooled
+## httpx.AsyncClient, so connections opened for one model are kept alive and
+## reused by the others. Pool size, keep-alive and the connect/read/write/pool
+## timeouts are set here, and HTTP/2 is used when the h2 package is installed.
+## Each pool counts its requests and the connections it had to open, which
+## gives the connection reuse figures in the run summary.
+# -----------------------------------------------------------------------------
+
+# Importing Libraries
+from typing import Dict
+
+# Newer provider SDKs are built on httpx2, a fork of httpx with the same API,
+# and only accept its clients; the older ones take either
+try:
+    import httpx2 as httpx
+except ImportError:
+    import httpx
+
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+# Connections per host; the router is shared by two models at up to 50 requests each
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE_CONNECTIONS = 100
+
+# Seconds an idle connection is kept open for reuse
+KEEPALIVE_EXPIRY = 90
+
+# Per-phase timeouts in seconds. Reads wait for the whole completion, so they
+# get the long one; the SDKs' own retries stay off and retry.py handles errors.
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 300
+WRITE_TIMEOUT = 60
+POOL_TIMEOUT = 60
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+_stats: Dict[str, Dict[str, int]] = {}
+
+# ------------------------------ SHARED POOLS ----------------------------------
+
+# The pooled client for a base URL's host, created on first use
+def shared_http_client(base_url: str) -> httpx.AsyncClient:
+    host = httpx.URL(base_url).netloc.decode("ascii")
+    if host in _clients:
+        return _clients[host]
+
+    stats = _stats.setdefault(host, {"requests": 0, "connections_opened": 0})
+
+    # httpcore reports each new TCP connection through the trace extension
+    async def trace(event: str, info: dict):
+        if event == "connection.connect_tcp.complete":
+            stats["connections_opened"] += 1
+
+    async def on_request(request: httpx.Request):
+        stats["requests"] += 1
+        request.extensions["trace"] = trace
+
+    _clients[host] = httpx.AsyncClient(
+        http2=HTTP2,
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(
+            connect=CONNECT_TIMEOUT,
+            read=READ_TIMEOUT,
+            write=WRITE_TIMEOUT,
+            pool=POOL_TIMEOUT
+        ),
+        event_hooks={"request": [on_request]}
+    )
+    return _clients[host]
+
+# Requests sent and connections opened for a base URL's host so far
+def connection_stats(base_url: str) -> Dict[str, float]:
+    host = httpx.URL(base_url).netloc.decode("ascii")
+    stats = _stats.get(host, {"requests": 0, "connections_opened": 0})
+    reused = max(stats["requests"] - stats["connections_opened"], 0)
+    return {
+        "host": host,
+        "http2": HTTP2,
+        "requests": stats["requests"],
+        "connections_opened": stats["connections_opened"],
+        "reuse_rate": round(reused / stats["requests"], 3) if stats["requests"] else 0.0
+    }
+
+# Closing every pool; the next shared_http_client call starts a fresh one
+async def close_all():
+    clients = list(_clients.values())
+    _clients.clear()
+    _stats.clear()
+    for client in clients:
+        await client.aclose()
@@ -0,0 +1,403 @@
+# -----------------------------------------------------------------------------
+## Summary: Python version of aggregation.R. Turns a folder of extraction
+## outputs into the clean_data tables (agencies, officers, plaintiffs, causes,
+## misconduct, locations), with the same *_openai_df.csv schemas: the entity
+## columns plus filename, code, case_id, order and total_documents. Outputs are
+## parsed in worker processes with orjson (json when it isn't installed), and
+## near-miss JSON goes through json_repair instead of being counted as an
+## error. Each file's rows are collected once and every table is built in a
+## single DataFrame construction. Text is normalized with vectorized string
+## operations, only outputs marked as complaints are kept, and each case keeps
+## the rows from its latest document; when a file was extracted more than
+## once, its newest output replaces the older ones. Runs are incremental: a
+## manifest of each output's mtime, size and hash, and a cache of its cleaned
+## rows, mean only new or changed outputs are parsed and merged in, so a
+## refresh costs in proportion to what changed. Tables are written as CSV and,
+## when pyarrow is installed, as Parquet next to them:
+##
+##   python 4_aggregation/aggregation.py
+##   python 4_aggregation/aggregation.py --full
+##   python 4_aggregation/aggregation.py --jsonl data/extract15/openai/outputs_*.jsonl
+# -----------------------------------------------------------------------------
+
+# Importing Libraries
+import os
+import sys
+import glob
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+try:
+    import pyarrow  # noqa: F401
+    PARQUET = True
+except ImportError:
+    PARQUET = False
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "3_extraction"))
+from json_repair import repair_json
+from output_sink import read_outputs
+
+# -------------------------------- SETTINGS ------------------------------------
+
+TEXT_DOCUMENTS = "data/overview_data/text_documents.csv"
+EXTRACT_FOLDER = "data/extract/openai_extracted_text"
+OUTPUT_DIR = "data/clean_data/openai_data"
+SUFFIX = "openai"
+
+# Tables built from each output, and the ones written to clean_data
+TABLES = (
+    "agencies", "officers", "plaintiffs", "causes",
+    "misconduct", "locations", "summaries", "is_complaints"
+)
+WRITTEN_TABLES = ("agencies", "officers", "plaintiffs", "causes", "misconduct", "locations")
+
+# Manifest of the outputs already parsed and the cache of their cleaned rows.
+# Bump AGGREGATION_VERSION when the parsing or cleaning rules change, so the
+# next run rebuilds the cache.
+CACHE_DIR = "data/extract/aggregation_cache/openai"
+MANIFEST_FILE = "manifest.json"
+AGGREGATION_VERSION = 1
+
+# Columns joined from text_documents.csv
+DOC_COLUMNS = ["code", "case_id", "order", "total_documents"]
+
+# Worker processes, and outputs handed to a worker at a time. Small folders
+# are parsed in this process, where starting workers would cost more.
+N_PROCESS = max(1, (os.cpu_count() or 1) - 1)
+PARSE_CHUNKSIZE = 64
+PARALLEL_MIN = 500
+
+# ------------------------------ HELPER FUNCTIONS ------------------------------
+
+# Character values the way R's as.character gives them; empty values are NA
+def as_text(value) -> Optional[str]:
+    if value is None or value == [] or value == {}:
+        return None
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return value if isinstance(value, str) else str(value)
+
+# Parsed output, repairing near-miss JSON; None when it can't be read
+def parse_json(text: str) -> Optional[dict]:
+    try:
+        data = loads(text)
+    except ValueError:
+        repaired = repair_json(text)
+        if repaired is None:
+            return None
+        data = loads(repaired)
+    return data if isinstance(data, dict) else None
+
+# One output's rows for every table, or None when it doesn't parse
+def output_rows(filename: str, text: str) -> Optional[Dict[str, List[dict]]]:
+    data = parse_json(text)
+    if data is None:
+        return None
+
+    rows = {name: [] for name in TABLES}
+    rows["is_complaints"].append({"filename": filename, "is_complaint": as_text(data.get("is_complaint"))})
+
+    for table in ("agencies", "officers", "plaintiffs"):
+        for entity in data.get(table) or []:
+            if isinstance(entity, dict):
+                rows[table].append({"filename": filename, **entity})
+
+    for cause in data.get("causes_of_action") or []:
+        if isinstance(cause, dict):
+            rows["causes"].append({"filename": filename, **{k: as_text(v) for k, v in cause.items()}})
+
+    # A list gives a row per element, a single value one row
+    for key, table, column in (
+        ("types_of_misconduct", "misconduct", "misconduct_type"),
+        ("incident_location", "locations", "location")
+    ):
+        value = data.get(key)
+        if value is None:
+            continue
+        values = value.values() if isinstance(value, dict) else value if isinstance(value, list) else [value]
+        rows[table].extend({"filename": filename, column: v} for v in values)
+
+    rows["summaries"].append({"filename": filename, "event_summary": data.get("event_summary")})
+    return rows
+
+# Parsing one (filename, path, text) source; the text is read from path when not given
+def parse_source(source: Tuple[str, Optional[str], Optional[str]]) -> Tuple[str, Optional[Dict[str, List[dict]]]]:
+    filename, path, text = source
+    if text is None:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            text = f.read()
+    return filename, output_rows(filename, text)
+
+# Output files in a folder, as sources for parse_source
+def folder_sources(folder: str) -> List[Tuple[str, str, None]]:
+    paths = sorted(glob.glob(os.path.join(folder, "*.txt")))
+    return [(os.path.basename(path), path, None) for path in paths]
+
+# Outputs logged to consolidated JSONL files by output_sink, newest line winning
+def jsonl_sources(paths: Iterable[str]) -> List[Tuple[str, None, str]]:
+    latest = {}
+    for path in paths:
+        for record in read_outputs(path):
+            if record.get("output_path") and record.get("content") is not None:
+                latest[os.path.basename(record["output_path"])] = record["content"]
+    return [(filename, None, text) for filename, text in sorted(latest.items())]
+
+# Parsed rows per source, in worker processes for large inputs
+def parse_sources(sources: List[tuple], n_process: int = N_PROCESS) -> Iterable[tuple]:
+    if n_process <= 1 or len(sources) < PARALLEL_MIN:
+        return map(parse_source, sources)
+    executor = ProcessPoolExecutor(n_process)
+    try:
+        return list(executor.map(parse_source, sources, chunksize=PARSE_CHUNKSIZE))
+    finally:
+        executor.shutdown()
+
+# One DataFrame per table from every parsed output, plus the filenames of the
+# outputs that couldn't be parsed
+def collect_tables(parsed: Iterable[tuple]) -> Tuple[Dict[str, pd.DataFrame], List[str]]:
+    rows = {name: [] for name in TABLES}
+    failed = []
+    for filename, output in parsed:
+        if output is None:
+            failed.append(filename)
+            continue
+        for name in TABLES:
+            rows[name].extend(output[name])
+    tables = {
+        name: pd.DataFrame(table_rows) if table_rows else pd.DataFrame(columns=["filename"])
+        for name, table_rows in rows.items()
+    }
+    return tables, failed
+
+# --------------------------------- CLEANING -----------------------------------
+
+# Columns holding text, whether read as object or as pandas' string dtype
+def text_columns(df: pd.DataFrame) -> List[str]:
+    return [c for c in df.columns if df[c].dtype == object or pd.api.types.is_string_dtype(df[c].dtype)]
+
+# Lower case, straight quotes, control characters to spaces, single spaces
+def normalize_text(values: pd.Series) -> pd.Series:
+    is_text = values.map(lambda v: isinstance(v, str))
+    if not is_text.any():
+        return values
+    text = (
+        values[is_text].astype(str)
+        .str.lower()
+        .str.replace("[‘’]", "'", regex=True)
+        .str.replace("[“”]", "\"", regex=True)
+        .str.replace(r"[\x00-\x1f\x7f-\x9f]", " ", regex=True)
+        .str.replace(r"\s+", " ", regex=True)
+        .str.strip()
+    )
+    values = values.astype(object)
+    values[is_text] = text
+    return values
+
+# Normalizing every text column, then the code from the filename (the file_id
+# before the first "_")
+def clean_table(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    for column in text_columns(df):
+        df[column] = normalize_text(df[column])
+    if "filename" in df.columns:
+        df["code"] = df["filename"].astype(str).str.replace(r"_.*$", "", regex=True)
+    return df
+
+# Filenames of the newest parsed output per file_id, by the date at the end of
+# {file_id}_{model}_{date}.txt; older outputs of the same file are superseded
+def latest_outputs(is_complaints: pd.DataFrame) -> pd.Series:
+    stamps = is_complaints["filename"].str.replace(r"\.txt$", "", regex=True).str.rsplit("_", n=1).str[-1]
+    latest = (
+        is_complaints.assign(stamp=stamps)
+        .sort_values(["stamp", "filename"], kind="stable")
+        .drop_duplicates("code", keep="last")
+    )
+    return latest["filename"]
+
+# case_id, order and total_documents per file_id
+def load_docs(path: str = TEXT_DOCUMENTS) -> pd.DataFrame:
+    docs = pd.read_csv(
+        path,
+        usecols=["file_id", "case_id", "order", "total_documents"],
+        dtype={"file_id": str, "case_id": str, "order": "Int64", "total_documents": "Int64"}
+    )
+    return docs.rename(columns={"file_id": "code"})[DOC_COLUMNS]
+
+# Complaint rows joined to their documents, keeping each case's latest document
+# (every row of it, as slice_max keeps ties). Rows are grouped by case_id.
+def filter_and_join(df: pd.DataFrame, filenames: set, docs: pd.DataFrame) -> pd.DataFrame:
+    columns = [c for c in df.columns if c != "code"] + ["code"]
+    df = df.loc[df["filename"].isin(filenames), columns].merge(docs, on="code", how="left")
+    latest = df.groupby("case_id", dropna=False)["order"].transform("max")
+    keep = (df["order"] == latest).fillna(False) | latest.isna()
+    return df[keep].sort_values("case_id", kind="stable", na_position="last").reset_index(drop=True)
+
+# clean_data tables from the cleaned rows of every parsed output
+def build_tables(tables: Dict[str, pd.DataFrame], docs: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    is_complaints = tables["is_complaints"]
+    if len(is_complaints):
+        is_complaints = is_complaints[is_complaints["filename"].isin(latest_outputs(is_complaints))]
+        filenames = set(is_complaints.loc[is_complaints["is_complaint"] == "true", "filename"])
+    else:
+        filenames = set()
+    return {name: filter_and_join(tables[name], filenames, docs) for name in WRITTEN_TABLES}
+
+# ------------------------------- INCREMENTAL ----------------------------------
+
+def file_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def load_manifest(cache_dir: str) -> dict:
+    path = os.path.join(cache_dir, MANIFEST_FILE)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") == AGGREGATION_VERSION:
+            return manifest
+    return {"version": AGGREGATION_VERSION, "files": {}}
+
+def save_manifest(manifest: dict, cache_dir: str):
+    path = os.path.join(cache_dir, MANIFEST_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(path + ".tmp", path)
+
+# Cleaned rows of every output in the manifest, one pickle per table; None
+# when any is missing, which forces a full rebuild
+def load_cache(cache_dir: str) -> Optional[Dict[str, pd.DataFrame]]:
+    paths = {name: os.path.join(cache_dir, f"{name}.pkl") for name in TABLES}
+    if not all(os.path.exists(path) for path in paths.values()):
+        return None
+    return {name: pd.read_pickle(path) for name, path in paths.items()}
+
+def save_cache(tables: Dict[str, pd.DataFrame], cache_dir: str):
+    for name, df in tables.items():
+        path = os.path.join(cache_dir, f"{name}.pkl")
+        df.to_pickle(path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+# Sources that are new or changed since the manifest, and the manifest entries
+# for the folder as it is now. Files are only hashed when their mtime or size
+# moved, so an unchanged folder costs one stat per file.
+def scan_changes(sources: List[tuple], files: dict) -> Tuple[List[tuple], dict]:
+    changed = []
+    current = {}
+    for source in sources:
+        path = source[1]
+        stat = os.stat(path)
+        entry = files.get(path)
+        if entry and entry["mtime"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            current[path] = entry
+            continue
+        digest = file_hash(path)
+        if entry and entry["hash"] == digest:
+            current[path] = {**entry, "mtime": stat.st_mtime_ns, "size": stat.st_size}
+            continue
+        current[path] = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "hash": digest, "parsed": None}
+        changed.append(source)
+    return changed, current
+
+# Rows from the cache with those of removed or changed outputs replaced by the
+# freshly parsed delta
+def merge_delta(cached: Dict[str, pd.DataFrame], delta: Dict[str, pd.DataFrame],
+                stale: set) -> Dict[str, pd.DataFrame]:
+    merged = {}
+    for name in TABLES:
+        kept = cached[name][~cached[name]["filename"].isin(stale)]
+        frames = [df for df in (kept, delta[name]) if len(df)]
+        merged[name] = pd.concat(frames, ignore_index=True) if frames else delta[name]
+    return merged
+
+# Aggregating a folder, parsing only outputs added or changed since the last
+# run. Returns the tables, the count of outputs that don't parse and the count
+# parsed this run.
+def aggregate_folder(folder: str = EXTRACT_FOLDER, docs_path: str = TEXT_DOCUMENTS,
+                     cache_dir: str = CACHE_DIR, n_process: int = N_PROCESS,
+                     full: bool = False) -> Tuple[Dict[str, pd.DataFrame], int, int]:
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest = load_manifest(cache_dir)
+    cached = None if full else load_cache(cache_dir)
+    if cached is None:
+        manifest["files"] = {}
+        cached = {name: pd.DataFrame(columns=["filename", "code"]) for name in TABLES}
+
+    changed, files = scan_changes(folder_sources(folder), manifest["files"])
+    parsed = list(parse_sources(changed, n_process))
+    delta, failed = collect_tables(parsed)
+    delta = {name: clean_table(df) for name, df in delta.items()}
+
+    # Cached rows are keyed by the cleaned (lower case) filename
+    removed = set(manifest["files"]) - set(files)
+    stale = {os.path.basename(path).lower() for path in removed} | {s[0].lower() for s in changed}
+    tables = merge_delta(cached, delta, stale)
+
+    failed = set(failed)
+    for filename, path, _ in changed:
+        files[path]["parsed"] = filename not in failed
+    manifest["files"] = files
+    save_cache(tables, cache_dir)
+    save_manifest(manifest, cache_dir)
+
+    errors = sum(not entry["parsed"] for entry in files.values())
+    return build_tables(tables, load_docs(docs_path)), errors, len(changed)
+
+# ---------------------------------- WRITING -----------------------------------
+
+def write_tables(tables: Dict[str, pd.DataFrame], output_dir: str = OUTPUT_DIR,
+                 suffix: str = SUFFIX, parquet: bool = PARQUET):
+    os.makedirs(output_dir, exist_ok=True)
+    for name, df in tables.items():
+        path = os.path.join(output_dir, f"{name}_{suffix}_df")
+        df.to_csv(f"{path}.csv", index=False, na_rep="NA")
+        if parquet:
+            # Parquet columns hold one type, so text columns are stored as strings
+            df.astype({c: "string" for c in text_columns(df)}).to_parquet(f"{path}.parquet", index=False)
+
+# Aggregating every source in one pass, without the cache
+def aggregate(sources: List[tuple], docs_path: str = TEXT_DOCUMENTS,
+              n_process: int = N_PROCESS) -> Tuple[Dict[str, pd.DataFrame], int]:
+    tables, failed = collect_tables(parse_sources(sources, n_process))
+    tables = {name: clean_table(df) for name, df in tables.items()}
+    return build_tables(tables, load_docs(docs_path)), len(failed)
+
+# ---------------------------------- RUNNING -----------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the clean_data tables from extraction outputs")
+    parser.add_argument("--folder", default=EXTRACT_FOLDER, help="folder of {file_id}_{model}_{date}.txt outputs")
+    parser.add_argument("--jsonl", nargs="+", help="read consolidated outputs_*.jsonl files instead of a folder")
+    parser.add_argument("--docs", default=TEXT_DOCUMENTS)
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--suffix", default=SUFFIX)
+    parser.add_argument("--processes", type=int, default=N_PROCESS)
+    parser.add_argument("--full", action="store_true", help="re-parse every output instead of only the changed ones")
+    parser.add_argument("--no-parquet", action="store_true")
+    args = parser.parse_args()
+
+    if args.jsonl:
+        sources = jsonl_sources(args.jsonl)
+        tables, errors = aggregate(sources, args.docs, args.processes)
+        print(f"Outputs read: {len(sources):,} | Parse errors: {errors:,}")
+    else:
+        tables, errors, n_parsed = aggregate_folder(
+            args.folder, args.docs, args.cache_dir, args.processes, args.full
+        )
+        print(f"Outputs parsed: {n_parsed:,} new or changed | Parse errors: {errors:,}")
+    write_tables(tables, args.output_dir, args.suffix, PARQUET and not args.no_parquet)
+
+    for name, df in tables.items():
+        print(f"  {name:<11} {len(df):,} rows")
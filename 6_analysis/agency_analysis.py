@@ -1,41 +1,21 @@
-import re
 import numpy as np
 import pandas as pd
 from itertools import combinations
-from sentence_transformers import SentenceTransformer
-import hdbscan
 import networkx as nx
+from embedding_cache import EmbeddingCache
+from clustering import cluster_texts
+from normalization import normalize_name, normalize_agency_column
 
 # ------------------- LOAD DATA -----------------------
 agencies = pd.read_csv("data/clean_data/openai_data/agencies_openai_df.csv")
 
 # ------------------- NORMALIZE NAMES -----------------------
-def normalize_name(text: str) -> str:
-    if not isinstance(text, str) or not text.strip():
-        return ""
-    text = text.lower()
-    text = re.sub(r"[^\w\s]", " ", text)
-    text = re.sub(r"\s+", " ", text)
-
-    remove_patterns = [
-        r"\bpolice department\b", r"\bpolice dept\b", r"\bpd\b", r"\bpolice\b",
-        r"\bsheriff'?s office\b", r"\bsheriff'?s dept\b", r"\bsheriff'?s department\b",
-        r"\bsheriff\b", r"\bso\b",
-        r"\bdepartment of\b", r"\bdept of\b", r"\bdept\b",
-        r"\bdistrict attorney\b", r"\bstate attorney\b", r"\battorney'?s office\b", r"\bda\b",
-        r"\bhighway patrol\b", r"\bhp\b", r"\bstate patrol\b", r"\bpatrol\b",
-        r"\bcounty of\b", r"\bcity of\b", r"\bthe county of\b",
-        r"\bcounty\b", r"\bcity\b", r"\bstate\b"
-    ]
-    for p in remove_patterns:
-        text = re.sub(p, " ", text)
-
-    return re.sub(r"\s+", " ", text).strip()
-
-agencies["normalized"] = agencies["agency_name"].fillna("").apply(normalize_name)
+# Agency words stripped in one compiled pass over the distinct names
+agencies["normalized"] = normalize_agency_column(agencies["agency_name"])
 
 # ------------------- EMBEDDINGS -----------------------
-model = SentenceTransformer("sentence-transformers/all-mpnet-base-v2")
+# Cached on disk, so repeat runs only encode names they haven't seen
+embedder = EmbeddingCache("sentence-transformers/all-mpnet-base-v2")
 
 # ------------------- CATEGORY CLUSTERING -----------------------
 def cluster_agency_group(df_group: pd.DataFrame) -> pd.DataFrame:
@@ -43,15 +23,15 @@ def cluster_agency_group(df_group: pd.DataFrame) -> pd.DataFrame:
     if len(df) < 2:
         df["cluster"] = -1
         return df
-    embeddings = model.encode(df["normalized"].tolist(), show_progress_bar=False)
-    clusterer = hdbscan.HDBSCAN(
+    df["cluster"] = cluster_texts(
+        df["normalized"],
+        embedder,
         min_cluster_size=2,
         min_samples=1,
         metric="euclidean",
         cluster_selection_method="eom",
         cluster_selection_epsilon=0.15
-    ).fit(embeddings)
-    df["cluster"] = clusterer.labels_
+    )
     return df
 
 clustered = (
@@ -90,12 +70,6 @@ clustered.loc[noise_mask, "cluster_label"] = (
 )
 
 # ------------------- CLUSTER METADATA -----------------------
-def normalize_name_simple(text: str) -> str:
-    if not isinstance(text, str) or not text.strip():
-        return ""
-    text = re.sub(r"[^\w\s]", " ", text.lower())
-    return re.sub(r"\s+", " ", text).strip()
-
 cluster_modes = (
     clustered.groupby("global_cluster_id")["agency_name"]
     .agg(lambda x: x.mode().iat[0])
@@ -117,8 +91,8 @@ cluster_meta = (
 
 def representative_name(row):
     if row["cluster_val"] == -1:
-        return f"other {normalize_name_simple(row['agency_category'])}"
-    return normalize_name_simple(row["most_common_name"])
+        return f"other {normalize_name(row['agency_category'])}"
+    return normalize_name(row["most_common_name"])
 
 cluster_meta["clean_name"] = cluster_meta.apply(representative_name, axis=1)
 cluster_name_map = dict(zip(cluster_meta["global_cluster_id"], cluster_meta["clean_name"]))
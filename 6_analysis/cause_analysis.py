@@ -4,8 +4,8 @@ import re
 import nltk
 from nltk.corpus import stopwords
 from nltk.stem import WordNetLemmatizer
-from sentence_transformers import SentenceTransformer
-import hdbscan
+from embedding_cache import EmbeddingCache
+from clustering import cluster_texts
 
 
 # ------------------- LOAD DATA -----------------------
@@ -44,26 +44,23 @@ df["cause_norm"] = df["cause_cited"].apply(normalize_cause)
 
 
 # ------------------- EMBEDDINGS -----------------------
-model = SentenceTransformer("all-MiniLM-L6-v2")
-
-embeddings = model.encode(
-    df["cause_norm"].tolist(),
-    normalize_embeddings=True,
-    show_progress_bar=True
-)
+# Cached on disk, so repeat runs only encode causes they haven't seen
+embedder = EmbeddingCache("all-MiniLM-L6-v2", normalize_embeddings=True)
 
 
 # ------------------- HDBSCAN -----------------------
-clusterer = hdbscan.HDBSCAN(
+# Embedding and clustering each distinct cause once, labels mapped back to rows
+df["cluster_id"] = cluster_texts(
+    df["cause_norm"],
+    embedder,
+    show_progress_bar=True,
     min_cluster_size=4,
     min_samples=1,
     metric="euclidean",
     cluster_selection_method="eom",
     cluster_selection_epsilon=0.05,
     prediction_data=True
-).fit(embeddings)
-
-df["cluster_id"] = clusterer.labels_
+)
 
 
 # ------------------- CLUSTER LABELS -----------------------
@@ -0,0 +1,48 @@
+# -----------------------------------------------------------------------------
+## Summary: Embed-and-cluster step shared by the 6_analysis scripts. After
+## normalization most rows repeat a string already seen, so the input is
+## factorized first: only the unique strings are embedded (through the
+## embedding cache) and clustered, and their labels are mapped back to the
+## rows through the codes array. HDBSCAN takes no sample weights, so each
+## unique string is repeated by its count, capped at the larger of
+## min_cluster_size and min_samples + 1 (hdbscan's core distance is taken over
+## the min_samples + 1 nearest points, the point itself included). Copies of a
+## string sit at distance zero, so the cap keeps every core distance and every
+## string's ability to form a cluster on its own, while encoding time and
+## HDBSCAN's memory shrink by the duplication factor. Counts past the cap no
+## longer add to a cluster's stability, which can occasionally change the
+## clusters EOM selects.
+# -----------------------------------------------------------------------------
+
+# Importing Libraries
+import numpy as np
+import pandas as pd
+import hdbscan
+from typing import Sequence
+
+# hdbscan's own default, used when the caller doesn't set min_cluster_size
+DEFAULT_MIN_CLUSTER_SIZE = 5
+
+# Index of the unique string behind each point handed to HDBSCAN, each unique
+# repeated min(count, cap) times, in order
+def expand_counts(counts: np.ndarray, cap: int) -> np.ndarray:
+    return np.repeat(np.arange(len(counts)), np.minimum(counts, cap))
+
+# HDBSCAN labels for texts, one per row, computed on the unique strings.
+# params are passed to hdbscan.HDBSCAN.
+def cluster_texts(texts: Sequence[str], embedder, show_progress_bar: bool = False, **params) -> np.ndarray:
+    codes, uniques = pd.factorize(pd.Series(texts, dtype=object), use_na_sentinel=False)
+    if not len(uniques):
+        return np.empty(0, dtype=int)
+
+    counts = np.bincount(codes, minlength=len(uniques))
+    emb = embedder.encode(list(uniques), show_progress_bar=show_progress_bar)
+
+    min_cluster_size = params.get("min_cluster_size", DEFAULT_MIN_CLUSTER_SIZE)
+    cap = max(min_cluster_size, (params.get("min_samples") or min_cluster_size) + 1)
+    points = expand_counts(counts, cap)
+    clusterer = hdbscan.HDBSCAN(**params).fit(emb[points])
+
+    # Copies of a string always share a label; taking each one's first copy
+    first = np.searchsorted(points, np.arange(len(uniques)))
+    return clusterer.labels_[first][codes]
@@ -0,0 +1,107 @@
+# -----------------------------------------------------------------------------
+## Summary: Persistent embedding store shared by the 6_analysis scripts. The
+## same normalized strings ("juneau", "deprivation civil rights 1983") come up
+## thousands of times and on every run, so each model keeps one row per unique
+## string in a memory-mapped float32 (or float16) matrix on disk, with the
+## strings in row order beside it. encode() looks strings up there and only
+## runs the SentenceTransformer on the ones it hasn't seen, appending them;
+## the model isn't even loaded when everything is cached. Rows are written
+## before the string list, so a run killed mid-append loses at most the rows
+## it was adding.
+# -----------------------------------------------------------------------------
+
+# Importing Libraries
+import os
+import json
+import numpy as np
+from typing import Dict, List, Optional, Sequence
+
+CACHE_DIR = "data/embedding_cache"
+
+# Strings handed to the model per encode call when filling the cache
+ENCODE_BATCH = 4096
+
+
+class EmbeddingCache:
+
+    def __init__(self, model_name: str, normalize_embeddings: bool = False,
+                 cache_dir: str = CACHE_DIR, dtype=np.float32, model=None):
+        self.model_name = model_name
+        self.normalize_embeddings = normalize_embeddings
+        self.dtype = np.dtype(dtype)
+        self._model = model
+
+        # Normalized and raw vectors differ, so they are stored apart
+        key = model_name.replace("/", "--") + ("-normalized" if normalize_embeddings else "")
+        self.dir = os.path.join(cache_dir, f"{key}-{self.dtype.name}")
+        self.matrix_path = os.path.join(self.dir, "embeddings.bin")
+        self.strings_path = os.path.join(self.dir, "strings.json")
+        os.makedirs(self.dir, exist_ok=True)
+
+        self.strings: List[str] = []
+        self.dim: Optional[int] = None
+        if os.path.exists(self.strings_path):
+            with open(self.strings_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self.strings, self.dim = state["strings"], state["dim"]
+        self.index: Dict[str, int] = {s: i for i, s in enumerate(self.strings)}
+
+        # Dropping rows appended after the last saved string list; with no list
+        # saved yet (a first fill that died), every row is dropped
+        if os.path.exists(self.matrix_path):
+            size = len(self.strings) * (self.dim or 0) * self.dtype.itemsize
+            if os.path.getsize(self.matrix_path) > size:
+                with open(self.matrix_path, "r+b") as f:
+                    f.truncate(size)
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    # The stored matrix, mapped read-only
+    def matrix(self) -> np.ndarray:
+        if not self.strings:
+            return np.empty((0, self.dim or 0), dtype=self.dtype)
+        return np.memmap(self.matrix_path, dtype=self.dtype, mode="r", shape=(len(self.strings), self.dim))
+
+    # Encoding and storing the strings not yet in the cache
+    def add(self, texts: Sequence[str], show_progress_bar: bool = False):
+        missing = list(dict.fromkeys(t for t in texts if t not in self.index))
+        if not missing:
+            return
+        with open(self.matrix_path, "ab") as f:
+            for start in range(0, len(missing), ENCODE_BATCH):
+                batch = missing[start:start + ENCODE_BATCH]
+                emb = np.asarray(self.model.encode(
+                    batch,
+                    normalize_embeddings=self.normalize_embeddings,
+                    show_progress_bar=show_progress_bar
+                ), dtype=self.dtype)
+                self.dim = emb.shape[1]
+                f.write(np.ascontiguousarray(emb).tobytes())
+                for text in batch:
+                    self.index[text] = len(self.strings)
+                    self.strings.append(text)
+            f.flush()
+            os.fsync(f.fileno())
+        self._save_strings()
+
+    def _save_strings(self):
+        tmp_path = self.strings_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model_name, "dim": self.dim, "strings": self.strings}, f)
+        os.replace(tmp_path, self.strings_path)
+
+    # Embeddings for texts, one float32 row per text in order, encoding only
+    # the strings seen for the first time
+    def encode(self, texts: Sequence[str], show_progress_bar: bool = False) -> np.ndarray:
+        texts = list(texts)
+        self.add(texts, show_progress_bar)
+        rows = np.fromiter((self.index[t] for t in texts), dtype=np.int64, count=len(texts))
+        return np.asarray(self.matrix()[rows], dtype=np.float32)
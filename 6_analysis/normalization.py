@@ -0,0 +1,92 @@
+# -----------------------------------------------------------------------------
+## Summary: Name normalization shared by agency_analysis.py and
+## officer_analysis.py, which each carried a copy of the same removal list and
+## ran it as about 25 re.sub calls per string. Here the removals are compiled
+## into one alternation, kept in the list's order so that where two patterns
+## match at the same place the earlier one still wins, and the column
+## functions normalize each distinct value once with vectorized pandas string
+## operations and map the results back to the rows. Output is the same as the
+## pattern-by-pattern version (bench_normalization.py checks this on a million
+## rows):
+##
+##   python 6_analysis/bench_normalization.py
+# -----------------------------------------------------------------------------
+
+# Importing Libraries
+import re
+import pandas as pd
+
+# Agency words removed from names, in the order they were applied one by one
+REMOVE_PATTERNS = [
+    r"\bpolice department\b", r"\bpolice dept\b", r"\bpd\b", r"\bpolice\b",
+    r"\bsheriff'?s office\b", r"\bsheriff'?s dept\b", r"\bsheriff'?s department\b",
+    r"\bsheriff\b", r"\bso\b",
+    r"\bdepartment of\b", r"\bdept of\b", r"\bdept\b",
+    r"\bdistrict attorney\b", r"\bstate attorney\b", r"\battorney'?s office\b", r"\bda\b",
+    r"\bhighway patrol\b", r"\bhp\b", r"\bstate patrol\b", r"\bpatrol\b",
+    r"\bcounty of\b", r"\bcity of\b", r"\bthe county of\b",
+    r"\bcounty\b", r"\bcity\b", r"\bstate\b"
+]
+
+# Applied one by one, "the county of" never matched: "county of" had already
+# been removed. In one pass it would match first (it starts earlier), so it
+# is left out. No other pattern's match can start inside an earlier one's.
+AGENCY_REMOVALS = re.compile("|".join(p for p in REMOVE_PATTERNS if p != r"\bthe county of\b"))
+
+PUNCTUATION = re.compile(r"[^\w\s]")
+WHITESPACE = re.compile(r"\s+")
+
+# ------------------------------ SINGLE STRINGS --------------------------------
+
+# Lower case, punctuation to spaces, single spaces
+def normalize_name(text) -> str:
+    if not isinstance(text, str) or not text.strip():
+        return ""
+    text = PUNCTUATION.sub(" ", text.lower())
+    return WHITESPACE.sub(" ", text).strip()
+
+# normalize_name, then the agency words removed
+def normalize_agency(text) -> str:
+    if not isinstance(text, str) or not text.strip():
+        return ""
+    text = WHITESPACE.sub(" ", PUNCTUATION.sub(" ", text.lower()))
+    return WHITESPACE.sub(" ", AGENCY_REMOVALS.sub(" ", text)).strip()
+
+# --------------------------------- COLUMNS ------------------------------------
+
+# Running a vectorized normalizer over a column's distinct values only; missing
+# and blank values become ""
+def _by_unique(values: pd.Series, normalize) -> pd.Series:
+    codes, uniques = pd.factorize(values.astype(object), use_na_sentinel=True)
+    uniques = pd.Series(uniques, dtype=object)
+    is_text = uniques.map(lambda v: isinstance(v, str))
+    normalized = pd.Series("", index=uniques.index, dtype=object)
+    if is_text.any():
+        normalized[is_text] = normalize(uniques[is_text].astype(str).str.lower())
+    # Missing values get code -1, which takes the "" appended at the end
+    result = pd.concat([normalized, pd.Series([""], dtype=object)], ignore_index=True).to_numpy()[codes]
+    return pd.Series(result, index=values.index, dtype=object)
+
+def _names(lowered: pd.Series) -> pd.Series:
+    return (
+        lowered
+        .str.replace(PUNCTUATION, " ", regex=True)
+        .str.replace(WHITESPACE, " ", regex=True)
+        .str.strip()
+    )
+
+def _agencies(lowered: pd.Series) -> pd.Series:
+    return (
+        lowered
+        .str.replace(PUNCTUATION, " ", regex=True)
+        .str.replace(WHITESPACE, " ", regex=True)
+        .str.replace(AGENCY_REMOVALS, " ", regex=True)
+        .str.replace(WHITESPACE, " ", regex=True)
+        .str.strip()
+    )
+
+def normalize_name_column(values: pd.Series) -> pd.Series:
+    return _by_unique(values, _names)
+
+def normalize_agency_column(values: pd.Series) -> pd.Series:
+    return _by_unique(values, _agencies)
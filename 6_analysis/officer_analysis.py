@@ -1,62 +1,35 @@
 import pandas as pd
 import numpy as np
-import re
-from sentence_transformers import SentenceTransformer
-import hdbscan
+from embedding_cache import EmbeddingCache
+from clustering import cluster_texts
+from normalization import normalize_agency_column, normalize_name_column
 
 # ------------------- LOAD DATA -----------------------
 officers = pd.read_csv("data/clean_data/openai_data/officers_openai_df.csv")
 
 # ------------------- NORMALIZATION -----------------------
-
-def normalize_agency(x):
-    if not isinstance(x, str) or not x.strip():
-        return ""
-    x = x.lower()
-    x = re.sub(r"[^\w\s]", " ", x)
-    x = re.sub(r"\s+", " ", x)
-
-    remove_patterns = [
-        r"\bpolice department\b", r"\bpolice dept\b", r"\bpd\b", r"\bpolice\b",
-        r"\bsheriff'?s office\b", r"\bsheriff'?s dept\b", r"\bsheriff'?s department\b",
-        r"\bsheriff\b", r"\bso\b",
-        r"\bdepartment of\b", r"\bdept of\b", r"\bdept\b",
-        r"\bdistrict attorney\b", r"\bstate attorney\b", r"\battorney'?s office\b", r"\bda\b",
-        r"\bhighway patrol\b", r"\bhp\b", r"\bstate patrol\b", r"\bpatrol\b",
-        r"\bcounty of\b", r"\bcity of\b", r"\bthe county of\b",
-        r"\bcounty\b", r"\bcity\b", r"\bstate\b"
-    ]
-    for p in remove_patterns:
-        x = re.sub(p, " ", x)
-
-    return re.sub(r"\s+", " ", x).strip()
-
-def normalize_name(x):
-    if not isinstance(x, str) or not x.strip():
-        return ""
-    x = x.lower()
-    x = re.sub(r"[^\w\s]", " ", x)
-    return re.sub(r"\s+", " ", x).strip()
-
-officers["agency_norm"] = officers["agency_affiliation"].fillna("").apply(normalize_agency)
-officers["name_norm"]   = officers["officer_name"].fillna("").apply(normalize_name)
+# Compiled normalizers run once per distinct value (see normalization.py)
+officers["agency_norm"] = normalize_agency_column(officers["agency_affiliation"])
+officers["name_norm"]   = normalize_name_column(officers["officer_name"])
 
 # ------------------- MODEL -----------------------
-model = SentenceTransformer("sentence-transformers/all-mpnet-base-v2")
+# Cached on disk, so repeat runs only encode names they haven't seen
+embedder = EmbeddingCache("sentence-transformers/all-mpnet-base-v2")
 
 # ------------------- HDBSCAN HELPERS -----------------------
 
+# Embedding and clustering each distinct string once, labels mapped back to rows
 def run_hdbscan(texts, eps=0.25, min_cluster_size=2):
-    emb = model.encode(texts, show_progress_bar=False)
-    clusterer = hdbscan.HDBSCAN(
+    return cluster_texts(
+        texts,
+        embedder,
         min_samples=1,
         min_cluster_size=min_cluster_size,
         metric="euclidean",
         cluster_selection_method="eom",
         cluster_selection_epsilon=eps,
         prediction_data=True
-    ).fit(emb)
-    return clusterer.labels_, emb
+    )
 
 def most_common(x):
     x = x.dropna()
@@ -64,7 +37,7 @@ def most_common(x):
     return vc.index[0] if len(vc) else ""
 
 # ------------------- CLUSTER AGENCIES -----------------------
-officers["agency_cluster"], agency_emb = run_hdbscan(
+officers["agency_cluster"] = run_hdbscan(
     officers["agency_norm"].tolist(),
     eps=0.30,
     min_cluster_size=2
@@ -83,12 +56,11 @@ officers.loc[officers["agency_cluster"] == -1, "agency_cluster_label"] = "other"
 # ------------------- CLUSTER NAMES WITHIN AGENCY -----------------------
 
 def cluster_names(group):
-    labels, emb = run_hdbscan(
+    group["name_cluster"] = run_hdbscan(
         group["name_norm"].tolist(),
         eps=0.10,
         min_cluster_size=2
     )
-    group["name_cluster"] = labels
     return group
 
 officers = (
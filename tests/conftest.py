@@ -0,0 +1,57 @@
+# -----------------------------------------------------------------------------
+## Summary: Shared fixture for the extraction tests. Builds a small repo layout
+## in a temporary directory (config, prompt and a four-complaint CSV), starts
+## the local stub server and imports multi_model pointed at it.
+# -----------------------------------------------------------------------------
+
+import os
+import sys
+import importlib
+import shutil
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXTRACTION_DIR = os.path.join(REPO, "3_extraction")
+LOADING_DIR = os.path.join(REPO, "1_loading_data")
+
+FILE_IDS = ["1001", "1002", "1003", "1004"]
+
+# 1004 is long enough to be split into chunks and merged back
+LONG_COMPLAINT = "Caption. " + "Facts. " * 9000 + "FIRST CAUSE OF ACTION " + "Force. " * 9000
+
+
+@pytest.fixture
+def stub_env(tmp_path, monkeypatch):
+    # multi_model reads config.py, the prompt and the CSV relative to the repo root
+    (tmp_path / "config.py").write_text(
+        'OPENAI_API_KEY = "test"\nANTHROPIC_API_KEY = "test"\n'
+        'GOOGLE_API_KEY = "test"\nHUGGINGFACE_API_KEY = "test"\n'
+    )
+    (tmp_path / "3_extraction").mkdir()
+    shutil.copy(os.path.join(EXTRACTION_DIR, "prompt.txt"), tmp_path / "3_extraction" / "prompt.txt")
+    (tmp_path / "data" / "overview_data").mkdir(parents=True)
+    texts = {file_id: f"Complaint text {file_id}" for file_id in FILE_IDS}
+    texts["1004"] = LONG_COMPLAINT
+    rows = "".join(f'{file_id},"{text}"\n' for file_id, text in texts.items())
+    (tmp_path / "data" / "overview_data" / "filtered_texts.csv").write_text("file_id,text_content\n" + rows)
+
+    monkeypatch.chdir(tmp_path)
+    for path in (str(tmp_path), EXTRACTION_DIR, LOADING_DIR):
+        monkeypatch.syspath_prepend(path)
+
+    import batch_stub_server
+    batch_stub_server.requests_seen.clear()
+    server = batch_stub_server.serve(0)
+    port = server.server_address[1]
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{port}/v1")
+    monkeypatch.setenv("ANTHROPIC_BASE_URL", f"http://127.0.0.1:{port}")
+
+    for name in ("config", "multi_model", "transport"):
+        sys.modules.pop(name, None)
+    multi_model = importlib.import_module("multi_model")
+    monkeypatch.setattr(multi_model, "BATCH_POLL_INTERVAL", 0.01)
+
+    yield multi_model, batch_stub_server
+    server.shutdown()
+    sys.modules.pop("multi_model", None)
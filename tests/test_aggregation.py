@@ -0,0 +1,100 @@
+# -----------------------------------------------------------------------------
+## Summary: Checks the Python aggregation stage against the clean_data tables
+## aggregation.R wrote from the sample outputs, and its filtering rules (non-
+## complaints dropped, latest document per case, repaired JSON, errors) on a
+## small folder built in a temporary directory.
+# -----------------------------------------------------------------------------
+
+import os
+import sys
+import json
+
+import pandas as pd
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO, "4_aggregation"))
+import aggregation
+
+
+def test_matches_r_output(tmp_path, monkeypatch):
+    monkeypatch.chdir(REPO)
+    tables, errors = aggregation.aggregate(aggregation.folder_sources(aggregation.EXTRACT_FOLDER))
+    aggregation.write_tables(tables, str(tmp_path))
+    assert errors == 0
+    for name in aggregation.WRITTEN_TABLES:
+        file_name = f"{name}_openai_df.csv"
+        with open(tmp_path / file_name) as ours, open(os.path.join(aggregation.OUTPUT_DIR, file_name)) as theirs:
+            assert ours.read() == theirs.read()
+        if aggregation.PARQUET:
+            assert len(pd.read_parquet(tmp_path / f"{name}_openai_df.parquet")) == len(tables[name])
+
+
+def test_filters_and_joins(tmp_path, monkeypatch):
+    output = {
+        "is_complaint": True,
+        "agencies": [{"agency_name": "Juneau  Police Department", "agency_category": "Police"}],
+        "causes_of_action": [{"cause_cited": "Excessive Force", "cause_number": 1, "defendants_named": []}],
+        "types_of_misconduct": ["Excessive Force", "Battery"],
+        "incident_location": "Street",
+    }
+    folder = tmp_path / "outputs"
+    folder.mkdir()
+    (folder / "a1_gpt_20250101.txt").write_text(json.dumps(output))
+    # Later document of the same case, fenced and cut off
+    (folder / "a2_gpt_20250101.txt").write_text("```json\n" + json.dumps(output)[:-4])
+    (folder / "b1_gpt_20250101.txt").write_text(json.dumps({**output, "is_complaint": "FALSE"}))
+    (folder / "c1_gpt_20250101.txt").write_text("Not a complaint.")
+    docs = tmp_path / "text_documents.csv"
+    docs.write_text(
+        "file_id,document_id,case_id,file_names,order,total_documents\n"
+        "a1,d1,case_a,x,1,2\na2,d2,case_a,y,2,2\nb1,d3,case_b,z,1,1\n"
+    )
+
+    # Parsed in worker processes
+    monkeypatch.setattr(aggregation, "PARALLEL_MIN", 1)
+    tables, errors = aggregation.aggregate(aggregation.folder_sources(str(folder)), str(docs), n_process=2)
+
+    assert errors == 1
+    agencies = tables["agencies"]
+    assert agencies[["code", "agency_name", "case_id", "order"]].values.tolist() == [
+        ["a2", "juneau police department", "case_a", 2]
+    ]
+    assert list(agencies.columns) == [
+        "filename", "agency_name", "agency_category", "code", "case_id", "order", "total_documents"
+    ]
+    assert tables["causes"][["cause_number", "defendants_named"]].values.tolist() == [["1", None]]
+    assert tables["misconduct"]["misconduct_type"].tolist() == ["excessive force", "battery"]
+    assert tables["locations"]["location"].tolist() == ["stre"]
+
+
+def test_incremental_matches_full(tmp_path):
+    folder = tmp_path / "outputs"
+    folder.mkdir()
+    cache = str(tmp_path / "cache")
+    docs = tmp_path / "text_documents.csv"
+    docs.write_text(
+        "file_id,document_id,case_id,file_names,order,total_documents\n"
+        "a1,d1,case_a,x,1,1\nb1,d2,case_b,y,1,1\n"
+    )
+
+    def output(name):
+        return json.dumps({"is_complaint": "true", "agencies": [{"agency_name": name}]})
+
+    (folder / "a1_gpt_20250101.txt").write_text(output("Old Agency"))
+    (folder / "b1_gpt_20250101.txt").write_text(output("Kept Agency"))
+    tables, errors, n_parsed = aggregation.aggregate_folder(str(folder), str(docs), cache, n_process=1)
+    assert (errors, n_parsed) == (0, 2)
+
+    # Nothing changed: nothing parsed
+    assert aggregation.aggregate_folder(str(folder), str(docs), cache, n_process=1)[2] == 0
+
+    # A newer output of a1 supersedes the old one, and b1 is rewritten unparseable
+    (folder / "a1_gpt_20250301.txt").write_text(output("New Agency"))
+    (folder / "b1_gpt_20250101.txt").write_text("No output.")
+    tables, errors, n_parsed = aggregation.aggregate_folder(str(folder), str(docs), cache, n_process=1)
+    assert (errors, n_parsed) == (1, 2)
+    assert tables["agencies"]["agency_name"].tolist() == ["new agency"]
+
+    full, _ = aggregation.aggregate(aggregation.folder_sources(str(folder)), str(docs), n_process=1)
+    for name in aggregation.WRITTEN_TABLES:
+        pd.testing.assert_frame_equal(tables[name], full[name])
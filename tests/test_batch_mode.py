@@ -0,0 +1,42 @@
+# -----------------------------------------------------------------------------
+## Summary: Runs multi_model.py's --batch path end to end against the local
+## batch stub server and checks that one output file per complaint lands in
+## each provider's extracted_text folder and in the run's consolidated JSONL.
+# -----------------------------------------------------------------------------
+
+import os
+import asyncio
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("anthropic")
+pytest.importorskip("google.generativeai")
+
+from conftest import FILE_IDS
+
+
+@pytest.mark.parametrize("llm_type", ["openai", "claude"])
+def test_batch_mode_writes_outputs(stub_env, llm_type):
+    multi_model, _ = stub_env
+    config = multi_model.MODELS[llm_type]
+
+    summary = asyncio.run(multi_model.process_with_batch(llm_type, config))
+
+    assert summary["mode"] == "batch"
+    assert summary["success_count"] == len(FILE_IDS)
+
+    output_dir = os.path.join(multi_model.BASE_OUTPUT_DIR, f"{llm_type}_extracted_text")
+    model = config["model_name"].replace("/", "-")
+    expected = {f"{file_id}_{model}_{multi_model.timestamp}.txt" for file_id in FILE_IDS}
+    assert expected <= set(os.listdir(output_dir))
+
+    # Every output is also in the run's consolidated JSONL, and no temp files remain
+    from output_sink import read_outputs
+    records = list(read_outputs(os.path.join(output_dir, f"outputs_{multi_model.timestamp}.jsonl")))
+    assert sorted(r["file_id"] for r in records) == FILE_IDS
+    assert all(r["status"] == "complete" for r in records)
+    assert not [name for name in os.listdir(output_dir) if name.endswith(".tmp")]
+
+    batch_files = os.listdir(os.path.join(output_dir, "batches"))
+    assert any(name.startswith("requests_") and name.endswith(".jsonl") for name in batch_files)
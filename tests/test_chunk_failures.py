@@ -0,0 +1,68 @@
+# -----------------------------------------------------------------------------
+## Summary: Checks how a chunked complaint fails: a merge missing chunks is
+## saved as "partial", kept out of the finished set and dead-lettered, and a
+## chunk that fails for good cancels the chunks still running.
+# -----------------------------------------------------------------------------
+
+import time
+import asyncio
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("anthropic")
+pytest.importorskip("google.generativeai")
+
+from conftest import LONG_COMPLAINT
+
+
+class ClientError(Exception):
+
+    # Not retried (see retry.RETRY_POLICIES["client"])
+    status_code = 400
+
+
+def test_merge_missing_chunks_is_retried(stub_env, monkeypatch):
+    multi_model, _ = stub_env
+    client = multi_model.get_client("openai", multi_model.MODELS["openai"]["model_name"])
+    doc = multi_model.prepare_document("1004", LONG_COMPLAINT)
+    assert len(doc["messages"]) > 1
+
+    async def generate(prompt):
+        content = '{"is_complaint": "TRUE", "agencies": []}' if prompt == doc["messages"][0] else "I cannot help."
+        return {"content": content, "tokens": 10}
+    monkeypatch.setattr(client, "generate", generate)
+
+    result = asyncio.run(multi_model.process_single_row(doc, client))
+
+    assert result["status"] == "error"
+    assert result["error_class"] == "partial"
+    assert "1004" in client.dead_letters.pending()
+    assert "1004" not in multi_model.completion_index.completed("openai")
+
+
+def test_failed_chunk_cancels_the_others(stub_env, monkeypatch):
+    multi_model, _ = stub_env
+    client = multi_model.get_client("openai", multi_model.MODELS["openai"]["model_name"])
+    messages = ["first", "second", "third"]
+    cancelled = []
+
+    async def generate(prompt):
+        if prompt == "first":
+            raise ClientError("bad request")
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            cancelled.append(prompt)
+            raise
+    monkeypatch.setattr(client, "generate", generate)
+
+    # Checked before asyncio.run's shutdown would cancel leftover tasks itself
+    async def run():
+        with pytest.raises(Exception, match="bad request"):
+            await multi_model.extract_chunks(client, messages)
+        return sorted(cancelled)
+
+    start = time.perf_counter()
+    assert asyncio.run(run()) == ["second", "third"]
+    assert time.perf_counter() - start < 5
@@ -0,0 +1,71 @@
+# -----------------------------------------------------------------------------
+## Summary: Checks that clustering the unique strings and mapping labels back
+## through the codes gives the labels HDBSCAN gives on every row, and that the
+## model only sees each distinct string once.
+# -----------------------------------------------------------------------------
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+hdbscan = pytest.importorskip("hdbscan")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "6_analysis"))
+from clustering import cluster_texts, expand_counts
+
+# Three well-separated groups of nearby points, plus an outlier
+POINTS = {
+    "juneau": [0.0, 0.0], "juneau city": [0.05, 0.0], "city of juneau": [0.0, 0.05],
+    "anchorage": [5.0, 5.0], "anchorage pd": [5.05, 5.0],
+    "fresno": [-5.0, 5.0], "fresno county": [-5.0, 5.05], "fresno sheriff": [-5.05, 5.0],
+    "alaska": [20.0, -20.0],
+}
+
+
+class PointEmbedder:
+
+    def __init__(self):
+        self.seen = []
+
+    def encode(self, texts, show_progress_bar=False):
+        self.seen.extend(texts)
+        return np.array([POINTS[t] for t in texts])
+
+
+def test_expand_counts():
+    assert expand_counts(np.array([1, 5, 2]), 3).tolist() == [0, 1, 1, 1, 2, 2]
+
+
+# Same partition of the rows, whatever the label numbers
+def assert_same_partition(labels, expected):
+    pairs = set(zip(labels.tolist(), expected.tolist()))
+    assert len(pairs) == len(set(labels.tolist())) == len(set(expected.tolist()))
+
+
+def test_matches_row_level_labels():
+    rng = np.random.default_rng(0)
+    texts = list(rng.choice(list(POINTS), size=300))
+    params = dict(min_cluster_size=2, min_samples=1, cluster_selection_epsilon=0.15)
+
+    embedder = PointEmbedder()
+    labels = cluster_texts(texts, embedder, **params)
+    assert sorted(embedder.seen) == sorted(set(texts))
+
+    expected = hdbscan.HDBSCAN(**params).fit(np.array([POINTS[t] for t in texts])).labels_
+    assert_same_partition(labels, expected)
+
+
+# min_samples above min_cluster_size: the copies kept must still cover the
+# min_samples + 1 points hdbscan's core distance is taken over
+def test_matches_row_level_labels_with_min_samples(monkeypatch):
+    rng = np.random.default_rng(3)
+    points = {text: np.array(point) + rng.normal(0, 0.3, 2) for text, point in POINTS.items()}
+    monkeypatch.setattr(sys.modules[__name__], "POINTS", points)
+    texts = list(rng.choice(list(points), size=200))
+    params = dict(min_cluster_size=2, min_samples=3)
+
+    labels = cluster_texts(texts, PointEmbedder(), **params)
+    expected = hdbscan.HDBSCAN(**params).fit(np.array([points[t] for t in texts])).labels_
+    assert_same_partition(labels, expected)
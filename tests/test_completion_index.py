@@ -0,0 +1,40 @@
+# -----------------------------------------------------------------------------
+## Summary: Checks that the completion index picks up existing outputs once,
+## counts repairable outputs as finished and unrepairable ones as not, and
+## answers missing-file queries.
+# -----------------------------------------------------------------------------
+
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("pandas")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "3_extraction"))
+from completion_index import CompletionIndex
+
+
+def test_bootstrap_record_and_missing(tmp_path):
+    output_dir = tmp_path / "claude_extracted_text"
+    output_dir.mkdir()
+    (output_dir / "1001_claude-x_20250101.txt").write_text('{"is_complaint": "TRUE"}')
+    (output_dir / "1002_claude-x_20250101.txt").write_text("I could not find a complaint.")
+    (output_dir / "1005_claude-x_20250101.txt").write_text('```json\n{"is_complaint": "TRUE", "officers": [{"officer_na')
+    (output_dir / "summary_20250101.json").write_text("{}")
+
+    index = CompletionIndex(str(tmp_path / "completions.sqlite"))
+    index.bootstrap("claude", str(output_dir))
+    assert index.completed("claude", "claude-x") == {"1001", "1005"}
+    assert ("claude", "claude-x", "repaired", 1) in index.counts()
+
+    # Files added after the first scan only count once recorded
+    (output_dir / "1003_claude-x_20250101.txt").write_text("{}")
+    index.bootstrap("claude", str(output_dir))
+    assert not index.is_complete("1003", "claude", "claude-x")
+
+    index.record("1002", "claude", "claude-x", "abc", "complete", str(output_dir / "1002_claude-x_20250102.txt"))
+    assert index.is_complete("1002", "claude", "claude-x")
+    assert index.missing(["1001", "1002", "1003", "1004"], "claude") == ["1003", "1004"]
+    assert index.completed("claude", "another-model") == set()
+    index.close()
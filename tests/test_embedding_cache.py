@@ -0,0 +1,69 @@
+# -----------------------------------------------------------------------------
+## Summary: Checks the analysis embedding store: only unseen strings reach the
+## model, rows come back in input order, and the cache survives a reload and a
+## run killed between writing rows and saving the string list.
+# -----------------------------------------------------------------------------
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "6_analysis"))
+from embedding_cache import EmbeddingCache
+
+
+# Deterministic stand-in for a SentenceTransformer, recording what it encodes
+class CountingModel:
+
+    def __init__(self):
+        self.seen = []
+
+    def encode(self, texts, normalize_embeddings=False, show_progress_bar=False):
+        self.seen.extend(texts)
+        return np.array([[len(t), ord(t[0]) if t else 0, 1.0] for t in texts])
+
+
+def test_encodes_unique_strings_once(tmp_path):
+    model = CountingModel()
+    cache = EmbeddingCache("org/model", cache_dir=str(tmp_path), model=model)
+    emb = cache.encode(["juneau", "pd", "juneau", ""])
+    assert model.seen == ["juneau", "pd", ""]
+    assert emb.dtype == np.float32
+    assert emb[:, 0].tolist() == [6, 2, 6, 0]
+
+    # A new run only encodes the new string
+    model = CountingModel()
+    cache = EmbeddingCache("org/model", cache_dir=str(tmp_path), model=model)
+    emb = cache.encode(["pd", "anchorage", "juneau"])
+    assert model.seen == ["anchorage"]
+    assert emb[:, 0].tolist() == [2, 9, 6]
+
+    # Normalized vectors are a separate store
+    other = EmbeddingCache("org/model", normalize_embeddings=True, cache_dir=str(tmp_path), model=CountingModel())
+    assert len(other) == 0
+
+
+def test_drops_rows_without_strings(tmp_path):
+    cache = EmbeddingCache("m", cache_dir=str(tmp_path), dtype=np.float16, model=CountingModel())
+    cache.encode(["a", "bb"])
+    # Rows written by a run that died before saving its strings
+    with open(cache.matrix_path, "ab") as f:
+        f.write(np.ones((3, 3), dtype=np.float16).tobytes())
+
+    model = CountingModel()
+    cache = EmbeddingCache("m", cache_dir=str(tmp_path), dtype=np.float16, model=model)
+    assert cache.encode(["bb", "c"])[:, 0].tolist() == [2, 1]
+    assert model.seen == ["c"]
+    assert cache.matrix().shape == (3, 3)
+
+
+def test_drops_rows_before_first_string_list(tmp_path):
+    cache = EmbeddingCache("m", cache_dir=str(tmp_path), model=CountingModel())
+    # A first fill that wrote rows but died before any string list was saved
+    with open(cache.matrix_path, "ab") as f:
+        f.write(np.ones((2, 3), dtype=np.float32).tobytes())
+
+    cache = EmbeddingCache("m", cache_dir=str(tmp_path), model=CountingModel())
+    assert os.path.getsize(cache.matrix_path) == 0
+    assert cache.encode(["cc", "ddd"])[:, 0].tolist() == [2, 3]
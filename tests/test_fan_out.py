@@ -0,0 +1,63 @@
+# -----------------------------------------------------------------------------
+## Summary: Runs multi_model.py's interactive path for two models against the
+## local stub server and checks that the input is read once and every
+## complaint still ends up extracted by both models, over one shared pool of
+## connections to the stub's host.
+# -----------------------------------------------------------------------------
+
+import os
+import asyncio
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("anthropic")
+pytest.importorskip("google.generativeai")
+
+from conftest import FILE_IDS, LONG_COMPLAINT
+
+
+def test_rows_are_read_once_for_all_models(stub_env, monkeypatch):
+    multi_model, stub = stub_env
+
+    # Two models behind the stub's chat completions endpoint
+    models = {
+        "openai": dict(multi_model.MODELS["openai"], enabled=True),
+        "openai_mini": dict(multi_model.MODELS["openai"], enabled=True, model_name="gpt-4.1-mini"),
+    }
+    monkeypatch.setitem(multi_model.MODELS, "openai_mini", models["openai_mini"])
+
+    # One request at a time per model, so connections are free to be reused
+    monkeypatch.setattr(multi_model, "BATCH_SIZE", 1)
+    monkeypatch.setattr(multi_model, "MAX_CONCURRENCY", 1)
+
+    reads = []
+    iter_texts = multi_model.iter_texts
+    monkeypatch.setattr(multi_model, "iter_texts", lambda *a, **k: reads.append(a) or iter_texts(*a, **k))
+
+    summaries = asyncio.run(multi_model.process_models(models))
+
+    assert len(reads) == 1
+    for llm_type, config in models.items():
+        assert summaries[llm_type]["success_count"] == len(FILE_IDS)
+        output_dir = os.path.join(multi_model.BASE_OUTPUT_DIR, "openai_extracted_text")
+        model = config["model_name"].replace("/", "-")
+        expected = {f"{file_id}_{model}_{multi_model.timestamp}.txt" for file_id in FILE_IDS}
+        assert expected <= set(os.listdir(output_dir))
+
+    # Per-request metrics are streamed to a file instead of kept in the summary
+    summary = summaries["openai"]
+    assert "results" not in summary
+    assert 0 < summary["latency_p50"] <= summary["latency_p99"]
+    with open(summary["metrics_path"], encoding="utf-8") as f:
+        assert len(f.readlines()) == summary["files_read"] == len(FILE_IDS)
+
+    # Both models send through one pool for the stub's host, reusing its connections
+    transport = summaries["openai"]["transport"]
+    assert transport == summaries["openai_mini"]["transport"]
+    assert transport["requests"] == stub.requests_seen.count("/v1/chat/completions")
+    assert transport["connections_opened"] <= len(models)
+
+    # Each model gets one request per complaint, and 1004 in chunks
+    n_chunks = len(multi_model.split_complaint(LONG_COMPLAINT))
+    assert stub.requests_seen.count("/v1/chat/completions") == 2 * (len(FILE_IDS) - 1 + n_chunks)
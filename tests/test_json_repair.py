@@ -0,0 +1,32 @@
+# -----------------------------------------------------------------------------
+## Summary: Checks the local JSON repair pass on the kinds of broken output
+## the models return: fences, surrounding prose, trailing commas, truncation.
+# -----------------------------------------------------------------------------
+
+import os
+import sys
+import json
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "3_extraction"))
+from json_repair import repair_json, repair_output
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": 1}', {"a": 1}),
+    ('```json\n{"a": [1, 2,],}\n```', {"a": [1, 2]}),
+    ('Here is the extraction: {"a": 1} Let me know.', {"a": 1}),
+    ('{"a": [{"n": "x"}, {"n": "y', {"a": [{"n": "x"}, {"n": "y"}]}),
+    ('{"a": 1, "b":', {"a": 1, "b": None}),
+    ('{"a": 1, "b"', {"a": 1}),
+])
+def test_repairs(text, expected):
+    assert json.loads(repair_json(text)) == expected
+
+
+def test_unrepairable_and_status():
+    assert repair_json("No complaint found.") is None
+    assert repair_output('{"a": 1}') == ('{"a": 1}', "complete")
+    assert repair_output('{"a": 1,}')[1] == "repaired"
+    assert repair_output("[1, 2]")[1] == "invalid_json"
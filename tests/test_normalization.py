@@ -0,0 +1,40 @@
+# -----------------------------------------------------------------------------
+## Summary: Checks the compiled name normalizers against the pattern-by-pattern
+## versions the analysis scripts used, on the edge cases of the single-pass
+## alternation and on a sample of synthetic names.
+# -----------------------------------------------------------------------------
+
+import os
+import sys
+import random
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "6_analysis"))
+import bench_normalization as bench
+from normalization import normalize_agency, normalize_agency_column, normalize_name_column
+
+EDGE_CASES = [
+    "The County of Fresno", "the county of", "Police Dept of Juneau", "State Attorney's Office",
+    "State Patrol", "Sheriffs Department of Kern", "city of county of state", "   ", "",
+    None, np.nan, 12, "PD/SO", "Kern  County\tSheriff", "Oakland_PD",
+]
+
+
+def test_edge_cases():
+    for value in EDGE_CASES:
+        assert normalize_agency(value) == bench.normalize_agency_original(value), value
+    values = pd.Series(EDGE_CASES, dtype=object)
+    assert normalize_agency_column(values).tolist() == [bench.normalize_agency_original(v) for v in EDGE_CASES]
+    assert normalize_name_column(values).tolist() == [bench.normalize_name_original(v) for v in EDGE_CASES]
+
+
+def test_matches_original_on_sample(monkeypatch):
+    monkeypatch.setattr(bench, "N_DISTINCT", 2000)
+    rng = random.Random(1)
+    values = pd.Series(rng.choices(bench.distinct_values(rng), k=20000), index=range(5, 20005), dtype=object)
+    agencies = normalize_agency_column(values)
+    assert agencies.index.equals(values.index)
+    assert agencies.tolist() == values.apply(bench.normalize_agency_original).tolist()
+    assert normalize_name_column(values).tolist() == values.apply(bench.normalize_name_original).tolist()